@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from django.db import models
-from .models import ChartOfAccounts, Voucher, VoucherLineEntry
+from .models import ChartOfAccounts, Voucher, VoucherLineEntry, AccountDailyBalance
 
 
 @admin.register(ChartOfAccounts)
@@ -93,8 +93,8 @@ class VoucherAdmin(admin.ModelAdmin):
     
     def get_queryset(self, request):
         return super().get_queryset(request).select_related(
-            'company', 'financial_year', 'created_by'
-        ).prefetch_related('line_entries')
+            'company', 'financial_year__company', 'created_by'
+        )
     
     def save_model(self, request, obj, form, change):
         if not change:  # Creating new object
@@ -138,3 +138,15 @@ class VoucherLineEntryAdmin(admin.ModelAdmin):
     
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('voucher', 'account')
+
+
+@admin.register(AccountDailyBalance)
+class AccountDailyBalanceAdmin(admin.ModelAdmin):
+    list_display = ['date', 'account', 'debit_total', 'credit_total', 'company', 'financial_year']
+    list_filter = ['company', 'financial_year', 'account__account_type']
+    search_fields = ['account__code', 'account__name']
+    readonly_fields = ['company', 'financial_year', 'account', 'date', 'debit_total', 'credit_total']
+    date_hierarchy = 'date'
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('company', 'financial_year', 'account')
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from common.models import Company
+from accounting.models import AccountDailyBalance
+
+
+class Command(BaseCommand):
+    help = 'Verify the account daily balance table against voucher line entries'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, help='Only check balances for this company id')
+        parser.add_argument('--fix', action='store_true', help='Rebuild the table when discrepancies are found')
+    
+    def handle(self, *args, **options):
+        company = None
+        if options['company']:
+            try:
+                company = Company.objects.get(id=options['company'])
+            except Company.DoesNotExist:
+                raise CommandError(f"Company {options['company']} not found")
+        
+        discrepancies = AccountDailyBalance.find_discrepancies(company=company)
+        if not discrepancies:
+            self.stdout.write(self.style.SUCCESS('Account daily balances are consistent'))
+            return
+        
+        for key, expected, stored in discrepancies:
+            company_id, financial_year_id, account_id, date = key
+            self.stdout.write(
+                f'company={company_id} financial_year={financial_year_id} account={account_id} date={date}: '
+                f'expected Dr {expected[0]:.2f} Cr {expected[1]:.2f}, stored Dr {stored[0]:.2f} Cr {stored[1]:.2f}'
+            )
+        
+        if options['fix']:
+            count = AccountDailyBalance.rebuild(company=company)
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} daily balance rows'))
+        else:
+            raise CommandError(f'{len(discrepancies)} daily balance discrepancies found')
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from common.models import Company
+from accounting.models import AccountDailyBalance
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the account daily balance table from voucher line entries'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, help='Only rebuild balances for this company id')
+    
+    def handle(self, *args, **options):
+        company = None
+        if options['company']:
+            try:
+                company = Company.objects.get(id=options['company'])
+            except Company.DoesNotExist:
+                raise CommandError(f"Company {options['company']} not found")
+        
+        count = AccountDailyBalance.rebuild(company=company)
+        scope = f"company '{company.name}'" if company else 'all companies'
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} daily balance rows for {scope}'))
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:12
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def populate_daily_balances(apps, schema_editor):
+    VoucherLineEntry = apps.get_model('accounting', 'VoucherLineEntry')
+    AccountDailyBalance = apps.get_model('accounting', 'AccountDailyBalance')
+    
+    totals = VoucherLineEntry.objects.values(
+        'voucher__company_id', 'voucher__financial_year_id', 'account_id', 'voucher__voucher_date'
+    ).annotate(
+        debit=Sum('debit_amount', default=Decimal('0')),
+        credit=Sum('credit_amount', default=Decimal('0'))
+    ).order_by()
+    
+    AccountDailyBalance.objects.bulk_create([
+        AccountDailyBalance(
+            company_id=row['voucher__company_id'],
+            financial_year_id=row['voucher__financial_year_id'],
+            account_id=row['account_id'],
+            date=row['voucher__voucher_date'],
+            debit_total=row['debit'],
+            credit_total=row['credit']
+        )
+        for row in totals.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0005_remove_voucher_approved_by_and_more'),
+        ('common', '0004_alter_company_created_by_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountDailyBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('debit_total', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=17)),
+                ('credit_total', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=17)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_balances', to='accounting.chartofaccounts')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='account_daily_balances', to='common.company')),
+                ('financial_year', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='account_daily_balances', to='common.financialyear')),
+            ],
+            options={
+                'verbose_name': 'Account Daily Balance',
+                'verbose_name_plural': 'Account Daily Balances',
+                'db_table': 'account_daily_balances',
+                'ordering': ['date'],
+                'constraints': [models.UniqueConstraint(fields=('company', 'financial_year', 'account', 'date'), name='unique_account_daily_balance')],
+            },
+        ),
+        migrations.RunPython(populate_daily_balances, migrations.RunPython.noop),
+    ]
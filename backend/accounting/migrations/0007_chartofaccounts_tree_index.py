@@ -0,0 +1,46 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_tree_index(apps, schema_editor):
+    ChartOfAccounts = apps.get_model('accounting', 'ChartOfAccounts')
+    
+    accounts = list(ChartOfAccounts.objects.only('id', 'code'))
+    for account in accounts:
+        segments = account.code.split('-')
+        account.depth = len(segments) - 1
+        account.path = '.'.join(segment.zfill(5) if segment.isdigit() else segment for segment in segments)
+    ChartOfAccounts.objects.bulk_update(accounts, ['depth', 'path'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0006_accountdailybalance'),
+        ('common', '0004_alter_company_created_by_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='chartofaccounts',
+            options={'ordering': ['path'], 'verbose_name': 'Chart of Account', 'verbose_name_plural': 'Chart of Accounts'},
+        ),
+        migrations.AddField(
+            model_name='chartofaccounts',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Hierarchy level, 0 for root accounts'),
+        ),
+        migrations.AddField(
+            model_name='chartofaccounts',
+            name='path',
+            field=models.CharField(default='', help_text='Materialized path with zero-padded code segments, sorts naturally', max_length=255),
+        ),
+        migrations.RunPython(populate_tree_index, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='chartofaccounts',
+            index=models.Index(fields=['company', 'path'], name='chart_of_ac_company_3d0a62_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:25
+
+from django.db import migrations
+
+
+def seed_document_counters(apps, schema_editor):
+    """Start each counter at the highest number already issued"""
+    Voucher = apps.get_model('accounting', 'Voucher')
+    DocumentCounter = apps.get_model('common', 'DocumentCounter')
+    
+    last_numbers = {}
+    rows = Voucher.objects.values_list('company_id', 'financial_year_id', 'voucher_type', 'voucher_number')
+    for company_id, financial_year_id, document_kind, number in rows.iterator():
+        try:
+            # Expected format: XX-2024-0001
+            sequence = int(number.split('-')[-1])
+        except (ValueError, AttributeError):
+            continue
+        key = (company_id, financial_year_id, f"voucher:{document_kind}")
+        last_numbers[key] = max(last_numbers.get(key, 0), sequence)
+    
+    DocumentCounter.objects.bulk_create([
+        DocumentCounter(
+            company_id=company_id,
+            financial_year_id=financial_year_id,
+            document_type=document_type,
+            last_number=last_number
+        )
+        for (company_id, financial_year_id, document_type), last_number in last_numbers.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0007_chartofaccounts_tree_index'),
+        ('common', '0005_document_counter'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_document_counters, migrations.RunPython.noop),
+    ]
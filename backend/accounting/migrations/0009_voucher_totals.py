@@ -0,0 +1,46 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:23
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_voucher_totals(apps, schema_editor):
+    Voucher = apps.get_model('accounting', 'Voucher')
+    VoucherLineEntry = apps.get_model('accounting', 'VoucherLineEntry')
+    
+    def line_total(field):
+        total = VoucherLineEntry.objects.filter(voucher=OuterRef('pk')).order_by().values(
+            'voucher'
+        ).annotate(total=Sum(field)).values('total')
+        return Coalesce(
+            Subquery(total), Value(Decimal('0')),
+            output_field=models.DecimalField(max_digits=17, decimal_places=2)
+        )
+    
+    Voucher.objects.update(
+        total_debit=line_total('debit_amount'),
+        total_credit=line_total('credit_amount')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0008_seed_voucher_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voucher',
+            name='total_credit',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=17),
+        ),
+        migrations.AddField(
+            model_name='voucher',
+            name='total_debit',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=17),
+        ),
+        migrations.RunPython(populate_voucher_totals, migrations.RunPython.noop),
+    ]
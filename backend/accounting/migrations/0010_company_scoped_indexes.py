@@ -0,0 +1,20 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0009_voucher_totals'),
+        ('common', '0005_document_counter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='voucher',
+            index=models.Index(fields=['company', 'financial_year', 'voucher_date', 'voucher_number'], name='vouchers_company_9daebf_idx'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+BATCH_SIZE = 2000
+
+
+def copy_voucher_header(apps, schema_editor):
+    """Copy each voucher's company, year and date onto its lines, one pk range at a time"""
+    Voucher = apps.get_model('accounting', 'Voucher')
+    VoucherLineEntry = apps.get_model('accounting', 'VoucherLineEntry')
+    
+    voucher = Voucher.objects.filter(pk=OuterRef('voucher_id'))
+    pks = VoucherLineEntry.objects.filter(voucher_date__isnull=True).order_by('pk').values_list('pk', flat=True)
+    start = pks.first()
+    while start is not None:
+        end = start + BATCH_SIZE
+        VoucherLineEntry.objects.filter(pk__gte=start, pk__lt=end).update(
+            company_id=Subquery(voucher.values('company_id')[:1]),
+            financial_year_id=Subquery(voucher.values('financial_year_id')[:1]),
+            voucher_date=Subquery(voucher.values('voucher_date')[:1])
+        )
+        start = pks.filter(pk__gte=end).first()
+
+
+class Migration(migrations.Migration):
+    # Each batch commits on its own, so a large table is not locked for the whole backfill
+    atomic = False
+
+    dependencies = [
+        ('accounting', '0010_company_scoped_indexes'),
+        ('common', '0005_document_counter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voucherlineentry',
+            name='company',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='voucher_line_entries', to='common.company'),
+        ),
+        migrations.AddField(
+            model_name='voucherlineentry',
+            name='financial_year',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='voucher_line_entries', to='common.financialyear'),
+        ),
+        migrations.AddField(
+            model_name='voucherlineentry',
+            name='voucher_date',
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.RunPython(copy_voucher_header, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='voucherlineentry',
+            index=models.Index(fields=['company', 'financial_year', 'account', 'voucher_date', 'debit_amount', 'credit_amount'], name='voucher_lin_company_21b328_idx'),
+        ),
+    ]
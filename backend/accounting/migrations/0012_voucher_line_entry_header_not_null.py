@@ -0,0 +1,47 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_missing_voucher_header(apps, schema_editor):
+    """Fill lines the batched 0011 backfill left empty, e.g. when it was interrupted"""
+    Voucher = apps.get_model('accounting', 'Voucher')
+    VoucherLineEntry = apps.get_model('accounting', 'VoucherLineEntry')
+    
+    voucher = Voucher.objects.filter(pk=OuterRef('voucher_id'))
+    VoucherLineEntry.objects.filter(
+        models.Q(company__isnull=True) | models.Q(financial_year__isnull=True) | models.Q(voucher_date__isnull=True)
+    ).update(
+        company_id=Subquery(voucher.values('company_id')[:1]),
+        financial_year_id=Subquery(voucher.values('financial_year_id')[:1]),
+        voucher_date=Subquery(voucher.values('voucher_date')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0011_voucher_line_entry_header'),
+        ('common', '0005_document_counter'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_missing_voucher_header, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='voucherlineentry',
+            name='company',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='voucher_line_entries', to='common.company'),
+        ),
+        migrations.AlterField(
+            model_name='voucherlineentry',
+            name='financial_year',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='voucher_line_entries', to='common.financialyear'),
+        ),
+        migrations.AlterField(
+            model_name='voucherlineentry',
+            name='voucher_date',
+            field=models.DateField(editable=False),
+        ),
+    ]
@@ -1,9 +1,26 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 from django.db.models import Sum
+from contextlib import contextmanager
+from contextvars import ContextVar
 from decimal import Decimal
-from common.models import Company, User, FinancialYear
+from common.models import Company, CompanyQuerySet, User, FinancialYear, DocumentCounter
+from common.report_cache import ReportCache
+
+
+# Set while VoucherLineEntry bulk writes do their own posting bookkeeping
+_bulk_posting = ContextVar('bulk_posting', default=False)
+
+
+@contextmanager
+def _bulk_posting_scope():
+    token = _bulk_posting.set(True)
+    try:
+        yield
+    finally:
+        _bulk_posting.reset(token)
 
 
 class ChartOfAccounts(models.Model):
@@ -23,16 +40,25 @@ class ChartOfAccounts(models.Model):
     is_active = models.BooleanField(default=True)
     description = models.TextField(blank=True, null=True)
     
+    # Tree index (maintained from code on save)
+    depth = models.PositiveSmallIntegerField(default=0, help_text='Hierarchy level, 0 for root accounts')
+    path = models.CharField(max_length=255, default='', help_text='Materialized path with zero-padded code segments, sorts naturally')
+    
     # System fields
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    PATH_SEGMENT_WIDTH = 5
+    PATH_SEPARATOR = '.'
+    
+    objects = CompanyQuerySet.as_manager()
+    
     class Meta:
         db_table = 'chart_of_accounts'
         verbose_name = 'Chart of Account'
         verbose_name_plural = 'Chart of Accounts'
-        ordering = ['code']
+        ordering = ['path']
         unique_together = ['company', 'code']
         constraints = [
             models.UniqueConstraint(
@@ -40,6 +66,9 @@ class ChartOfAccounts(models.Model):
                 name='unique_account_name_per_company'
             )
         ]
+        indexes = [
+            models.Index(fields=['company', 'path']),
+        ]
     
     def __str__(self):
         return f"{self.code} - {self.name}"
@@ -83,29 +112,30 @@ class ChartOfAccounts(models.Model):
     def save(self, *args, **kwargs):
         # Check if this is an update and parent has changed
         parent_changed = False
-        old_parent = None
+        old_path = None
         
         if self.pk:
-            # Get the current instance from database
-            try:
-                old_instance = ChartOfAccounts.objects.get(pk=self.pk)
-                old_parent = old_instance.parent
-                parent_changed = old_instance.parent != self.parent
-            except ChartOfAccounts.DoesNotExist:
-                pass
+            old_instance = ChartOfAccounts.objects.filter(pk=self.pk).values('parent_id', 'path').first()
+            if old_instance:
+                parent_changed = old_instance['parent_id'] != self.parent_id
+                old_path = old_instance['path']
         
         # Auto-generate code if not provided or parent changed
         if not self.code or parent_changed:
             self.code = self._generate_account_code()
         
-        self.clean()
-        super().save(*args, **kwargs)
+        self.depth, self.path = self.tree_position(self.code)
         
-        # If parent changed, recalculate codes for all descendants
-        # This handles both: 1) When this account moves to a new parent
-        #                   2) When this account has children and its own code changed
-        if parent_changed or (self.pk and self.sub_accounts.exists()):
-            self._recalculate_descendant_codes()
+        self.clean()
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            
+            # Only a move changes the codes below this account
+            if parent_changed:
+                moved = self._recalculate_descendant_codes(old_path)
+                # Descendants are updated without signals
+                ChartOfAccounts.invalidate_reports(self.company_id, [account.pk for account in moved])
+        self.__dict__.pop('_full_path', None)
     
     def _generate_account_code(self):
         """Generate unique account code based on hierarchy"""
@@ -158,47 +188,117 @@ class ChartOfAccounts(models.Model):
             
             return f"{parent_code}-{next_number}"
     
-    def _recalculate_descendant_codes(self):
-        """Recalculate account codes for all descendants when hierarchy changes"""
-        # Get all direct children
-        children = self.sub_accounts.all().order_by('id')  # Order by ID to maintain consistency
+    def _recalculate_descendant_codes(self, old_path):
+        """
+        Re-prefix the codes of the whole subtree after this account moved.
+        Each descendant keeps its own number, so "1-3-2" under "1-3" moved to
+        "2-5" becomes "2-5-2". Codes are computed in one pass and written with
+        a single bulk update. Returns the updated descendants.
+        """
+        # Path order puts every parent before its children
+        descendants = list(ChartOfAccounts.objects.filter(
+            self.subtree_q(old_path),
+            company_id=self.company_id
+        ).order_by('path'))
         
-        for child in children:
-            # Generate new code for each child
-            old_code = child.code
-            new_code = child._generate_account_code()
-            
-            if old_code != new_code:
-                # Update the child's code without triggering save recursion
-                ChartOfAccounts.objects.filter(pk=child.pk).update(code=new_code)
-                
-                # Refresh the child instance and recalculate its descendants
-                child.refresh_from_db()
-                child._recalculate_descendant_codes()
+        new_codes = {self.pk: self.code}
+        for account in descendants:
+            number = account.code.rsplit('-', 1)[-1]
+            account.code = f"{new_codes[account.parent_id]}-{number}"
+            account.depth, account.path = self.tree_position(account.code)
+            new_codes[account.pk] = account.code
+        
+        ChartOfAccounts.objects.bulk_update(descendants, ['code', 'depth', 'path'], batch_size=500)
+        return descendants
+    
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self.__dict__.pop('_full_path', None)
+    
+    @classmethod
+    def tree_position(cls, code):
+        """
+        Return (depth, path) for an account code.
+        "1-10" becomes "00001.00010" so it sorts after "1-9" ("00001.00009").
+        """
+        segments = code.split('-')
+        path = cls.PATH_SEPARATOR.join(
+            segment.zfill(cls.PATH_SEGMENT_WIDTH) if segment.isdigit() else segment
+            for segment in segments
+        )
+        return len(segments) - 1, path
     
     @property
     def level(self):
         """Return the hierarchy level (0 for root, 1 for first level sub, etc.)"""
-        return len(self.code.split('-')) - 1
+        return self.depth
     
     @property
     def full_path(self):
         """Return full path from root to this account"""
-        if not self.parent:
-            return self.name
-        return f"{self.parent.full_path} > {self.name}"
+        if not hasattr(self, '_full_path'):
+            if not self.parent_id:
+                self._full_path = self.name
+            else:
+                names = list(self.get_ancestors().values_list('name', flat=True))
+                self._full_path = ' > '.join(names + [self.name])
+        return self._full_path
+    
+    @classmethod
+    def preload_full_paths(cls, accounts):
+        """Set full_path on a list of accounts with a single ancestors query"""
+        accounts = list(accounts)
+        ancestor_paths = set()
+        for account in accounts:
+            ancestor_paths.update(account.ancestor_paths())
+        
+        names = {}
+        if ancestor_paths:
+            for company_id, path, name in cls.objects.filter(
+                company_id__in={account.company_id for account in accounts},
+                path__in=ancestor_paths
+            ).values_list('company_id', 'path', 'name'):
+                names[(company_id, path)] = name
+        
+        for account in accounts:
+            account._full_path = ' > '.join(
+                [names[(account.company_id, path)] for path in account.ancestor_paths()
+                 if (account.company_id, path) in names] + [account.name]
+            )
+        return accounts
+    
+    def ancestor_paths(self):
+        """Paths of all ancestors, root first"""
+        segments = self.path.split(self.PATH_SEPARATOR)
+        return [self.PATH_SEPARATOR.join(segments[:i]) for i in range(1, len(segments))]
+    
+    def get_ancestors(self):
+        """Get all ancestors of this account, root first (single indexed query)"""
+        return ChartOfAccounts.objects.filter(
+            company_id=self.company_id,
+            path__in=self.ancestor_paths()
+        ).order_by('path')
     
     def get_children(self):
         """Get all direct children of this account"""
-        return self.sub_accounts.filter(is_active=True).order_by('code')
+        return self.sub_accounts.filter(is_active=True).order_by('path')
     
-    def get_descendants(self):
+    def get_descendants(self, include_self=False):
         """Get all descendants (children, grandchildren, etc.) of this account"""
-        descendants = []
-        for child in self.get_children():
-            descendants.append(child)
-            descendants.extend(child.get_descendants())
-        return descendants
+        return ChartOfAccounts.objects.filter(
+            self.subtree_q(self.path, include_self=include_self),
+            company_id=self.company_id,
+            is_active=True
+        ).order_by('path')
+    
+    @classmethod
+    def subtree_q(cls, path, include_self=False):
+        """Filter for all accounts below a path, as an indexed range on path"""
+        # '/' is the character right after the '.' separator
+        subtree = models.Q(path__gt=path + cls.PATH_SEPARATOR, path__lt=path + '/')
+        if include_self:
+            subtree |= models.Q(path=path)
+        return subtree
     
     def can_be_deleted(self):
         """Check if account can be deleted (considering cascade deletion)"""
@@ -223,20 +323,71 @@ class ChartOfAccounts(models.Model):
         if account_type:
             filters['account_type'] = account_type
         
-        # Get root accounts first
-        root_accounts = cls.objects.filter(parent__isnull=True, **filters).order_by('code')
+        # Load the whole (filtered) chart once and link children in memory
+        children_map = {}
+        for account in cls.objects.filter(**filters).order_by('path'):
+            children_map.setdefault(account.parent_id, []).append(account)
         
         def build_tree(accounts):
             tree = []
             for account in accounts:
                 node = {
                     'account': account,
-                    'children': build_tree(account.get_children().filter(**filters))
+                    'children': build_tree(children_map.get(account.id, []))
                 }
                 tree.append(node)
             return tree
         
-        return build_tree(root_accounts)
+        return build_tree(children_map.get(None, []))
+    
+    @classmethod
+    def report_tags(cls, company_id, account_ids=None):
+        """Report cache tags for the company's whole chart, or for single accounts"""
+        if account_ids is None:
+            return [ReportCache.tag('chart', company_id)]
+        return [ReportCache.tag('account', account_id) for account_id in account_ids]
+    
+    @classmethod
+    def invalidate_reports(cls, company_id, account_ids):
+        """Make cached reports showing the company's chart or these accounts stale"""
+        ReportCache.invalidate(*cls.report_tags(company_id), *cls.report_tags(company_id, account_ids))
+    
+    @classmethod
+    def get_hierarchy_data(cls, company, account_type=None):
+        """Serialized account tree, built from one flat query by linking nodes through an id map"""
+        if account_type and account_type not in dict(cls.ACCOUNT_TYPES):
+            return []
+        
+        filters = {'company': company, 'is_active': True}
+        if account_type:
+            filters['account_type'] = account_type
+        
+        type_display = dict(cls.ACCOUNT_TYPES)
+        rows = list(cls.objects.filter(**filters).order_by('path').values(
+            'id', 'code', 'name', 'account_type', 'is_group_account', 'is_active', 'parent_id'
+        ))
+        
+        nodes = {}
+        for row in rows:
+            nodes[row['id']] = {
+                'id': row['id'],
+                'code': row['code'],
+                'name': row['name'],
+                'account_type': row['account_type'],
+                'account_type_display': type_display.get(row['account_type'], row['account_type']),
+                'is_group_account': row['is_group_account'],
+                'is_active': row['is_active'],
+                'children': []
+            }
+        
+        roots = []
+        for row in rows:
+            if row['parent_id'] is None:
+                roots.append(nodes[row['id']])
+            elif row['parent_id'] in nodes:
+                # Accounts under a filtered-out parent are left out, as before
+                nodes[row['parent_id']]['children'].append(nodes[row['id']])
+        return roots
 
 
 class Voucher(models.Model):
@@ -256,17 +407,26 @@ class Voucher(models.Model):
     narration = models.TextField(help_text='Description of the transaction')
     reference = models.CharField(max_length=255, blank=True, null=True, help_text='External reference number')
     
+    # Totals (maintained from line entries)
+    total_debit = models.DecimalField(max_digits=17, decimal_places=2, default=Decimal('0'))
+    total_credit = models.DecimalField(max_digits=17, decimal_places=2, default=Decimal('0'))
+    
     # System fields
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='created_vouchers')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = CompanyQuerySet.as_manager()
+    
     class Meta:
         db_table = 'vouchers'
         verbose_name = 'Voucher'
         verbose_name_plural = 'Vouchers'
         ordering = ['-voucher_date', '-voucher_number']
         unique_together = ['company', 'financial_year', 'voucher_type', 'voucher_number']
+        indexes = [
+            models.Index(fields=['company', 'financial_year', 'voucher_date', 'voucher_number']),
+        ]
         constraints = []
     
     def __str__(self):
@@ -275,7 +435,7 @@ class Voucher(models.Model):
     def clean(self):
         """Validate voucher data"""
         if self.financial_year and self.company:
-            if self.financial_year.company != self.company:
+            if self.financial_year.company_id != self.company_id:
                 raise ValidationError('Financial year must belong to the same company')
         
         if self.voucher_date and self.financial_year:
@@ -283,37 +443,23 @@ class Voucher(models.Model):
                 raise ValidationError('Voucher date must be within the financial year period')
     
     def save(self, *args, **kwargs):
-        # Auto-generate voucher number if not provided
-        if not self.voucher_number:
-            self.voucher_number = self._generate_voucher_number()
-        
-        self.clean()
-        super().save(*args, **kwargs)
+        # Number allocation and insert commit or roll back together
+        with transaction.atomic():
+            # Auto-generate voucher number if not provided
+            if not self.voucher_number:
+                self.voucher_number = self._generate_voucher_number()
+            
+            self.clean()
+            super().save(*args, **kwargs)
     
     def _generate_voucher_number(self):
         """Generate unique voucher number per company, year, and type"""
-        # Get the latest voucher number for this combination
-        latest_voucher = Voucher.objects.filter(
-            company=self.company,
-            financial_year=self.financial_year,
-            voucher_type=self.voucher_type
-        ).order_by('-voucher_number').first()
-        
-        if latest_voucher:
-            try:
-                # Extract the numeric part from the voucher number
-                # Expected format: CV-2024-0001, BV-2024-0001, JV-2024-0001
-                parts = latest_voucher.voucher_number.split('-')
-                if len(parts) >= 3:
-                    last_number = int(parts[-1])
-                    next_number = last_number + 1
-                else:
-                    next_number = 1
-            except (ValueError, IndexError):
-                next_number = 1
-        else:
-            next_number = 1
-        
+        next_number = DocumentCounter.next_number(
+            self.company_id, self.financial_year_id, f"voucher:{self.voucher_type}"
+        )
+        return self._format_voucher_number(next_number)
+    
+    def _format_voucher_number(self, next_number):
         # Generate prefix based on voucher type
         prefix_map = {
             'cash': 'CV',
@@ -328,19 +474,57 @@ class Voucher(models.Model):
         # Format: CV-2024-0001
         return f"{prefix}-{year}-{next_number:04d}"
     
-    @property
-    def total_debit(self):
-        """Calculate total debit amount"""
-        return self.line_entries.aggregate(
-            total=Sum('debit_amount', default=Decimal('0'))
-        )['total'] or Decimal('0')
+    @classmethod
+    def bulk_post(cls, postings):
+        """
+        Insert new vouchers with their line entries in bulk.
+        postings is a list of (voucher, line_entries) with unsaved, validated
+        objects. Numbers are allocated in blocks and totals and daily balances
+        are written in bulk, so the query count does not grow with the batch.
+        """
+        with transaction.atomic():
+            by_series = {}
+            for voucher, entries in postings:
+                series = (voucher.company_id, voucher.financial_year_id, voucher.voucher_type)
+                by_series.setdefault(series, []).append(voucher)
+                voucher.total_debit = sum((entry.debit_amount for entry in entries), Decimal('0'))
+                voucher.total_credit = sum((entry.credit_amount for entry in entries), Decimal('0'))
+            
+            for (company_id, financial_year_id, voucher_type), vouchers in by_series.items():
+                first_number = DocumentCounter.next_number(
+                    company_id, financial_year_id, f"voucher:{voucher_type}", count=len(vouchers)
+                )
+                for offset, voucher in enumerate(vouchers):
+                    voucher.voucher_number = voucher._format_voucher_number(first_number + offset)
+            
+            cls.objects.bulk_create([voucher for voucher, _ in postings], batch_size=500)
+            
+            all_entries = []
+            deltas = {}
+            for voucher, entries in postings:
+                for line_number, entry in enumerate(entries, start=1):
+                    entry.voucher = voucher
+                    entry.line_number = line_number
+                    entry.copy_voucher_header(voucher)
+                    all_entries.append(entry)
+                    AccountDailyBalance.add_delta(
+                        deltas, voucher.company_id, voucher.financial_year_id,
+                        entry.account_id, voucher.voucher_date,
+                        entry.debit_amount, entry.credit_amount
+                    )
+            VoucherLineEntry.objects.bulk_create(all_entries, batch_size=500)
+            AccountDailyBalance.apply_deltas(deltas)
+            VoucherLineEntry.invalidate_reports(key[:3] for key in deltas)
+        return [voucher for voucher, _ in postings]
     
-    @property
-    def total_credit(self):
-        """Calculate total credit amount"""
-        return self.line_entries.aggregate(
-            total=Sum('credit_amount', default=Decimal('0'))
-        )['total'] or Decimal('0')
+    @classmethod
+    def add_to_totals(cls, voucher_id, debit, credit):
+        """Shift the stored totals of a voucher by a line entry delta"""
+        if debit or credit:
+            cls.objects.filter(pk=voucher_id).update(
+                total_debit=models.F('total_debit') + debit,
+                total_credit=models.F('total_credit') + credit
+            )
     
     @property
     def is_balanced(self):
@@ -369,6 +553,11 @@ class VoucherLineEntry(models.Model):
     description = models.TextField(blank=True, null=True, help_text='Description for this line entry')
     line_number = models.PositiveIntegerField(help_text='Line sequence number')
     
+    # Copies of the voucher header, so ledger queries need no join to vouchers
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, editable=False, related_name='voucher_line_entries')
+    financial_year = models.ForeignKey(FinancialYear, on_delete=models.CASCADE, editable=False, related_name='voucher_line_entries')
+    voucher_date = models.DateField(editable=False)
+    
     # System fields
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -379,6 +568,10 @@ class VoucherLineEntry(models.Model):
         verbose_name_plural = 'Voucher Line Entries'
         ordering = ['line_number']
         unique_together = ['voucher', 'line_number']
+        indexes = [
+            # Amounts are trailing key columns so balance queries read the index only
+            models.Index(fields=['company', 'financial_year', 'account', 'voucher_date', 'debit_amount', 'credit_amount']),
+        ]
         constraints = [
             models.CheckConstraint(
                 check=~(models.Q(debit_amount__gt=0) & models.Q(credit_amount__gt=0)),
@@ -398,8 +591,8 @@ class VoucherLineEntry(models.Model):
     def clean(self):
         """Validate line entry"""
         # Check that account belongs to same company as voucher
-        if self.account and self.voucher:
-            if self.account.company != self.voucher.company:
+        if self.account_id and self.voucher_id:
+            if self.account.company_id != self.voucher.company_id:
                 raise ValidationError('Account must belong to the same company as voucher')
         
         # Check that exactly one of debit or credit is non-zero
@@ -421,9 +614,36 @@ class VoucherLineEntry(models.Model):
             )['max_line']
             self.line_number = (max_line or 0) + 1
         
+        self.copy_voucher_header(self.voucher)
         self.clean()
         super().save(*args, **kwargs)
     
+    def copy_voucher_header(self, voucher):
+        """Set the company, financial year and date copied from the voucher"""
+        self.company_id = voucher.company_id
+        self.financial_year_id = voucher.financial_year_id
+        self.voucher_date = voucher.voucher_date
+    
+    @staticmethod
+    def report_tags(company_id, financial_year_id, account_ids=None):
+        """Report cache tags for all postings of a financial year, or for single accounts in it"""
+        if account_ids is None:
+            return [ReportCache.tag('ledger', company_id, financial_year_id)]
+        return [ReportCache.tag('ledger', company_id, financial_year_id, account_id) for account_id in account_ids]
+    
+    @classmethod
+    def invalidate_reports(cls, postings):
+        """Make cached reports over (company_id, financial_year_id, account_id) postings stale"""
+        accounts = {}
+        for company_id, financial_year_id, account_id in postings:
+            accounts.setdefault((company_id, financial_year_id), set()).add(account_id)
+        
+        tags = []
+        for (company_id, financial_year_id), account_ids in accounts.items():
+            tags += cls.report_tags(company_id, financial_year_id)
+            tags += cls.report_tags(company_id, financial_year_id, sorted(account_ids))
+        ReportCache.invalidate(*tags)
+    
     @property
     def amount(self):
         """Return the non-zero amount"""
@@ -433,3 +653,340 @@ class VoucherLineEntry(models.Model):
     def entry_type(self):
         """Return 'debit' or 'credit'"""
         return 'debit' if self.debit_amount > 0 else 'credit'
+    
+    @classmethod
+    def bulk_add(cls, voucher, entries_data):
+        """
+        Insert line entries for a voucher with one bulk_create.
+        entries_data items carry resolved `account` instances. Line numbers are
+        assigned in memory and daily balances and voucher totals are updated
+        in bulk, as the save signals would do per row.
+        """
+        max_line = cls.objects.filter(voucher=voucher).aggregate(
+            max_line=models.Max('line_number')
+        )['max_line'] or 0
+        
+        entries = []
+        for offset, entry_data in enumerate(entries_data, start=1):
+            # Ids and line numbers are assigned here
+            entry_data = {
+                field: value for field, value in entry_data.items()
+                if field not in ('id', 'line_number')
+            }
+            entry = cls(voucher=voucher, line_number=max_line + offset, **entry_data)
+            entry.copy_voucher_header(voucher)
+            entry.clean()
+            entries.append(entry)
+        
+        with transaction.atomic():
+            cls.objects.bulk_create(entries)
+            cls._post_bulk_changes([
+                (voucher.id, voucher.company_id, voucher.financial_year_id, voucher.voucher_date,
+                 entry.account_id, entry.debit_amount, entry.credit_amount)
+                for entry in entries
+            ], vouchers={voucher.id: voucher})
+        return entries
+    
+    @classmethod
+    def bulk_sync(cls, voucher, entries_data):
+        """
+        Bring a voucher's lines in line with entries_data, touching only the
+        rows that changed. Incoming lines match existing ones by `id`, else by
+        `line_number`; unmatched lines are inserted and unmatched existing
+        lines deleted. Lines end up numbered in incoming order and only the
+        amounts that changed are posted to daily balances and voucher totals.
+        """
+        existing = list(cls.objects.filter(voucher=voucher).select_related('account'))
+        highest_line = max([entry.line_number for entry in existing] + [len(entries_data)])
+        by_id = {entry.id: entry for entry in existing}
+        by_line = {entry.line_number: entry for entry in existing}
+        
+        matched = {}
+        added = []
+        for position, entry_data in enumerate(entries_data, start=1):
+            if entry_data.get('id') is not None:
+                entry = by_id.get(entry_data['id'])
+                if entry is None or entry.id in matched:
+                    raise ValidationError(
+                        f"Line entry {entry_data['id']} does not belong to this voucher or is listed twice"
+                    )
+            else:
+                entry = by_line.get(entry_data.get('line_number'))
+                if entry is not None and entry.id in matched:
+                    entry = None
+            
+            if entry is not None:
+                matched[entry.id] = (position, entry_data)
+            else:
+                entry_data = {
+                    field: value for field, value in entry_data.items()
+                    if field not in ('id', 'line_number')
+                }
+                added.append(cls(voucher=voucher, line_number=position, **entry_data))
+        
+        def posting(entry, sign):
+            return (
+                voucher.id, voucher.company_id, voucher.financial_year_id, voucher.voucher_date,
+                entry.account_id, sign * entry.debit_amount, sign * entry.credit_amount
+            )
+        
+        removed = [entry for entry in existing if entry.id not in matched]
+        changes = [posting(entry, -1) for entry in removed]
+        
+        now = timezone.now()
+        changed = []
+        renumbered = []
+        for entry in existing:
+            if entry.id not in matched:
+                continue
+            position, entry_data = matched[entry.id]
+            entry.voucher = voucher
+            previous = posting(entry, -1)
+            
+            moved = entry.line_number != position
+            if moved:
+                renumbered.append(entry)
+                entry.line_number = position
+            
+            amounts_changed = False
+            if 'account' in entry_data and entry_data['account'].id != entry.account_id:
+                entry.account = entry_data['account']
+                amounts_changed = True
+            for field in ('debit_amount', 'credit_amount'):
+                if field in entry_data and entry_data[field] != getattr(entry, field):
+                    setattr(entry, field, entry_data[field])
+                    amounts_changed = True
+            description_changed = 'description' in entry_data and entry_data['description'] != entry.description
+            if description_changed:
+                entry.description = entry_data['description']
+            
+            if amounts_changed:
+                changes.append(previous)
+                changes.append(posting(entry, 1))
+            if amounts_changed or description_changed or moved:
+                entry.clean()
+                entry.updated_at = now
+                changed.append(entry)
+        
+        for entry in added:
+            entry.copy_voucher_header(voucher)
+            entry.clean()
+            changes.append(posting(entry, 1))
+        
+        with transaction.atomic():
+            if removed:
+                with _bulk_posting_scope():
+                    cls.objects.filter(pk__in=[entry.id for entry in removed]).delete()
+            if renumbered:
+                # Park moved lines above every stored number first, so the new
+                # numbering never clashes with unique (voucher, line_number)
+                for entry in renumbered:
+                    entry.line_number += highest_line
+                cls.objects.bulk_update(renumbered, ['line_number'])
+                for entry in renumbered:
+                    entry.line_number -= highest_line
+            if added:
+                cls.objects.bulk_create(added)
+            if changed:
+                cls.objects.bulk_update(changed, [
+                    'account', 'debit_amount', 'credit_amount', 'description', 'line_number', 'updated_at'
+                ])
+            cls._post_bulk_changes(changes, vouchers={voucher.id: voucher})
+            # Ledgers also show descriptions, which change without any amount
+            cls.invalidate_reports(
+                (voucher.company_id, voucher.financial_year_id, entry.account_id) for entry in changed
+            )
+        return {'added': len(added), 'changed': len(changed), 'removed': len(removed)}
+    
+    @staticmethod
+    def _post_bulk_changes(changes, vouchers=None):
+        """
+        Apply (voucher_id, company_id, financial_year_id, date, account_id, debit, credit)
+        changes to daily balances and voucher totals. Voucher objects passed in
+        `vouchers` are kept in step with their rows.
+        """
+        deltas = {}
+        totals = {}
+        for voucher_id, company_id, financial_year_id, date, account_id, debit, credit in changes:
+            AccountDailyBalance.add_delta(deltas, company_id, financial_year_id, account_id, date, debit, credit)
+            total_debit, total_credit = totals.get(voucher_id, (Decimal('0'), Decimal('0')))
+            totals[voucher_id] = (total_debit + debit, total_credit + credit)
+        
+        AccountDailyBalance.apply_deltas(deltas)
+        VoucherLineEntry.invalidate_reports(key[:3] for key in deltas)
+        for voucher_id, (debit, credit) in totals.items():
+            Voucher.add_to_totals(voucher_id, debit, credit)
+            if vouchers and voucher_id in vouchers:
+                vouchers[voucher_id].total_debit += debit
+                vouchers[voucher_id].total_credit += credit
+    
+    @staticmethod
+    def posting_signals_enabled():
+        """False while a bulk write applies its own balance and totals changes"""
+        return not _bulk_posting.get()
+
+
+class AccountDailyBalance(models.Model):
+    """Pre-summed debit/credit totals per account and voucher date"""
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='account_daily_balances')
+    financial_year = models.ForeignKey(FinancialYear, on_delete=models.CASCADE, related_name='account_daily_balances')
+    account = models.ForeignKey(ChartOfAccounts, on_delete=models.CASCADE, related_name='daily_balances')
+    date = models.DateField()
+    
+    debit_total = models.DecimalField(max_digits=17, decimal_places=2, default=Decimal('0'))
+    credit_total = models.DecimalField(max_digits=17, decimal_places=2, default=Decimal('0'))
+    
+    class Meta:
+        db_table = 'account_daily_balances'
+        verbose_name = 'Account Daily Balance'
+        verbose_name_plural = 'Account Daily Balances'
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['company', 'financial_year', 'account', 'date'],
+                name='unique_account_daily_balance'
+            )
+        ]
+    
+    def __str__(self):
+        return f"{self.account_id} - {self.date} (Dr {self.debit_total} | Cr {self.credit_total})"
+    
+    @staticmethod
+    def add_delta(deltas, company_id, financial_year_id, account_id, date, debit, credit):
+        """Accumulate a debit/credit change into a deltas dict for apply_deltas()"""
+        key = (company_id, financial_year_id, account_id, date)
+        current_debit, current_credit = deltas.get(key, (Decimal('0'), Decimal('0')))
+        deltas[key] = (current_debit + debit, current_credit + credit)
+    
+    @classmethod
+    def apply_deltas(cls, deltas):
+        """
+        Apply {(company_id, financial_year_id, account_id, date): (debit, credit)}
+        changes with a constant number of queries. Must run inside the
+        transaction that wrote the line entries. Existing rows keep their ids.
+        """
+        deltas = {key: value for key, value in deltas.items() if value[0] or value[1]}
+        if not deltas:
+            return
+        
+        with transaction.atomic():
+            existing = {
+                (row.company_id, row.financial_year_id, row.account_id, row.date): row
+                for row in cls.objects.select_for_update().filter(
+                    company_id__in={key[0] for key in deltas},
+                    financial_year_id__in={key[1] for key in deltas},
+                    account_id__in={key[2] for key in deltas},
+                    date__in={key[3] for key in deltas}
+                )
+            }
+            
+            # Locked rows are updated in place; a row whose totals drop to
+            # zero is removed to keep the table compact
+            changed = []
+            emptied = []
+            new = []
+            for key, (debit, credit) in deltas.items():
+                row = existing.get(key)
+                if row:
+                    row.debit_total += debit
+                    row.credit_total += credit
+                    if row.debit_total or row.credit_total:
+                        changed.append(row)
+                    else:
+                        emptied.append(row.pk)
+                else:
+                    company_id, financial_year_id, account_id, date = key
+                    new.append(cls(
+                        company_id=company_id,
+                        financial_year_id=financial_year_id,
+                        account_id=account_id,
+                        date=date,
+                        debit_total=debit,
+                        credit_total=credit
+                    ))
+            
+            if changed:
+                cls.objects.bulk_update(changed, ['debit_total', 'credit_total'], batch_size=500)
+            if emptied:
+                cls.objects.filter(pk__in=emptied).delete()
+            if new:
+                try:
+                    with transaction.atomic():
+                        cls.objects.bulk_create(new, batch_size=500)
+                except IntegrityError:
+                    # Another transaction created some of these days since they
+                    # were read. Their totals must be added to, not overwritten,
+                    # so the rows go through the locked update above again.
+                    cls.apply_deltas({
+                        (row.company_id, row.financial_year_id, row.account_id, row.date):
+                            (row.debit_total, row.credit_total)
+                        for row in new
+                    })
+    
+    @classmethod
+    def entry_totals(cls, company=None):
+        """Daily totals computed straight from voucher line entries"""
+        entries = VoucherLineEntry.objects.all()
+        if company:
+            entries = entries.filter(company=company)
+        
+        return entries.values(
+            'company_id', 'financial_year_id', 'account_id', 'voucher_date'
+        ).annotate(
+            debit=Sum('debit_amount', default=Decimal('0')),
+            credit=Sum('credit_amount', default=Decimal('0'))
+        ).order_by()
+    
+    @classmethod
+    def rebuild(cls, company=None):
+        """Recreate the table from voucher line entries. Returns rows written."""
+        rows = [
+            cls(
+                company_id=row['company_id'],
+                financial_year_id=row['financial_year_id'],
+                account_id=row['account_id'],
+                date=row['voucher_date'],
+                debit_total=row['debit'],
+                credit_total=row['credit']
+            )
+            for row in cls.entry_totals(company).iterator()
+        ]
+        
+        with transaction.atomic():
+            existing = cls.objects.all()
+            if company:
+                existing = existing.filter(company=company)
+            existing.delete()
+            cls.objects.bulk_create(rows, batch_size=1000)
+        
+        return len(rows)
+    
+    @classmethod
+    def find_discrepancies(cls, company=None):
+        """
+        Compare stored rows against line entries.
+        Returns a list of (key, expected (debit, credit), stored (debit, credit)).
+        """
+        zero = (Decimal('0'), Decimal('0'))
+        expected = {
+            (row['company_id'], row['financial_year_id'],
+             row['account_id'], row['voucher_date']): (row['debit'], row['credit'])
+            for row in cls.entry_totals(company).iterator()
+        }
+        
+        stored_rows = cls.objects.all()
+        if company:
+            stored_rows = stored_rows.filter(company=company)
+        stored = {
+            (row['company_id'], row['financial_year_id'], row['account_id'], row['date']):
+                (row['debit_total'], row['credit_total'])
+            for row in stored_rows.values(
+                'company_id', 'financial_year_id', 'account_id', 'date', 'debit_total', 'credit_total'
+            ).iterator()
+        }
+        
+        discrepancies = []
+        for key in sorted(expected.keys() | stored.keys(), key=str):
+            if expected.get(key, zero) != stored.get(key, zero):
+                discrepancies.append((key, expected.get(key, zero), stored.get(key, zero)))
+        return discrepancies
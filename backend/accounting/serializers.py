@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from django.db import models, transaction
 from decimal import Decimal
 from .models import ChartOfAccounts, Voucher, VoucherLineEntry
 from common.models import UserActivity
@@ -27,11 +28,9 @@ class ChartOfAccountsSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'code', 'created_by', 'created_at', 'updated_at']
     
     def validate(self, attrs):
-        user = self.context['request'].user
-        
         # Get user's current activity
         try:
-            user_activity = UserActivity.objects.get(user=user)
+            user_activity = self.context['request'].tenant.get_activity()
             if not user_activity.current_company:
                 raise serializers.ValidationError(
                     'No company activated. Please activate a company first.'
@@ -57,31 +56,59 @@ class ChartOfAccountsSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class ChartOfAccountsHierarchySerializer(serializers.ModelSerializer):
+class PreloadedAccountField(serializers.PrimaryKeyRelatedField):
     """
-    Serializer for displaying chart of accounts in hierarchical structure.
+    Account reference that resolves from accounts preloaded by the list
+    serializer and falls back to a per-value lookup otherwise.
     """
-    children = serializers.SerializerMethodField()
-    account_type_display = serializers.CharField(source='get_account_type_display', read_only=True)
+    def preload(self, account_ids):
+        self._preloaded = self.get_queryset().in_bulk(account_ids)
     
-    class Meta:
-        model = ChartOfAccounts
-        fields = [
-            'id', 'code', 'name', 'account_type', 'account_type_display',
-            'is_group_account', 'is_active', 'children'
-        ]
+    def to_internal_value(self, data):
+        # Callers validating many vouchers can share one map through the context
+        preloaded = self.context.get('accounts', getattr(self, '_preloaded', None))
+        if preloaded is not None and not isinstance(data, bool):
+            try:
+                return preloaded[int(data)]
+            except (KeyError, TypeError, ValueError):
+                pass
+        return super().to_internal_value(data)
+
+
+class VoucherLineEntryListSerializer(serializers.ListSerializer):
+    """
+    Line entry list that loads all referenced accounts with one query on input
+    and reads lines together with their accounts on output.
+    """
+    def to_internal_value(self, data):
+        if isinstance(data, list) and 'accounts' not in self.context:
+            account_ids = set()
+            for item in data:
+                if isinstance(item, dict):
+                    try:
+                        account_ids.add(int(item.get('account')))
+                    except (TypeError, ValueError):
+                        continue
+            self.child.fields['account'].preload(account_ids)
+        return super().to_internal_value(data)
     
-    def get_children(self, obj):
-        if obj.is_group_account:
-            children = obj.get_children()
-            return ChartOfAccountsHierarchySerializer(children, many=True).data
-        return []
+    def to_representation(self, data):
+        if isinstance(data, models.Manager):
+            data = data.all()
+            # Prefetched lines already carry their accounts
+            if data._result_cache is None:
+                data = data.select_related('account')
+        return super().to_representation(data)
 
 
 class VoucherLineEntrySerializer(serializers.ModelSerializer):
     """
     Serializer for VoucherLineEntry model.
     """
+    account = PreloadedAccountField(queryset=ChartOfAccounts.objects.all())
+    # Writable so updates can match incoming lines to existing ones
+    id = serializers.IntegerField(required=False)
+    line_number = serializers.IntegerField(required=False, min_value=1)
     account_code = serializers.CharField(source='account.code', read_only=True)
     account_name = serializers.CharField(source='account.name', read_only=True)
     amount = serializers.ReadOnlyField()
@@ -94,7 +121,8 @@ class VoucherLineEntrySerializer(serializers.ModelSerializer):
             'credit_amount', 'amount', 'entry_type', 'description', 'line_number',
             'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'line_number', 'created_at', 'updated_at']
+        read_only_fields = ['created_at', 'updated_at']
+        list_serializer_class = VoucherLineEntryListSerializer
     
     def validate(self, attrs):
         debit_amount = attrs.get('debit_amount', Decimal('0'))
@@ -140,11 +168,9 @@ class VoucherSerializer(serializers.ModelSerializer):
         ]
     
     def validate(self, attrs):
-        user = self.context['request'].user
-        
         # Get user's current activity
         try:
-            user_activity = UserActivity.objects.get(user=user)
+            user_activity = self.context.get('user_activity') or self.context['request'].tenant.get_activity()
             if not user_activity.current_company:
                 raise serializers.ValidationError(
                     'No company activated. Please activate a company first.'
@@ -205,11 +231,20 @@ class VoucherSerializer(serializers.ModelSerializer):
                 'line_entries': f'Voucher is not balanced. Total debit: {total_debit}, Total credit: {total_credit}'
             })
         
+        # Line ids on update must point at this voucher's lines, once each
+        line_ids = [entry['id'] for entry in line_entries_data if entry.get('id') is not None]
+        if line_ids and self.instance is not None:
+            existing_ids = set(self.instance.line_entries.values_list('id', flat=True))
+            if len(set(line_ids)) != len(line_ids) or not existing_ids.issuperset(line_ids):
+                raise serializers.ValidationError({
+                    'line_entries': 'Line entry ids must be unique and belong to this voucher.'
+                })
+        
         # Validate all accounts belong to same company
         company = attrs.get('company')
         for entry_data in line_entries_data:
             account = entry_data.get('account')
-            if account and account.company != company:
+            if account and account.company_id != company.id:
                 raise serializers.ValidationError({
                     'line_entries': f'Account {account.code} - {account.name} does not belong to the voucher company.'
                 })
@@ -222,6 +257,7 @@ class VoucherSerializer(serializers.ModelSerializer):
         
         return attrs
     
+    @transaction.atomic
     def create(self, validated_data):
         line_entries_data = validated_data.pop('line_entries')
         validated_data['created_by'] = self.context['request'].user
@@ -229,11 +265,11 @@ class VoucherSerializer(serializers.ModelSerializer):
         voucher = Voucher.objects.create(**validated_data)
         
         # Create line entries
-        for line_entry_data in line_entries_data:
-            VoucherLineEntry.objects.create(voucher=voucher, **line_entry_data)
+        VoucherLineEntry.bulk_add(voucher, line_entries_data)
         
         return voucher
     
+    @transaction.atomic
     def update(self, instance, validated_data):
         # Check if voucher can be edited
         can_edit, message = instance.can_be_edited()
@@ -247,18 +283,22 @@ class VoucherSerializer(serializers.ModelSerializer):
             setattr(instance, attr, value)
         instance.save()
         
-        # Update line entries if provided
+        # Update line entries if provided, writing only the lines that changed
         if line_entries_data is not None:
-            # Delete existing line entries
-            instance.line_entries.all().delete()
-            
-            # Create new line entries
-            for line_entry_data in line_entries_data:
-                VoucherLineEntry.objects.create(voucher=instance, **line_entry_data)
+            VoucherLineEntry.bulk_sync(instance, line_entries_data)
         
         return instance
 
 
+class VoucherIngestSerializer(VoucherSerializer):
+    """
+    Voucher input for bulk ingest. Company and financial year always come
+    from the user activity, so no per-record lookups are needed for them.
+    """
+    class Meta(VoucherSerializer.Meta):
+        read_only_fields = VoucherSerializer.Meta.read_only_fields + ['company', 'financial_year']
+
+
 class VoucherListSerializer(serializers.ModelSerializer):
     """
     Simplified serializer for voucher list view.
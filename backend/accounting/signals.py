@@ -0,0 +1,171 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .models import ChartOfAccounts, Voucher, VoucherLineEntry, AccountDailyBalance
+
+
+@receiver(pre_save, sender=VoucherLineEntry)
+def remember_line_entry_state(sender, instance, raw=False, **kwargs):
+    """Keep the stored amounts so post_save handlers can apply only the difference"""
+    instance._daily_balance_previous = None
+    if raw or not instance.pk:
+        return
+
+    instance._daily_balance_previous = VoucherLineEntry.objects.filter(pk=instance.pk).values(
+        'voucher_id', 'account_id', 'debit_amount', 'credit_amount',
+        'company_id', 'financial_year_id', 'voucher_date'
+    ).first()
+
+
+@receiver(post_save, sender=VoucherLineEntry)
+def update_daily_balance_on_line_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+
+    deltas = {}
+    previous = getattr(instance, '_daily_balance_previous', None)
+    if previous:
+        AccountDailyBalance.add_delta(
+            deltas,
+            previous['company_id'], previous['financial_year_id'],
+            previous['account_id'], previous['voucher_date'],
+            -previous['debit_amount'], -previous['credit_amount']
+        )
+
+    AccountDailyBalance.add_delta(
+        deltas,
+        instance.company_id, instance.financial_year_id,
+        instance.account_id, instance.voucher_date,
+        instance.debit_amount, instance.credit_amount
+    )
+    AccountDailyBalance.apply_deltas(deltas)
+
+
+@receiver(post_delete, sender=VoucherLineEntry)
+def update_daily_balance_on_line_delete(sender, instance, **kwargs):
+    if not VoucherLineEntry.posting_signals_enabled():
+        return
+
+    deltas = {}
+    AccountDailyBalance.add_delta(
+        deltas,
+        instance.company_id, instance.financial_year_id,
+        instance.account_id, instance.voucher_date,
+        -instance.debit_amount, -instance.credit_amount
+    )
+    AccountDailyBalance.apply_deltas(deltas)
+
+
+@receiver(post_save, sender=VoucherLineEntry)
+def update_voucher_totals_on_line_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+
+    debit, credit = instance.debit_amount, instance.credit_amount
+    previous = getattr(instance, '_daily_balance_previous', None)
+    if previous:
+        if previous['voucher_id'] == instance.voucher_id:
+            debit -= previous['debit_amount']
+            credit -= previous['credit_amount']
+        else:
+            Voucher.add_to_totals(previous['voucher_id'], -previous['debit_amount'], -previous['credit_amount'])
+    Voucher.add_to_totals(instance.voucher_id, debit, credit)
+
+    # Keep the caller's voucher object in step with the row
+    if VoucherLineEntry.voucher.is_cached(instance):
+        instance.voucher.total_debit += debit
+        instance.voucher.total_credit += credit
+
+
+@receiver(post_delete, sender=VoucherLineEntry)
+def update_voucher_totals_on_line_delete(sender, instance, **kwargs):
+    if not VoucherLineEntry.posting_signals_enabled():
+        return
+
+    Voucher.add_to_totals(instance.voucher_id, -instance.debit_amount, -instance.credit_amount)
+
+
+@receiver(post_save, sender=VoucherLineEntry)
+def invalidate_reports_on_line_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+
+    postings = [(instance.company_id, instance.financial_year_id, instance.account_id)]
+    previous = getattr(instance, '_daily_balance_previous', None)
+    if previous:
+        postings.append((previous['company_id'], previous['financial_year_id'], previous['account_id']))
+    VoucherLineEntry.invalidate_reports(postings)
+
+
+@receiver(post_delete, sender=VoucherLineEntry)
+def invalidate_reports_on_line_delete(sender, instance, **kwargs):
+    if not VoucherLineEntry.posting_signals_enabled():
+        return
+
+    VoucherLineEntry.invalidate_reports([(instance.company_id, instance.financial_year_id, instance.account_id)])
+
+
+@receiver(pre_save, sender=Voucher)
+def remember_voucher_posting_key(sender, instance, raw=False, **kwargs):
+    instance._daily_balance_previous = None
+    if raw or not instance.pk:
+        return
+
+    instance._daily_balance_previous = Voucher.objects.filter(pk=instance.pk).values(
+        'company_id', 'financial_year_id', 'voucher_date'
+    ).first()
+
+
+@receiver(post_save, sender=Voucher)
+def move_daily_balance_on_voucher_change(sender, instance, raw=False, **kwargs):
+    """Move the voucher's amounts and line copies when its date, year or company changes"""
+    previous = getattr(instance, '_daily_balance_previous', None)
+    if raw or not previous:
+        return
+
+    current = {
+        'company_id': instance.company_id,
+        'financial_year_id': instance.financial_year_id,
+        'voucher_date': instance.voucher_date
+    }
+    if previous == current:
+        return
+
+    deltas = {}
+    for entry in instance.line_entries.values('account_id', 'debit_amount', 'credit_amount'):
+        AccountDailyBalance.add_delta(
+            deltas,
+            previous['company_id'], previous['financial_year_id'],
+            entry['account_id'], previous['voucher_date'],
+            -entry['debit_amount'], -entry['credit_amount']
+        )
+        AccountDailyBalance.add_delta(
+            deltas,
+            current['company_id'], current['financial_year_id'],
+            entry['account_id'], current['voucher_date'],
+            entry['debit_amount'], entry['credit_amount']
+        )
+    AccountDailyBalance.apply_deltas(deltas)
+    instance.line_entries.update(**current)
+
+
+@receiver(post_save, sender=Voucher)
+def invalidate_reports_on_voucher_change(sender, instance, created=False, raw=False, **kwargs):
+    """Ledgers show the voucher's number, type and narration on each of its lines"""
+    if raw or created:
+        return
+
+    keys = {(instance.company_id, instance.financial_year_id)}
+    previous = getattr(instance, '_daily_balance_previous', None)
+    if previous:
+        keys.add((previous['company_id'], previous['financial_year_id']))
+    account_ids = set(instance.line_entries.values_list('account_id', flat=True))
+    VoucherLineEntry.invalidate_reports(
+        (company_id, financial_year_id, account_id)
+        for company_id, financial_year_id in keys for account_id in account_ids
+    )
+
+
+@receiver(post_save, sender=ChartOfAccounts)
+@receiver(post_delete, sender=ChartOfAccounts)
+def invalidate_account_reports(sender, instance, **kwargs):
+    ChartOfAccounts.invalidate_reports(instance.company_id, [instance.pk])
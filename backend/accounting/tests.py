@@ -1,3 +1,706 @@
-from django.test import TestCase
+from datetime import date
+from decimal import Decimal
+import importlib
+import json
+import tempfile
+from unittest import mock
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.exceptions import ValidationError
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from common.models import User, Company, FinancialYear, UserActivity
+from common.report_cache import ReportCache, PdfCache
+from .models import ChartOfAccounts, Voucher, VoucherLineEntry, AccountDailyBalance
 
-# Create your tests here.
+
+class AccountingTestMixin:
+    """Company, financial year and a few leaf accounts shared by the tests below"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Test Company', address_line_1='Street 1', city='Lahore', province='punjab')
+        cls.financial_year = FinancialYear.objects.create(
+            company=cls.company, name='FY 2024-25', start_date=date(2024, 7, 1), end_date=date(2025, 6, 30)
+        )
+        root = ChartOfAccounts.objects.create(company=cls.company, name='Assets', account_type='asset', is_group_account=True)
+        cls.cash = ChartOfAccounts.objects.create(company=cls.company, name='Cash', account_type='asset', parent=root)
+        cls.bank = ChartOfAccounts.objects.create(company=cls.company, name='Bank', account_type='asset', parent=root)
+        income = ChartOfAccounts.objects.create(company=cls.company, name='Income', account_type='income', is_group_account=True)
+        cls.sales = ChartOfAccounts.objects.create(company=cls.company, name='Sales', account_type='income', parent=income)
+    
+    def api_client(self):
+        """Client for a user with the company and financial year activated"""
+        user = User.objects.create_user(email='user@example.com', password='secret', first_name='Test', last_name='User')
+        UserActivity.objects.create(user=user, current_company=self.company, current_financial_year=self.financial_year)
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+    
+    def post_voucher(self, voucher_date, lines, voucher_type='cash'):
+        """Save a voucher with (account, debit, credit) lines one by one, as the admin does"""
+        voucher = Voucher.objects.create(
+            company=self.company, financial_year=self.financial_year,
+            voucher_type=voucher_type, voucher_date=voucher_date, narration='Test voucher'
+        )
+        for account, debit, credit in lines:
+            VoucherLineEntry.objects.create(
+                voucher=voucher, account=account, debit_amount=Decimal(debit), credit_amount=Decimal(credit)
+            )
+        return voucher
+
+
+class AccountDailyBalanceTests(AccountingTestMixin, TestCase):
+    
+    def key(self, account, day):
+        return (self.company.id, self.financial_year.id, account.id, day)
+    
+    def test_apply_deltas_updates_rows_in_place(self):
+        day = date(2024, 8, 1)
+        AccountDailyBalance.apply_deltas({self.key(self.cash, day): (Decimal('100.00'), Decimal('0'))})
+        row = AccountDailyBalance.objects.get(account=self.cash)
+        
+        AccountDailyBalance.apply_deltas({
+            self.key(self.cash, day): (Decimal('50.00'), Decimal('20.00')),
+            self.key(self.bank, day): (Decimal('0'), Decimal('30.00')),
+        })
+        updated = AccountDailyBalance.objects.get(account=self.cash)
+        self.assertEqual(updated.pk, row.pk)
+        self.assertEqual((updated.debit_total, updated.credit_total), (Decimal('150.00'), Decimal('20.00')))
+        self.assertEqual(AccountDailyBalance.objects.get(account=self.bank).credit_total, Decimal('30.00'))
+    
+    def test_apply_deltas_removes_rows_that_reach_zero(self):
+        day = date(2024, 8, 1)
+        AccountDailyBalance.apply_deltas({self.key(self.cash, day): (Decimal('75.00'), Decimal('0'))})
+        AccountDailyBalance.apply_deltas({self.key(self.cash, day): (Decimal('-75.00'), Decimal('0'))})
+        self.assertFalse(AccountDailyBalance.objects.exists())
+    
+    def test_apply_deltas_adds_to_rows_inserted_concurrently(self):
+        day = date(2024, 8, 1)
+        concurrent = AccountDailyBalance.objects.create(
+            company=self.company, financial_year=self.financial_year, account=self.cash,
+            date=day, debit_total=Decimal('10.00')
+        )
+        # The first locked read misses the row, as if another transaction
+        # inserted it just after; the insert then conflicts with it
+        real_select_for_update = AccountDailyBalance.objects.select_for_update
+        reads = []
+        
+        def select_for_update():
+            reads.append(True)
+            if len(reads) == 1:
+                return AccountDailyBalance.objects.none()
+            return real_select_for_update()
+        
+        with mock.patch.object(AccountDailyBalance.objects, 'select_for_update', side_effect=select_for_update):
+            AccountDailyBalance.apply_deltas({self.key(self.cash, day): (Decimal('5.00'), Decimal('0'))})
+        
+        row = AccountDailyBalance.objects.get(account=self.cash)
+        self.assertEqual(row.pk, concurrent.pk)
+        self.assertEqual(row.debit_total, Decimal('15.00'))
+
+
+class DailyBalanceSyncTests(AccountingTestMixin, TestCase):
+    """Daily balances follow every kind of change to vouchers and their lines"""
+    
+    def assertBalancesMatchEntries(self):
+        self.assertEqual(AccountDailyBalance.find_discrepancies(), [])
+    
+    def balance(self, account, day):
+        row = AccountDailyBalance.objects.filter(account=account, date=day).first()
+        return (row.debit_total, row.credit_total) if row else None
+    
+    def test_line_create_update_and_delete(self):
+        voucher = self.post_voucher(date(2024, 8, 1), [(self.cash, '100.00', '0'), (self.sales, '0', '100.00')])
+        self.post_voucher(date(2024, 8, 1), [(self.cash, '40.00', '0'), (self.sales, '0', '40.00')])
+        self.assertEqual(self.balance(self.cash, date(2024, 8, 1)), (Decimal('140.00'), Decimal('0')))
+        self.assertBalancesMatchEntries()
+        
+        cash_line = voucher.line_entries.get(account=self.cash)
+        cash_line.debit_amount = Decimal('60.00')
+        cash_line.save()
+        self.assertEqual(self.balance(self.cash, date(2024, 8, 1)), (Decimal('100.00'), Decimal('0')))
+        self.assertBalancesMatchEntries()
+        
+        cash_line.account = self.bank
+        cash_line.save()
+        self.assertEqual(self.balance(self.bank, date(2024, 8, 1)), (Decimal('60.00'), Decimal('0')))
+        self.assertEqual(self.balance(self.cash, date(2024, 8, 1)), (Decimal('40.00'), Decimal('0')))
+        self.assertBalancesMatchEntries()
+        
+        cash_line.delete()
+        self.assertIsNone(self.balance(self.bank, date(2024, 8, 1)))
+        self.assertBalancesMatchEntries()
+        
+        voucher.delete()
+        self.assertEqual(self.balance(self.sales, date(2024, 8, 1)), (Decimal('0'), Decimal('40.00')))
+        self.assertBalancesMatchEntries()
+    
+    def test_voucher_date_change_moves_balances(self):
+        voucher = self.post_voucher(date(2024, 8, 1), [(self.cash, '100.00', '0'), (self.sales, '0', '100.00')])
+        voucher.voucher_date = date(2024, 9, 15)
+        voucher.save()
+        
+        self.assertIsNone(self.balance(self.cash, date(2024, 8, 1)))
+        self.assertEqual(self.balance(self.cash, date(2024, 9, 15)), (Decimal('100.00'), Decimal('0')))
+        self.assertEqual(set(voucher.line_entries.values_list('voucher_date', flat=True)), {date(2024, 9, 15)})
+        self.assertBalancesMatchEntries()
+    
+    def test_voucher_financial_year_change_moves_balances(self):
+        next_year = FinancialYear.objects.create(
+            company=self.company, name='FY 2025-26', start_date=date(2025, 7, 1), end_date=date(2026, 6, 30)
+        )
+        voucher = self.post_voucher(date(2025, 6, 30), [(self.cash, '75.00', '0'), (self.sales, '0', '75.00')])
+        voucher.financial_year = next_year
+        voucher.voucher_date = date(2025, 7, 1)
+        voucher.save()
+        
+        self.assertFalse(AccountDailyBalance.objects.filter(financial_year=self.financial_year).exists())
+        row = AccountDailyBalance.objects.get(financial_year=next_year, account=self.cash)
+        self.assertEqual((row.date, row.debit_total), (date(2025, 7, 1), Decimal('75.00')))
+        self.assertBalancesMatchEntries()
+
+
+class LedgerReportPaginationTests(AccountingTestMixin, TestCase):
+    
+    def setUp(self):
+        self.client = self.api_client()
+        
+        # Several vouchers share a date, so pages must also split within a day
+        for index in range(23):
+            amount = f"{10 + index}.50"
+            lines = [(self.cash, amount, '0'), (self.sales, '0', amount)]
+            if index % 3 == 0:
+                lines = [(self.sales, amount, '0'), (self.cash, '0', amount)]
+            self.post_voucher(date(2024, 8, 1 + index // 4), lines)
+    
+    def ledger(self, **params):
+        response = self.client.get('/api/accounting/ledger-report/', {
+            'account_id': self.cash.id, 'from_date': '2024-08-02', 'to_date': '2024-08-31', **params
+        })
+        self.assertEqual(response.status_code, 200)
+        return response.json()['data']
+    
+    def test_cursor_pages_join_into_the_full_ledger(self):
+        full = self.ledger()
+        
+        pages = [self.ledger(page_size=4)]
+        while pages[-1]['pagination']['has_next']:
+            pages.append(self.ledger(page_size=4, cursor=pages[-1]['pagination']['next_cursor']))
+        
+        self.assertGreater(len(pages), 1)
+        self.assertEqual([row for page in pages for row in page['transactions']], full['transactions'])
+        for previous, page in zip(pages, pages[1:]):
+            self.assertEqual(
+                page['pagination']['page_opening_balance'], previous['transactions'][-1]['running_balance']
+            )
+        self.assertEqual(full['transactions'][-1]['running_balance'], full['closing_balance'])
+
+
+class VoucherLineSyncTests(AccountingTestMixin, TestCase):
+    
+    def setUp(self):
+        self.voucher = self.post_voucher(date(2024, 8, 1), [
+            (self.cash, '100.00', '0'), (self.bank, '50.00', '0'), (self.sales, '0', '150.00')
+        ])
+        self.cash_line, self.bank_line, self.sales_line = self.voucher.line_entries.order_by('line_number')
+    
+    def test_lines_are_renumbered_in_incoming_order(self):
+        result = VoucherLineEntry.bulk_sync(self.voucher, [
+            {'id': self.sales_line.id, 'account': self.sales, 'debit_amount': Decimal('0'), 'credit_amount': Decimal('170.00')},
+            {'account': self.bank, 'debit_amount': Decimal('20.00'), 'credit_amount': Decimal('0')},
+            {'id': self.cash_line.id, 'account': self.cash, 'debit_amount': Decimal('100.00'), 'credit_amount': Decimal('0')},
+            {'id': self.bank_line.id, 'account': self.bank, 'debit_amount': Decimal('50.00'), 'credit_amount': Decimal('0')},
+        ])
+        
+        self.assertEqual(result, {'added': 1, 'changed': 3, 'removed': 0})
+        lines = list(self.voucher.line_entries.order_by('line_number').values_list('id', 'line_number'))
+        self.assertEqual([line_id for line_id, _ in lines][0], self.sales_line.id)
+        self.assertEqual([line_id for line_id, _ in lines][2:], [self.cash_line.id, self.bank_line.id])
+        self.assertEqual([line_number for _, line_number in lines], [1, 2, 3, 4])
+        
+        self.voucher.refresh_from_db()
+        self.assertEqual((self.voucher.total_debit, self.voucher.total_credit), (Decimal('170.00'), Decimal('170.00')))
+        self.assertEqual(AccountDailyBalance.find_discrepancies(), [])
+    
+    def test_removed_lines_are_deleted_and_the_rest_close_up(self):
+        VoucherLineEntry.bulk_sync(self.voucher, [
+            {'id': self.bank_line.id, 'account': self.bank, 'debit_amount': Decimal('50.00'), 'credit_amount': Decimal('0')},
+            {'id': self.sales_line.id, 'account': self.sales, 'debit_amount': Decimal('0'), 'credit_amount': Decimal('50.00')},
+        ])
+        
+        self.assertEqual(
+            list(self.voucher.line_entries.order_by('line_number').values_list('id', 'line_number')),
+            [(self.bank_line.id, 1), (self.sales_line.id, 2)]
+        )
+        self.assertEqual(AccountDailyBalance.find_discrepancies(), [])
+    
+    def test_line_ids_from_another_voucher_are_rejected(self):
+        other = self.post_voucher(date(2024, 8, 2), [(self.cash, '10.00', '0'), (self.sales, '0', '10.00')])
+        foreign_line = other.line_entries.first()
+        
+        with self.assertRaises(ValidationError):
+            VoucherLineEntry.bulk_sync(self.voucher, [
+                {'id': foreign_line.id, 'account': self.cash, 'debit_amount': Decimal('10.00'), 'credit_amount': Decimal('0')},
+                {'id': self.sales_line.id, 'account': self.sales, 'debit_amount': Decimal('0'), 'credit_amount': Decimal('10.00')},
+            ])
+        
+        self.assertEqual(foreign_line.voucher_id, other.id)
+        self.assertEqual(self.voucher.line_entries.count(), 3)
+        self.assertEqual(other.line_entries.get(pk=foreign_line.pk).debit_amount, Decimal('10.00'))
+    
+    def test_a_line_id_listed_twice_is_rejected(self):
+        with self.assertRaises(ValidationError):
+            VoucherLineEntry.bulk_sync(self.voucher, [
+                {'id': self.cash_line.id, 'account': self.cash, 'debit_amount': Decimal('100.00'), 'credit_amount': Decimal('0')},
+                {'id': self.cash_line.id, 'account': self.cash, 'debit_amount': Decimal('50.00'), 'credit_amount': Decimal('0')},
+            ])
+
+
+class VoucherPdfReportTests(AccountingTestMixin, TestCase):
+    
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        self.client = self.api_client()
+        self.voucher = self.post_voucher(date(2024, 8, 1), [
+            (self.cash, '100.00', '0'), (self.bank, '25.50', '0'), (self.sales, '0', '125.50')
+        ])
+        self.report_client = mock.Mock()
+        self.report_client.generate_voucher_pdf.return_value = (True, b'%PDF-voucher', '')
+        patcher = mock.patch('accounting.views.get_report_client', return_value=self.report_client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def download(self):
+        response = self.client.get(f'/api/accounting/vouchers/{self.voucher.id}/pdf/')
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        self.assertEqual(content, b'%PDF-voucher')
+        return response
+    
+    def test_repeat_requests_are_served_from_the_cache(self):
+        first = self.download()
+        second = self.download()
+        
+        self.assertEqual(self.report_client.generate_voucher_pdf.call_count, 1)
+        self.assertEqual(first['ETag'], second['ETag'])
+        voucher_data = self.report_client.generate_voucher_pdf.call_args[0][0]
+        self.assertEqual((voucher_data['totalDebit'], voucher_data['totalCredit']), (125.5, 125.5))
+    
+    def test_cached_file_removed_before_it_is_opened_is_rendered_again(self):
+        self.download()
+        
+        # get() found the file, but another request pruned it before the open
+        with mock.patch.object(PdfCache, 'get', return_value=PdfCache._path('voucher', 'pruned')):
+            self.download()
+        self.assertEqual(self.report_client.generate_voucher_pdf.call_count, 2)
+
+
+class VoucherIngestTests(AccountingTestMixin, TestCase):
+    
+    def setUp(self):
+        self.client = self.api_client()
+    
+    def record(self, amount='10.00', **fields):
+        return {
+            'voucher_type': 'cash', 'voucher_date': '2024-08-01', 'narration': 'Imported',
+            'line_entries': [
+                {'account': self.cash.id, 'debit_amount': amount},
+                {'account': self.sales.id, 'credit_amount': amount},
+            ],
+            **fields
+        }
+    
+    def ingest(self, lines, **extra):
+        body = '\n'.join(json.dumps(line) if isinstance(line, dict) else line for line in lines) + '\n'
+        response = self.client.generic('POST', '/api/accounting/vouchers/ingest/', body, content_type='application/x-ndjson', **extra)
+        if not response.streaming:
+            return response, None
+        results = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        return response, results
+    
+    def test_valid_lines_are_posted(self):
+        response, results = self.ingest([self.record('10.00'), '', self.record('25.00')])
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(r['line'], r['status']) for r in results[:-1]], [(1, 'created'), (3, 'created')])
+        self.assertEqual(results[-1], {'summary': {'received': 2, 'created': 2, 'failed': 0}})
+        vouchers = Voucher.objects.filter(narration='Imported').order_by('id')
+        self.assertEqual([v.total_debit for v in vouchers], [Decimal('10.00'), Decimal('25.00')])
+        self.assertEqual(AccountDailyBalance.find_discrepancies(), [])
+    
+    def test_invalid_json_fails_only_its_line(self):
+        _, results = self.ingest(['{not json', self.record()])
+        
+        self.assertEqual(results[0]['status'], 'error')
+        self.assertIn('Invalid JSON', results[0]['errors'])
+        self.assertEqual(results[1]['status'], 'created')
+        self.assertEqual(results[-1]['summary'], {'received': 2, 'created': 1, 'failed': 1})
+    
+    def test_other_company_or_financial_year_is_rejected(self):
+        other_company = Company.objects.create(name='Other Company', address_line_1='Street 2', city='Karachi', province='sindh')
+        other_year = FinancialYear.objects.create(
+            company=self.company, name='FY 2025-26', start_date=date(2025, 7, 1), end_date=date(2026, 6, 30)
+        )
+        _, results = self.ingest([
+            self.record(company=other_company.id),
+            self.record(financial_year=other_year.id),
+            self.record(company=self.company.id, financial_year=self.financial_year.id),
+        ])
+        
+        self.assertEqual(list(results[0]['errors']), ['company'])
+        self.assertEqual(list(results[1]['errors']), ['financial_year'])
+        self.assertEqual(results[2]['status'], 'created')
+        self.assertEqual(Voucher.objects.filter(narration='Imported').count(), 1)
+    
+    def test_failing_chunk_keeps_earlier_chunks_and_the_summary(self):
+        real_bulk_post = Voucher.bulk_post
+        calls = []
+        
+        def bulk_post(postings):
+            calls.append(len(postings))
+            if len(calls) == 2:
+                raise RuntimeError('disk full')
+            return real_bulk_post(postings)
+        
+        with mock.patch('accounting.views.INGEST_CHUNK_SIZE', 2), \
+                mock.patch.object(Voucher, 'bulk_post', side_effect=bulk_post):
+            _, results = self.ingest([self.record() for _ in range(5)])
+        
+        self.assertEqual([r['status'] for r in results[:-1]], ['created', 'created', 'error', 'error', 'created'])
+        self.assertIn('disk full', results[2]['errors'])
+        self.assertEqual(results[-1]['summary'], {'received': 5, 'created': 3, 'failed': 2})
+        self.assertEqual(Voucher.objects.filter(narration='Imported').count(), 3)
+    
+    def test_unexpected_error_in_a_chunk_still_ends_with_the_summary(self):
+        with mock.patch('accounting.views.INGEST_CHUNK_SIZE', 1), \
+                mock.patch('accounting.views._ingest_chunk', side_effect=[RuntimeError('boom'), [{'line': 2, 'status': 'created'}]]):
+            _, results = self.ingest([self.record(), self.record()])
+        
+        self.assertEqual(results[0], {'line': 1, 'status': 'error', 'errors': 'Chunk could not be processed: boom'})
+        self.assertEqual(results[-1]['summary'], {'received': 2, 'created': 1, 'failed': 1})
+    
+    def test_body_without_content_length_is_rejected(self):
+        response, _ = self.ingest([self.record()], CONTENT_LENGTH='', HTTP_TRANSFER_ENCODING='chunked')
+        
+        self.assertEqual(response.status_code, 411)
+        self.assertFalse(Voucher.objects.filter(narration='Imported').exists())
+
+
+class ReportCacheInvalidationTests(AccountingTestMixin, TestCase):
+    
+    def setUp(self):
+        versions_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(versions_dir.cleanup)
+        caches_override = override_settings(CACHES={
+            **settings.CACHES,
+            'report_versions': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': versions_dir.name,
+            },
+        })
+        caches_override.enable()
+        self.addCleanup(caches_override.disable)
+        caches['reports'].clear()
+        
+        self.client = self.api_client()
+        self.voucher = self.post_voucher(date(2024, 8, 1), [(self.cash, '100.00', '0'), (self.sales, '0', '100.00')])
+        self.reports = {
+            'trial_balance': '/api/accounting/trial-balance/?to_date=2024-12-31',
+            'ledger_report': f'/api/accounting/ledger-report/?account_id={self.cash.id}&to_date=2024-12-31',
+        }
+    
+    def assertCache(self, outcome):
+        for report, url in self.reports.items():
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['X-Report-Cache'], outcome, report)
+    
+    def test_repeat_requests_hit(self):
+        self.assertCache('miss')
+        self.assertCache('hit')
+    
+    def test_voucher_change_misses(self):
+        self.assertCache('miss')
+        self.voucher.voucher_date = date(2024, 8, 2)
+        self.voucher.save()
+        self.assertCache('miss')
+    
+    def test_line_change_misses(self):
+        self.assertCache('miss')
+        for line in self.voucher.line_entries.all():
+            line.debit_amount, line.credit_amount = line.debit_amount * 2, line.credit_amount * 2
+            line.save()
+        self.assertCache('miss')
+    
+    def test_chart_change_misses(self):
+        self.assertCache('miss')
+        self.cash.name = 'Cash in Hand'
+        self.cash.save()
+        self.assertCache('miss')
+    
+    def test_invalidation_from_another_process_misses(self):
+        self.assertCache('miss')
+        # A separate cache instance on the same directory, as another worker process holds
+        other_process = FileBasedCache(settings.CACHES['report_versions']['LOCATION'], {})
+        tags = (
+            VoucherLineEntry.report_tags(self.company.id, self.financial_year.id) +
+            VoucherLineEntry.report_tags(self.company.id, self.financial_year.id, [self.cash.id])
+        )
+        other_process.set_many({ReportCache._version_key(tag): 'bumped elsewhere' for tag in tags}, None)
+        self.assertCache('miss')
+
+
+class ChartTreeIndexTests(AccountingTestMixin, TestCase):
+    
+    def test_tree_position_pads_segments_so_paths_sort_naturally(self):
+        self.assertEqual(ChartOfAccounts.tree_position('1'), (0, '00001'))
+        self.assertEqual(ChartOfAccounts.tree_position('1-10-2'), (2, '00001.00010.00002'))
+        self.assertLess(ChartOfAccounts.tree_position('1-9')[1], ChartOfAccounts.tree_position('1-10')[1])
+    
+    def test_subtree_q_matches_descendants_only(self):
+        root = self.cash.parent
+        subgroup = ChartOfAccounts.objects.create(
+            company=self.company, name='Deposits', account_type='asset', parent=root, is_group_account=True
+        )
+        deposit = ChartOfAccounts.objects.create(company=self.company, name='Deposit', account_type='asset', parent=subgroup)
+        # "1-1" is a prefix of "1-10" in code form, but not in path form
+        for number in range(4, 11):
+            ChartOfAccounts.objects.create(company=self.company, name=f'Asset {number}', account_type='asset', parent=root)
+        tenth = ChartOfAccounts.objects.get(company=self.company, code='1-10')
+        
+        below_cash = ChartOfAccounts.objects.filter(ChartOfAccounts.subtree_q(self.cash.path))
+        self.assertFalse(below_cash.exists())
+        below_subgroup = ChartOfAccounts.objects.filter(ChartOfAccounts.subtree_q(subgroup.path, include_self=True))
+        self.assertEqual(set(below_subgroup), {subgroup, deposit})
+        below_root = set(ChartOfAccounts.objects.filter(ChartOfAccounts.subtree_q(root.path)))
+        self.assertIn(tenth, below_root)
+        self.assertNotIn(root, below_root)
+        self.assertNotIn(self.sales, below_root)
+    
+    def test_migration_backfills_depth_and_path(self):
+        grandchild = ChartOfAccounts.objects.create(
+            company=self.company, name='Petty Cash', account_type='asset',
+            parent=ChartOfAccounts.objects.create(
+                company=self.company, name='Cash Group', account_type='asset',
+                parent=self.cash.parent, is_group_account=True
+            )
+        )
+        expected = {account.pk: (account.depth, account.path) for account in ChartOfAccounts.objects.all()}
+        self.assertEqual(expected[grandchild.pk], ChartOfAccounts.tree_position(grandchild.code))
+        ChartOfAccounts.objects.update(depth=0, path='')
+        
+        migration = importlib.import_module('accounting.migrations.0007_chartofaccounts_tree_index')
+        migration.populate_tree_index(apps, None)
+        
+        self.assertEqual(
+            {account.pk: (account.depth, account.path) for account in ChartOfAccounts.objects.all()},
+            expected
+        )
+
+
+@override_settings(REPORT_CACHE_ENABLED=False)
+class ChartHierarchyQueryTests(AccountingTestMixin, TestCase):
+    
+    def test_hierarchy_query_count_does_not_grow_with_the_chart(self):
+        client = self.api_client()
+        url = '/api/accounting/chart-of-accounts/hierarchy/'
+        client.get(url)
+        
+        # The tenant is cached by the first request, so only the chart is read
+        with self.assertNumQueries(1):
+            response = client.get(url)
+        self.assertEqual(len(response.json()['data']), 2)
+        
+        group = ChartOfAccounts.objects.create(
+            company=self.company, name='Receivables', account_type='asset', parent=self.cash.parent, is_group_account=True
+        )
+        for number in range(10):
+            ChartOfAccounts.objects.create(company=self.company, name=f'Customer {number}', account_type='asset', parent=group)
+        
+        with self.assertNumQueries(1):
+            response = client.get(url)
+        assets = response.json()['data'][0]
+        self.assertEqual([child['name'] for child in assets['children']], ['Cash', 'Bank', 'Receivables'])
+        self.assertEqual(len(assets['children'][2]['children']), 10)
+
+
+class ChartReparentTests(AccountingTestMixin, TestCase):
+    
+    def create(self, name, parent, is_group_account=False):
+        return ChartOfAccounts.objects.create(
+            company=self.company, name=name, account_type='asset', parent=parent, is_group_account=is_group_account
+        )
+    
+    def test_moving_a_subtree_recodes_every_descendant(self):
+        assets = self.cash.parent
+        moved = self.create('Current Assets', assets, is_group_account=True)
+        receivables = self.create('Receivables', moved, is_group_account=True)
+        customers = [self.create(f'Customer {number}', receivables) for number in range(1, 4)]
+        stock = self.create('Stock', moved)
+        self.assertEqual((moved.code, receivables.code, stock.code), ('1-3', '1-3-1', '1-3-2'))
+        target = ChartOfAccounts.objects.create(
+            company=self.company, name='Other Assets', account_type='asset', is_group_account=True
+        )
+        self.create('Deposits', target)
+        
+        moved.parent = target
+        # Old position, sibling codes, the account itself, the subtree read
+        # and one bulk update for all five descendants, in a savepoint
+        with self.assertNumQueries(7):
+            moved.save()
+        
+        expected = {
+            moved.pk: '3-2',
+            receivables.pk: '3-2-1',
+            stock.pk: '3-2-2',
+            **{customer.pk: f'3-2-1-{number}' for number, customer in enumerate(customers, start=1)},
+        }
+        accounts = ChartOfAccounts.objects.in_bulk(list(expected))
+        for pk, code in expected.items():
+            self.assertEqual(accounts[pk].code, code)
+            self.assertEqual((accounts[pk].depth, accounts[pk].path), ChartOfAccounts.tree_position(code))
+        self.assertEqual(
+            list(target.get_descendants().values_list('code', flat=True)),
+            ['3-1', '3-2', '3-2-1', '3-2-1-1', '3-2-1-2', '3-2-1-3', '3-2-2']
+        )
+        self.assertFalse(ChartOfAccounts.objects.filter(company=self.company, code__startswith='1-3').exists())
+
+
+class VoucherTotalsTests(AccountingTestMixin, TestCase):
+    
+    def setUp(self):
+        self.voucher = self.post_voucher(date(2024, 8, 1), [
+            (self.cash, '100.00', '0'), (self.bank, '50.00', '0'), (self.sales, '0', '150.00')
+        ])
+        self.cash_line, self.bank_line, self.sales_line = self.voucher.line_entries.order_by('line_number')
+    
+    def assertTotals(self, debit, credit):
+        stored = Voucher.objects.values_list('total_debit', 'total_credit').get(pk=self.voucher.pk)
+        self.assertEqual(stored, (Decimal(debit), Decimal(credit)))
+        summed = self.voucher.line_entries.aggregate(debit=Sum('debit_amount'), credit=Sum('credit_amount'))
+        self.assertEqual(stored, (summed['debit'] or Decimal('0'), summed['credit'] or Decimal('0')))
+    
+    def test_totals_follow_line_edits(self):
+        self.assertTotals('150.00', '150.00')
+        
+        self.cash_line.debit_amount = Decimal('120.00')
+        self.cash_line.save()
+        self.assertTotals('170.00', '150.00')
+        # The voucher object held by the line is adjusted as well
+        self.assertEqual(self.cash_line.voucher.total_debit, Decimal('170.00'))
+        self.assertFalse(self.cash_line.voucher.is_balanced)
+        
+        self.sales_line.credit_amount = Decimal('170.00')
+        self.sales_line.save()
+        self.assertTotals('170.00', '170.00')
+    
+    def test_totals_follow_line_deletes(self):
+        self.bank_line.delete()
+        self.assertTotals('100.00', '150.00')
+        
+        self.sales_line.delete()
+        self.assertTotals('100.00', '0.00')
+    
+    def test_list_query_count_does_not_grow_with_the_page(self):
+        client = self.api_client()
+        client.get('/api/accounting/vouchers/')
+        
+        # Count, the page with its company, year and user, then the lines and their accounts
+        with self.assertNumQueries(4):
+            response = client.get('/api/accounting/vouchers/')
+        self.assertEqual(Decimal(str(response.json()['data']['results'][0]['total_debit'])), Decimal('150.00'))
+        
+        for day in range(2, 21):
+            self.post_voucher(date(2024, 8, day), [(self.cash, '10.00', '0'), (self.sales, '0', '10.00')])
+        with self.assertNumQueries(4):
+            response = client.get('/api/accounting/vouchers/')
+        self.assertEqual(len(response.json()['data']['results']), 20)
+
+
+class VoucherWriteQueryTests(AccountingTestMixin, TestCase):
+    
+    def setUp(self):
+        self.client = self.api_client()
+    
+    def payload(self, pairs):
+        lines = []
+        for _ in range(pairs):
+            lines += [
+                {'account': self.cash.id, 'debit_amount': '10.00', 'credit_amount': '0'},
+                {'account': self.sales.id, 'debit_amount': '0', 'credit_amount': '10.00'},
+            ]
+        return {
+            'company': self.company.id, 'financial_year': self.financial_year.id,
+            'voucher_type': 'cash', 'voucher_date': '2024-08-01', 'narration': 'Sale', 'line_entries': lines
+        }
+    
+    def create(self, pairs):
+        response = self.client.post('/api/accounting/vouchers/', self.payload(pairs), format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return Voucher.objects.get(pk=response.json()['data']['id'])
+    
+    def test_create_query_count_does_not_grow_with_the_lines(self):
+        self.create(1)
+        
+        # Lines are inserted with one bulk_create and balances applied in bulk
+        with self.assertNumQueries(23):
+            small = self.create(1)
+        with self.assertNumQueries(23):
+            large = self.create(20)
+        
+        self.assertEqual(small.line_entries.count(), 2)
+        self.assertEqual(list(large.line_entries.values_list('line_number', flat=True)), list(range(1, 41)))
+        self.assertEqual((large.total_debit, large.total_credit), (Decimal('200.00'), Decimal('200.00')))
+        self.assertEqual(AccountDailyBalance.find_discrepancies(), [])
+    
+    def test_update_query_count_when_every_line_is_replaced(self):
+        voucher = self.create(20)
+        
+        with self.assertNumQueries(20):
+            response = self.client.put(f'/api/accounting/vouchers/{voucher.id}/', self.payload(20), format='json')
+        
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(voucher.line_entries.count(), 40)
+        voucher.refresh_from_db()
+        self.assertEqual((voucher.total_debit, voucher.total_credit), (Decimal('200.00'), Decimal('200.00')))
+        self.assertEqual(AccountDailyBalance.find_discrepancies(), [])
+
+
+class VoucherHeaderCopyTests(AccountingTestMixin, TestCase):
+    
+    def headers(self, voucher):
+        return set(voucher.line_entries.values_list('company_id', 'financial_year_id', 'voucher_date'))
+    
+    def test_header_changes_reach_the_lines(self):
+        voucher = self.post_voucher(date(2024, 8, 1), [(self.cash, '100.00', '0'), (self.sales, '0', '100.00')])
+        self.assertEqual(self.headers(voucher), {(self.company.id, self.financial_year.id, date(2024, 8, 1))})
+        
+        voucher.voucher_date = date(2024, 9, 15)
+        voucher.save()
+        self.assertEqual(self.headers(voucher), {(self.company.id, self.financial_year.id, date(2024, 9, 15))})
+        
+        next_year = FinancialYear.objects.create(
+            company=self.company, name='FY 2025-26', start_date=date(2025, 7, 1), end_date=date(2026, 6, 30)
+        )
+        voucher.financial_year = next_year
+        voucher.voucher_date = date(2025, 7, 1)
+        voucher.save()
+        self.assertEqual(self.headers(voucher), {(self.company.id, next_year.id, date(2025, 7, 1))})
+        
+        other_company = Company.objects.create(name='Other Company', address_line_1='Street 2', city='Karachi', province='sindh')
+        other_year = FinancialYear.objects.create(
+            company=other_company, name='FY 2025-26', start_date=date(2025, 7, 1), end_date=date(2026, 6, 30)
+        )
+        voucher.company = other_company
+        voucher.financial_year = other_year
+        voucher.save()
+        self.assertEqual(self.headers(voucher), {(other_company.id, other_year.id, date(2025, 7, 1))})
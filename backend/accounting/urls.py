@@ -13,10 +13,12 @@ urlpatterns = [
     # Voucher URLs
     path('vouchers/', views.VoucherListCreateView.as_view(), name='voucher-list-create'),
     path('vouchers/<int:pk>/', views.VoucherDetailView.as_view(), name='voucher-detail'),
+    path('vouchers/ingest/', views.voucher_ingest, name='voucher-ingest'),
     path('voucher-types/', views.voucher_types, name='voucher-types'),
     
     # Reports URLs
     path('vouchers/<int:voucher_id>/pdf/', views.voucher_pdf_report, name='voucher-pdf-report'),
     path('ledger-report/', views.ledger_report, name='ledger-report'),
+    path('ledger-report/batch/', views.ledger_report_batch, name='ledger-report-batch'),
     path('trial-balance/', views.trial_balance, name='trial-balance'),
 ]
\ No newline at end of file
@@ -1,15 +1,19 @@
 from rest_framework import generics, status, filters
 from rest_framework.decorators import api_view
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q
-from django.http import HttpResponse
+from django.db.models import Q, Sum
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
 from common.utils import APIResponse, get_report_client
+from common.report_cache import ReportCache, PdfCache
 from common.models import UserActivity
-from .models import ChartOfAccounts, Voucher, VoucherLineEntry
+from .models import ChartOfAccounts, Voucher, VoucherLineEntry, AccountDailyBalance
 from .serializers import (
-    ChartOfAccountsSerializer, ChartOfAccountsHierarchySerializer,
-    VoucherSerializer, VoucherListSerializer, VoucherLineEntrySerializer
+    ChartOfAccountsSerializer,
+    VoucherSerializer, VoucherListSerializer, VoucherLineEntrySerializer,
+    VoucherIngestSerializer
 )
 
 
@@ -22,21 +26,17 @@ class ChartOfAccountsListCreateView(generics.ListCreateAPIView):
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['account_type', 'is_group_account', 'is_active', 'parent']
     search_fields = ['code', 'name', 'description']
-    ordering_fields = ['code', 'name', 'created_at']
-    ordering = ['code']
+    ordering_fields = ['code', 'path', 'name', 'created_at']
+    ordering = ['path']
     
     def get_queryset(self):
-        user = self.request.user
-        try:
-            user_activity = UserActivity.objects.get(user=user)
-            if not user_activity.current_company:
-                return ChartOfAccounts.objects.none()
-            
-            return ChartOfAccounts.objects.filter(
-                company=user_activity.current_company
-            ).select_related('company', 'parent', 'created_by')
-        except UserActivity.DoesNotExist:
-            return ChartOfAccounts.objects.none()
+        return ChartOfAccounts.objects.for_tenant(self.request.tenant).select_related('company', 'parent', 'created_by')
+    
+    def get_serializer(self, *args, **kwargs):
+        # Resolve full_path for the whole page with one ancestors query
+        if kwargs.get('many') and args:
+            args = (ChartOfAccounts.preload_full_paths(args[0]),) + args[1:]
+        return super().get_serializer(*args, **kwargs)
     
     def list(self, request, *args, **kwargs):
         try:
@@ -73,17 +73,7 @@ class ChartOfAccountsDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = ChartOfAccountsSerializer
     
     def get_queryset(self):
-        user = self.request.user
-        try:
-            user_activity = UserActivity.objects.get(user=user)
-            if not user_activity.current_company:
-                return ChartOfAccounts.objects.none()
-            
-            return ChartOfAccounts.objects.filter(
-                company=user_activity.current_company
-            ).select_related('company', 'parent', 'created_by')
-        except UserActivity.DoesNotExist:
-            return ChartOfAccounts.objects.none()
+        return ChartOfAccounts.objects.for_tenant(self.request.tenant).select_related('company', 'parent', 'created_by')
     
     def retrieve(self, request, *args, **kwargs):
         try:
@@ -132,14 +122,18 @@ class ChartOfAccountsDetailView(generics.RetrieveUpdateDestroyAPIView):
             )
 
 
+def _hierarchy_report_tags(request):
+    return ChartOfAccounts.report_tags(request.tenant.company.id)
+
+
 @api_view(['GET'])
+@ReportCache.cached('chart_of_accounts_hierarchy', _hierarchy_report_tags)
 def chart_of_accounts_hierarchy(request):
     """
     Get chart of accounts in hierarchical structure.
     """
     try:
-        user = request.user
-        user_activity = UserActivity.objects.get(user=user)
+        user_activity = request.tenant.get_activity()
         
         if not user_activity.current_company:
             return APIResponse.error(
@@ -148,20 +142,13 @@ def chart_of_accounts_hierarchy(request):
             )
         
         account_type = request.GET.get('account_type')
-        hierarchy = ChartOfAccounts.get_account_hierarchy(
+        hierarchy = ChartOfAccounts.get_hierarchy_data(
             company=user_activity.current_company,
             account_type=account_type
         )
         
-        # Serialize the hierarchy
-        serialized_hierarchy = []
-        for node in hierarchy:
-            account_data = ChartOfAccountsHierarchySerializer(node['account']).data
-            account_data['children'] = _serialize_hierarchy_children(node['children'])
-            serialized_hierarchy.append(account_data)
-        
         return APIResponse.success(
-            data=serialized_hierarchy,
+            data=hierarchy,
             message="Chart of accounts hierarchy retrieved successfully"
         )
     
@@ -177,15 +164,6 @@ def chart_of_accounts_hierarchy(request):
         )
 
 
-def _serialize_hierarchy_children(children):
-    """Helper function to recursively serialize hierarchy children."""
-    serialized_children = []
-    for child_node in children:
-        child_data = ChartOfAccountsHierarchySerializer(child_node['account']).data
-        child_data['children'] = _serialize_hierarchy_children(child_node['children'])
-        serialized_children.append(child_data)
-    return serialized_children
-
 
 class VoucherListCreateView(generics.ListCreateAPIView):
     """
@@ -204,20 +182,9 @@ class VoucherListCreateView(generics.ListCreateAPIView):
         return VoucherSerializer
     
     def get_queryset(self):
-        user = self.request.user
-        try:
-            user_activity = UserActivity.objects.get(user=user)
-            if not user_activity.current_company or not user_activity.current_financial_year:
-                return Voucher.objects.none()
-            
-            return Voucher.objects.filter(
-                company=user_activity.current_company,
-                financial_year=user_activity.current_financial_year
-            ).select_related(
-                'company', 'financial_year', 'created_by'
-            ).prefetch_related('line_entries__account')
-        except UserActivity.DoesNotExist:
-            return Voucher.objects.none()
+        return Voucher.objects.for_tenant(self.request.tenant, financial_year=True).select_related(
+            'company', 'financial_year', 'created_by'
+        ).prefetch_related('line_entries__account')
     
     def list(self, request, *args, **kwargs):
         try:
@@ -254,20 +221,9 @@ class VoucherDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = VoucherSerializer
     
     def get_queryset(self):
-        user = self.request.user
-        try:
-            user_activity = UserActivity.objects.get(user=user)
-            if not user_activity.current_company or not user_activity.current_financial_year:
-                return Voucher.objects.none()
-            
-            return Voucher.objects.filter(
-                company=user_activity.current_company,
-                financial_year=user_activity.current_financial_year
-            ).select_related(
-                'company', 'financial_year', 'created_by'
-            ).prefetch_related('line_entries__account')
-        except UserActivity.DoesNotExist:
-            return Voucher.objects.none()
+        return Voucher.objects.for_tenant(self.request.tenant, financial_year=True).select_related(
+            'company', 'financial_year', 'created_by'
+        ).prefetch_related('line_entries__account')
     
     def retrieve(self, request, *args, **kwargs):
         try:
@@ -318,6 +274,63 @@ class VoucherDetailView(generics.RetrieveUpdateDestroyAPIView):
 
 
 
+@api_view(['POST'])
+def voucher_ingest(request):
+    """
+    Post many vouchers from a streamed NDJSON body (application/x-ndjson).
+    Each line is one voucher in the same shape as the voucher create endpoint.
+    Vouchers are validated and committed in chunks of INGEST_CHUNK_SIZE, and
+    a failing chunk does not roll back the chunks committed before it.
+    The response streams one NDJSON result per input line and ends with a
+    summary line.
+    """
+    try:
+        user_activity = request.tenant.get_activity()
+        
+        if not user_activity.current_company:
+            return APIResponse.error(
+                message="No company activated. Please activate a company first.",
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if not user_activity.current_financial_year:
+            return APIResponse.error(
+                message="No financial year activated. Please activate a financial year first.",
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Validate every line against one preloaded account map
+        accounts = {
+            account.id: account
+            for account in ChartOfAccounts.objects.for_tenant(request.tenant)
+        }
+        context = {'request': request, 'user_activity': user_activity, 'accounts': accounts}
+        
+        # Without a Content-Length the WSGI body reads as empty, so a chunked
+        # upload would silently ingest nothing
+        if not request.META.get('CONTENT_LENGTH'):
+            return APIResponse.error(
+                message="Content-Length is required. Chunked request bodies are not supported.",
+                status_code=status.HTTP_411_LENGTH_REQUIRED
+            )
+        
+        return StreamingHttpResponse(
+            _ingest_vouchers(request.stream or [], context),
+            content_type='application/x-ndjson'
+        )
+    
+    except UserActivity.DoesNotExist:
+        return APIResponse.error(
+            message="User activity not found. Please activate a company first.",
+            status_code=status.HTTP_400_BAD_REQUEST
+        )
+    except Exception as e:
+        return APIResponse.error(
+            message=f"Error ingesting vouchers: {str(e)}",
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
 @api_view(['GET'])
 def voucher_types(request):
     """
@@ -360,7 +373,16 @@ def account_types(request):
         )
 
 
+def _trial_balance_report_tags(request):
+    tenant = request.tenant
+    return (
+        ChartOfAccounts.report_tags(tenant.company.id) +
+        VoucherLineEntry.report_tags(tenant.company.id, tenant.financial_year and tenant.financial_year.id)
+    )
+
+
 @api_view(['GET'])
+@ReportCache.cached('trial_balance', _trial_balance_report_tags)
 def trial_balance(request):
     """
     Generate hierarchical trial balance with opening, current period, and closing balances.
@@ -369,12 +391,10 @@ def trial_balance(request):
     - to_date: End date for current period transactions (default: current date)
     """
     try:
-        from django.db.models import Sum, Q, Case, When, DecimalField
         from decimal import Decimal
         from datetime import date
         
-        user = request.user
-        user_activity = UserActivity.objects.get(user=user)
+        user_activity = request.tenant.get_activity()
         
         if not user_activity.current_company:
             return APIResponse.error(
@@ -413,61 +433,47 @@ def trial_balance(request):
                 status_code=status.HTTP_400_BAD_REQUEST
             )
         
-        # Get all accounts for the company
-        accounts = ChartOfAccounts.objects.filter(
-            company=company,
+        # Opening and period sums for every account with activity, in one
+        # grouped query. Accounts without entries never leave the database.
+        balances = _account_period_balances(company, financial_year, from_date, to_date)
+
+        # Get all accounts for the company (needed for the group levels)
+        accounts = ChartOfAccounts.objects.for_tenant(request.tenant).filter(
             is_active=True
-        ).select_related('parent').order_by('code')
-        
-        # Calculate balances for each account
+        ).order_by('path').values(
+            'id', 'code', 'name', 'account_type', 'is_group_account', 'depth',
+            'parent_id', 'parent__code', 'parent__name'
+        )
+
+        account_type_display = dict(ChartOfAccounts.ACCOUNT_TYPES)
+        zero = Decimal('0')
+
         account_data_map = {}
-        
+        children_map = {}
+
         for account in accounts:
-            # Calculate opening balance (transactions before from_date)
-            opening_entries = VoucherLineEntry.objects.filter(
-                account=account,
-                voucher__company=company,
-                voucher__financial_year=financial_year,
-                voucher__voucher_date__lt=from_date
-            ).aggregate(
-                total_debit=Sum('debit_amount', default=Decimal('0')),
-                total_credit=Sum('credit_amount', default=Decimal('0'))
-            )
-            
-            opening_debit = opening_entries['total_debit'] or Decimal('0')
-            opening_credit = opening_entries['total_credit'] or Decimal('0')
-            
-            # Calculate current period transactions (from_date to to_date)
-            current_entries = VoucherLineEntry.objects.filter(
-                account=account,
-                voucher__company=company,
-                voucher__financial_year=financial_year,
-                voucher__voucher_date__gte=from_date,
-                voucher__voucher_date__lte=to_date
-            ).aggregate(
-                total_debit=Sum('debit_amount', default=Decimal('0')),
-                total_credit=Sum('credit_amount', default=Decimal('0'))
-            )
-            
-            current_debit = current_entries['total_debit'] or Decimal('0')
-            current_credit = current_entries['total_credit'] or Decimal('0')
-            
+            totals = balances.get(account['id'])
+            opening_debit = totals['opening_debit'] if totals else zero
+            opening_credit = totals['opening_credit'] if totals else zero
+            current_debit = totals['current_debit'] if totals else zero
+            current_credit = totals['current_credit'] if totals else zero
+
             # Calculate closing balance
             closing_debit = opening_debit + current_debit
             closing_credit = opening_credit + current_credit
-            
+
             # Store all account data (we'll filter later after building hierarchy)
-            account_data_map[account.id] = {
-                'id': account.id,
-                'code': account.code,
-                'name': account.name,
-                'account_type': account.account_type,
-                'account_type_display': account.get_account_type_display(),
-                'is_group_account': account.is_group_account,
-                'parent_id': account.parent_id,
-                'parent_code': account.parent.code if account.parent else None,
-                'parent_name': account.parent.name if account.parent else None,
-                'level': account.level,
+            account_data_map[account['id']] = {
+                'id': account['id'],
+                'code': account['code'],
+                'name': account['name'],
+                'account_type': account['account_type'],
+                'account_type_display': account_type_display.get(account['account_type'], account['account_type']),
+                'is_group_account': account['is_group_account'],
+                'parent_id': account['parent_id'],
+                'parent_code': account['parent__code'],
+                'parent_name': account['parent__name'],
+                'level': account['depth'],
                 'opening_debit': float(opening_debit),
                 'opening_credit': float(opening_credit),
                 'current_debit': float(current_debit),
@@ -477,17 +483,16 @@ def trial_balance(request):
                 'opening_balance': float(opening_debit - opening_credit),
                 'current_balance': float(current_debit - current_credit),
                 'closing_balance': float(closing_debit - closing_credit),
-                'has_activity': (opening_debit > 0 or opening_credit > 0 or 
-                               current_debit > 0 or current_credit > 0 or
-                               closing_debit > 0 or closing_credit > 0)
+                'has_activity': totals is not None
             }
-        
+            children_map.setdefault(account['parent_id'], []).append(account_data_map[account['id']])
+
         # Build hierarchical structure and filter accounts with activity
         def build_hierarchy(parent_id=None):
             hierarchy = []
             # Get all accounts with this parent
-            children_accounts = [acc for acc in account_data_map.values() if acc['parent_id'] == parent_id]
-            
+            children_accounts = children_map.get(parent_id, [])
+
             for account_data in children_accounts:
                 # Get children recursively
                 children = build_hierarchy(account_data['id'])
@@ -559,14 +564,45 @@ def trial_balance(request):
         )
 
 
+def _account_period_balances(company, financial_year, from_date, to_date, account_ids=None):
+    """
+    Opening (before from_date) and period (from_date..to_date) debit/credit
+    sums per account, computed with one conditional-aggregation GROUP BY
+    over the pre-summed daily balances.
+    Only accounts with entries up to to_date are returned.
+    """
+    from decimal import Decimal
+
+    zero = Decimal('0')
+    before = Q(date__lt=from_date)
+    within = Q(date__gte=from_date)
+
+    rows = AccountDailyBalance.objects.filter(
+        company=company,
+        financial_year=financial_year,
+        date__lte=to_date,
+        account__is_active=True
+    )
+    if account_ids is not None:
+        rows = rows.filter(account_id__in=account_ids)
+
+    rows = rows.values('account_id').annotate(
+        opening_debit=Sum('debit_total', filter=before, default=zero),
+        opening_credit=Sum('credit_total', filter=before, default=zero),
+        current_debit=Sum('debit_total', filter=within, default=zero),
+        current_credit=Sum('credit_total', filter=within, default=zero)
+    ).order_by()
+
+    return {row.pop('account_id'): row for row in rows}
+
+
 @api_view(['GET'])
 def voucher_pdf_report(request, voucher_id):
     """
     Generate PDF report for a specific voucher.
     """
     try:
-        user = request.user
-        user_activity = UserActivity.objects.get(user=user)
+        user_activity = request.tenant.get_activity()
         
         if not user_activity.current_company or not user_activity.current_financial_year:
             return APIResponse.error(
@@ -576,11 +612,7 @@ def voucher_pdf_report(request, voucher_id):
         
         # Get the voucher
         try:
-            voucher = Voucher.objects.get(
-                id=voucher_id,
-                company=user_activity.current_company,
-                financial_year=user_activity.current_financial_year
-            )
+            voucher = Voucher.objects.for_tenant(request.tenant, financial_year=True).get(id=voucher_id)
         except Voucher.DoesNotExist:
             return APIResponse.error(
                 message="Voucher not found or not accessible",
@@ -607,19 +639,41 @@ def voucher_pdf_report(request, voucher_id):
             'companyName': voucher.company.name,
             'financialYear': voucher.financial_year.name,
             'lineEntries': line_entries,
-            'totalDebit': float(sum(entry.debit_amount for entry in voucher.line_entries.all())),
-            'totalCredit': float(sum(entry.credit_amount for entry in voucher.line_entries.all())),
+            'totalDebit': float(voucher.total_debit),
+            'totalCredit': float(voucher.total_credit),
             'createdBy': voucher.created_by.get_full_name() if voucher.created_by else 'Unknown',
             'createdAt': voucher.created_at.isoformat()
         }
         
+        # The same data renders the same PDF, so its hash serves as the ETag
+        digest = PdfCache.content_hash('voucher', voucher_data)
+        etag = f'"{digest}"'
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        
+        filename = f"voucher_{voucher.voucher_number}.pdf"
+        cached_path = PdfCache.get('voucher', digest)
+        if cached_path:
+            try:
+                cached_file = open(cached_path, 'rb')
+            except OSError:
+                # Pruned by another request since it was found; render it again
+                cached_file = None
+            if cached_file:
+                response = FileResponse(cached_file, as_attachment=True, filename=filename, content_type='application/pdf')
+                response['ETag'] = etag
+                return response
+        
         # Call report server
         report_client = get_report_client()
         success, pdf_bytes, error_message = report_client.generate_voucher_pdf(voucher_data)
         
         if success:
+            PdfCache.store('voucher', digest, pdf_bytes)
             response = HttpResponse(pdf_bytes, content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="voucher_{voucher.voucher_number}.pdf"'
+            response['Content-Disposition'] = f'attachment; filename="{filename}"'
+            response['ETag'] = etag
             return response
         else:
             return APIResponse.error(
@@ -639,7 +693,21 @@ def voucher_pdf_report(request, voucher_id):
         )
 
 
+def _ledger_report_tags(request):
+    tenant = request.tenant
+    try:
+        account_ids = [int(request.GET.get('account_id'))]
+    except (TypeError, ValueError):
+        # The report answers with an error, which is not cached
+        account_ids = []
+    return (
+        ChartOfAccounts.report_tags(tenant.company.id, account_ids) +
+        VoucherLineEntry.report_tags(tenant.company.id, tenant.financial_year and tenant.financial_year.id, account_ids)
+    )
+
+
 @api_view(['GET'])
+@ReportCache.cached('ledger_report', _ledger_report_tags)
 def ledger_report(request):
     """
     Generate ledger report for a specific account showing all transactions.
@@ -647,14 +715,14 @@ def ledger_report(request):
     - account_id: Account ID to generate ledger for (required)
     - from_date: Start date for transactions (default: financial year start)
     - to_date: End date for transactions (default: current date)
+    - page_size: Enable keyset pagination with this many transactions per page
+    - cursor: next_cursor from the previous page (carries the running balance)
     """
     try:
-        from django.db.models import Sum, Q
         from decimal import Decimal
         from datetime import date
         
-        user = request.user
-        user_activity = UserActivity.objects.get(user=user)
+        user_activity = request.tenant.get_activity()
         
         if not user_activity.current_company:
             return APIResponse.error(
@@ -684,9 +752,8 @@ def ledger_report(request):
             )
         
         try:
-            account = ChartOfAccounts.objects.get(
+            account = ChartOfAccounts.objects.for_tenant(request.tenant).get(
                 id=account_id,
-                company=company,
                 is_active=True
             )
         except ChartOfAccounts.DoesNotExist:
@@ -713,63 +780,75 @@ def ledger_report(request):
                 status_code=status.HTTP_400_BAD_REQUEST
             )
         
-        # Calculate opening balance (transactions before from_date)
-        opening_entries = VoucherLineEntry.objects.filter(
+        # Opening balance and period totals from the pre-summed daily balances
+        balances = AccountDailyBalance.objects.filter(
             account=account,
-            voucher__company=company,
-            voucher__financial_year=financial_year,
-            voucher__voucher_date__lt=from_date
+            company=company,
+            financial_year=financial_year,
+            date__lte=to_date
         ).aggregate(
-            total_debit=Sum('debit_amount', default=Decimal('0')),
-            total_credit=Sum('credit_amount', default=Decimal('0'))
+            opening_debit=Sum('debit_total', filter=Q(date__lt=from_date), default=Decimal('0')),
+            opening_credit=Sum('credit_total', filter=Q(date__lt=from_date), default=Decimal('0')),
+            period_debit=Sum('debit_total', filter=Q(date__gte=from_date), default=Decimal('0')),
+            period_credit=Sum('credit_total', filter=Q(date__gte=from_date), default=Decimal('0'))
         )
         
-        opening_debit = opening_entries['total_debit'] or Decimal('0')
-        opening_credit = opening_entries['total_credit'] or Decimal('0')
-        opening_balance = opening_debit - opening_credit
+        opening_balance = balances['opening_debit'] - balances['opening_credit']
+        period_debit = balances['period_debit']
+        period_credit = balances['period_credit']
+        closing_balance = opening_balance + period_debit - period_credit
         
-        # Get all transactions for the specified period
-        transactions = VoucherLineEntry.objects.filter(
-            account=account,
-            voucher__company=company,
-            voucher__financial_year=financial_year,
-            voucher__voucher_date__gte=from_date,
-            voucher__voucher_date__lte=to_date
-        ).select_related('voucher').order_by('voucher__voucher_date', 'voucher__voucher_number', 'id')
-        
-        # Build transaction list with running balance
-        transaction_list = []
-        running_balance = opening_balance
-        
-        for entry in transactions:
-            # Calculate transaction amount and new balance
-            if entry.debit_amount > 0:
-                running_balance += entry.debit_amount
-            else:
-                running_balance -= entry.credit_amount
-            
-            transaction_list.append({
-                'id': entry.id,
-                'voucher_id': entry.voucher.id,
-                'date': entry.voucher.voucher_date.isoformat(),
-                'voucher_number': entry.voucher.voucher_number,
-                'voucher_type': entry.voucher.voucher_type,
-                'voucher_type_display': entry.voucher.get_voucher_type_display(),
-                'description': entry.description or entry.voucher.narration,
-                'debit_amount': float(entry.debit_amount),
-                'credit_amount': float(entry.credit_amount),
-                'running_balance': float(running_balance)
-            })
+        # Keyset pagination: ?page_size=N, then ?cursor=<next_cursor> for later pages
+        page_size = request.GET.get('page_size')
+        cursor = request.GET.get('cursor')
+        after = None
+        seed_balance = opening_balance
+        
+        if page_size or cursor:
+            try:
+                page_size = min(int(page_size or LEDGER_PAGE_SIZE), LEDGER_MAX_PAGE_SIZE)
+            except ValueError:
+                page_size = 0
+            if page_size < 1:
+                return APIResponse.error(
+                    message="page_size must be a positive integer",
+                    status_code=status.HTTP_400_BAD_REQUEST
+                )
+            if cursor:
+                try:
+                    after, seed_balance = _decode_ledger_cursor(cursor, account.id)
+                except ValueError:
+                    return APIResponse.error(
+                        message="Invalid cursor",
+                        status_code=status.HTTP_400_BAD_REQUEST
+                    )
+        else:
+            page_size = None
         
-        # Calculate period totals
-        period_totals = transactions.aggregate(
-            total_debit=Sum('debit_amount', default=Decimal('0')),
-            total_credit=Sum('credit_amount', default=Decimal('0'))
+        entries = _ledger_entries(
+            account_ids=[account.id],
+            company=company,
+            financial_year=financial_year,
+            from_date=from_date,
+            to_date=to_date,
+            seed_balance=seed_balance,
+            after=after
         )
         
-        period_debit = period_totals['total_debit'] or Decimal('0')
-        period_credit = period_totals['total_credit'] or Decimal('0')
-        closing_balance = opening_balance + period_debit - period_credit
+        if page_size:
+            entries = list(entries[:page_size + 1])
+            has_next = len(entries) > page_size
+            entries = entries[:page_size]
+        else:
+            has_next = False
+        
+        voucher_type_display = dict(Voucher.VOUCHER_TYPES)
+        
+        # Build transaction list; running_balance comes from the SQL window
+        transaction_list = [
+            _ledger_transaction(entry, entry['running_balance'], voucher_type_display)
+            for entry in entries
+        ]
         
         response_data = {
             'account': {
@@ -798,6 +877,15 @@ def ledger_report(request):
             }
         }
         
+        if page_size:
+            last = entries[-1] if entries else None
+            response_data['pagination'] = {
+                'page_size': page_size,
+                'page_opening_balance': float(seed_balance),
+                'has_next': has_next,
+                'next_cursor': _encode_ledger_cursor(last, account.id) if has_next else None
+            }
+        
         return APIResponse.success(
             data=response_data,
             message="Ledger report generated successfully"
@@ -818,3 +906,414 @@ def ledger_report(request):
             message=f"Error generating ledger report: {str(e)}",
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+
+
+
+@api_view(['GET'])
+def ledger_report_batch(request):
+    """
+    Generate ledger reports for several accounts in one request.
+    Query parameters:
+    - account_ids: Comma-separated account IDs
+    - group_account_id: Group account whose sub-accounts are reported
+      (one of account_ids or group_account_id is required)
+    - from_date: Start date for transactions (default: financial year start)
+    - to_date: End date for transactions (default: current date)
+    """
+    try:
+        from decimal import Decimal
+        from datetime import date
+        
+        user_activity = request.tenant.get_activity()
+        
+        if not user_activity.current_company:
+            return APIResponse.error(
+                message="No company activated. Please activate a company first.",
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if not user_activity.current_financial_year:
+            return APIResponse.error(
+                message="No financial year activated. Please activate a financial year first.",
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+        
+        company = user_activity.current_company
+        financial_year = user_activity.current_financial_year
+        
+        # Parse query parameters
+        account_ids = request.GET.get('account_ids')
+        group_account_id = request.GET.get('group_account_id')
+        from_date = request.GET.get('from_date')
+        to_date = request.GET.get('to_date')
+        
+        if not account_ids and not group_account_id:
+            return APIResponse.error(
+                message="account_ids or group_account_id is required",
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+        
+        accounts = ChartOfAccounts.objects.for_tenant(request.tenant).filter(is_active=True)
+        
+        if group_account_id:
+            try:
+                group_account = accounts.get(id=group_account_id, is_group_account=True)
+            except (ChartOfAccounts.DoesNotExist, ValueError):
+                return APIResponse.error(
+                    message="Group account not found or not accessible",
+                    status_code=status.HTTP_404_NOT_FOUND
+                )
+            accounts = accounts.filter(
+                ChartOfAccounts.subtree_q(group_account.path),
+                is_group_account=False
+            )
+        else:
+            try:
+                requested_ids = {int(account_id) for account_id in account_ids.split(',') if account_id.strip()}
+            except ValueError:
+                return APIResponse.error(
+                    message="account_ids must be a comma-separated list of IDs",
+                    status_code=status.HTTP_400_BAD_REQUEST
+                )
+            accounts = accounts.filter(id__in=requested_ids)
+        
+        accounts = list(accounts.order_by('path'))
+        if not accounts:
+            return APIResponse.error(
+                message="No accessible accounts found",
+                status_code=status.HTTP_404_NOT_FOUND
+            )
+        
+        # Set default dates
+        if from_date:
+            from_date = date.fromisoformat(from_date)
+        else:
+            from_date = financial_year.start_date
+        
+        if to_date:
+            to_date = date.fromisoformat(to_date)
+        else:
+            to_date = date.today()
+        
+        # Validate date range
+        if from_date > to_date:
+            return APIResponse.error(
+                message="From date cannot be later than to date",
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+        
+        account_ids = [account.id for account in accounts]
+        
+        # All opening balances and period totals in one grouped query
+        balances = _account_period_balances(
+            company, financial_year, from_date, to_date, account_ids=account_ids
+        )
+        
+        zero = Decimal('0')
+        ledgers = {}
+        for account in accounts:
+            totals = balances.get(account.id)
+            opening_balance = (totals['opening_debit'] - totals['opening_credit']) if totals else zero
+            period_debit = totals['current_debit'] if totals else zero
+            period_credit = totals['current_credit'] if totals else zero
+            
+            ledgers[account.id] = {
+                'account': {
+                    'id': account.id,
+                    'code': account.code,
+                    'name': account.name,
+                    'account_type': account.account_type,
+                    'account_type_display': account.get_account_type_display(),
+                    'is_group_account': account.is_group_account
+                },
+                'opening_balance': opening_balance,
+                'closing_balance': float(opening_balance + period_debit - period_credit),
+                'period_totals': {
+                    'debit': float(period_debit),
+                    'credit': float(period_credit),
+                    'net_change': float(period_debit - period_credit)
+                },
+                'transactions': []
+            }
+        
+        # One ordered scan over all accounts, running balances partitioned by account
+        voucher_type_display = dict(Voucher.VOUCHER_TYPES)
+        entries = _ledger_entries(
+            account_ids=account_ids,
+            company=company,
+            financial_year=financial_year,
+            from_date=from_date,
+            to_date=to_date,
+            seed_balance=zero
+        )
+        
+        transaction_count = 0
+        for entry in entries.iterator(chunk_size=2000):
+            ledger = ledgers[entry['account_id']]
+            ledger['transactions'].append(_ledger_transaction(
+                entry, ledger['opening_balance'] + entry['running_balance'], voucher_type_display
+            ))
+            transaction_count += 1
+        
+        for ledger in ledgers.values():
+            ledger['opening_balance'] = float(ledger['opening_balance'])
+        
+        response_data = {
+            'ledgers': [ledgers[account.id] for account in accounts],
+            'meta': {
+                'company_name': company.name,
+                'financial_year': financial_year.name,
+                'from_date': from_date.isoformat(),
+                'to_date': to_date.isoformat(),
+                'account_count': len(accounts),
+                'transaction_count': transaction_count,
+                'generated_at': date.today().isoformat()
+            }
+        }
+        
+        return APIResponse.success(
+            data=response_data,
+            message="Ledger reports generated successfully"
+        )
+    
+    except UserActivity.DoesNotExist:
+        return APIResponse.error(
+            message="User activity not found. Please activate a company and financial year first.",
+            status_code=status.HTTP_400_BAD_REQUEST
+        )
+    except ValueError as e:
+        return APIResponse.error(
+            message=f"Invalid date format: {str(e)}",
+            status_code=status.HTTP_400_BAD_REQUEST
+        )
+    except Exception as e:
+        return APIResponse.error(
+            message=f"Error generating ledger reports: {str(e)}",
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+LEDGER_PAGE_SIZE = 500
+LEDGER_MAX_PAGE_SIZE = 5000
+
+
+def _ledger_entries(account_ids, company, financial_year, from_date, to_date, seed_balance, after=None):
+    """
+    Line entries of the accounts for the period as values() rows, ordered on
+    (account, voucher_date, voucher_number, id). running_balance is computed
+    per account by a SQL window function and seeded with seed_balance.
+    `after` is the (voucher_date, voucher_number, id) key a page starts after.
+    """
+    from django.db.models import F, Value, Window, DecimalField, ExpressionWrapper
+    from django.db.models.functions import Round
+
+    amount_field = DecimalField(max_digits=17, decimal_places=2)
+    ordering = [F('voucher_date').asc(), F('voucher__voucher_number').asc(), F('id').asc()]
+
+    entries = VoucherLineEntry.objects.filter(
+        account_id__in=account_ids,
+        company=company,
+        financial_year=financial_year,
+        voucher_date__gte=from_date,
+        voucher_date__lte=to_date
+    )
+
+    if after:
+        after_date, after_number, after_id = after
+        entries = entries.filter(
+            Q(voucher_date__gt=after_date) |
+            Q(voucher_date=after_date, voucher__voucher_number__gt=after_number) |
+            Q(voucher_date=after_date, voucher__voucher_number=after_number, id__gt=after_id)
+        )
+
+    # Round keeps backends that sum in floating point (SQLite) exact to the cent
+    return entries.annotate(
+        running_balance=Round(
+            ExpressionWrapper(
+                Value(seed_balance, output_field=amount_field) + Window(
+                    expression=Sum(
+                        ExpressionWrapper(F('debit_amount') - F('credit_amount'), output_field=amount_field)
+                    ),
+                    partition_by=[F('account_id')],
+                    order_by=ordering
+                ),
+                output_field=amount_field
+            ),
+            2
+        )
+    ).order_by('account_id', *ordering).values(
+        'id', 'account_id', 'voucher_id', 'voucher_date', 'voucher__voucher_number',
+        'voucher__voucher_type', 'voucher__narration', 'description',
+        'debit_amount', 'credit_amount', 'running_balance'
+    )
+
+
+def _ledger_transaction(entry, running_balance, voucher_type_display):
+    """Response row for a _ledger_entries() entry."""
+    return {
+        'id': entry['id'],
+        'voucher_id': entry['voucher_id'],
+        'date': entry['voucher_date'].isoformat(),
+        'voucher_number': entry['voucher__voucher_number'],
+        'voucher_type': entry['voucher__voucher_type'],
+        'voucher_type_display': voucher_type_display.get(entry['voucher__voucher_type'], entry['voucher__voucher_type']),
+        'description': entry['description'] or entry['voucher__narration'],
+        'debit_amount': float(entry['debit_amount']),
+        'credit_amount': float(entry['credit_amount']),
+        'running_balance': float(running_balance)
+    }
+
+
+def _encode_ledger_cursor(entry, account_id):
+    """Opaque cursor carrying the last row's sort key and running balance."""
+    import base64
+    import json
+
+    payload = {
+        'a': account_id,
+        'd': entry['voucher_date'].isoformat(),
+        'n': entry['voucher__voucher_number'],
+        'i': entry['id'],
+        'b': str(entry['running_balance'])
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def _decode_ledger_cursor(cursor, account_id):
+    """Return ((voucher_date, voucher_number, id), balance); ValueError if invalid."""
+    import base64
+    import binascii
+    import json
+    from datetime import date
+    from decimal import Decimal, InvalidOperation
+
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if payload['a'] != account_id:
+            raise ValueError('Cursor belongs to another account')
+        after = (date.fromisoformat(payload['d']), payload['n'], int(payload['i']))
+        return after, Decimal(payload['b'])
+    except (binascii.Error, json.JSONDecodeError, KeyError, TypeError, InvalidOperation) as e:
+        raise ValueError(str(e))
+
+
+INGEST_CHUNK_SIZE = 500
+
+
+def _ingest_vouchers(stream, context):
+    """
+    Yield NDJSON result lines while consuming the request body chunk by chunk.
+    Each chunk commits on its own, so when a later chunk fails the vouchers
+    of earlier chunks stay committed. The summary line is always written,
+    even when a chunk or the body read fails part way.
+    """
+    import json
+    
+    summary = {'received': 0, 'created': 0, 'failed': 0}
+    
+    def flush(chunk):
+        try:
+            results = _ingest_chunk(chunk, context)
+        except Exception as e:
+            results = [
+                {'line': line_number, 'status': 'error', 'errors': f"Chunk could not be processed: {str(e)}"}
+                for line_number, _ in chunk
+            ]
+        for result in results:
+            summary['received'] += 1
+            summary['created' if result.get('status') == 'created' else 'failed'] += 1
+            yield json.dumps(result) + '\n'
+    
+    chunk = []
+    closed = False
+    try:
+        for line_number, raw in enumerate(stream, start=1):
+            if not raw.strip():
+                continue
+            chunk.append((line_number, raw))
+            if len(chunk) >= INGEST_CHUNK_SIZE:
+                yield from flush(chunk)
+                chunk = []
+        if chunk:
+            yield from flush(chunk)
+    except GeneratorExit:
+        # The response was closed, so there is nobody left to write to
+        closed = True
+        raise
+    except Exception as e:
+        # Reading the body failed, e.g. the client disconnected mid upload
+        summary['error'] = f"Ingest stopped: {str(e)}"
+    finally:
+        if not closed:
+            yield json.dumps({'summary': summary}) + '\n'
+
+
+def _ingest_chunk(chunk, context):
+    """Validate a chunk of NDJSON lines, commit the valid vouchers in one transaction and return one result per line"""
+    import json
+    from decimal import Decimal
+    
+    user_activity = context['user_activity']
+    active = {
+        'company': user_activity.current_company_id,
+        'financial_year': user_activity.current_financial_year_id
+    }
+    
+    # One serializer validates every record, as ListSerializer does with its child
+    serializer = VoucherIngestSerializer(context=context)
+    
+    results = []
+    postings = []
+    for line_number, raw in chunk:
+        result = {'line': line_number}
+        results.append(result)
+        
+        try:
+            record = json.loads(raw)
+        except ValueError as e:
+            result.update(status='error', errors=f"Invalid JSON: {str(e)}")
+            continue
+        if not isinstance(record, dict):
+            result.update(status='error', errors="Each line must be a JSON object")
+            continue
+        
+        # Company and financial year always come from the user activity
+        mismatched = [
+            field for field, active_id in active.items()
+            if record.get(field) not in (None, active_id, str(active_id))
+        ]
+        if mismatched:
+            result.update(status='error', errors={
+                field: 'Voucher must belong to the currently activated company and financial year.'
+                for field in mismatched
+            })
+            continue
+        
+        try:
+            voucher_data = serializer.run_validation(record)
+        except ValidationError as e:
+            result.update(status='error', errors=e.detail)
+            continue
+        
+        entries = [
+            VoucherLineEntry(
+                account=entry['account'],
+                debit_amount=entry.get('debit_amount', Decimal('0')),
+                credit_amount=entry.get('credit_amount', Decimal('0')),
+                description=entry.get('description')
+            )
+            for entry in voucher_data.pop('line_entries')
+        ]
+        voucher = Voucher(created_by=context['request'].user, **voucher_data)
+        postings.append((voucher, entries, result))
+    
+    if postings:
+        try:
+            Voucher.bulk_post([(voucher, entries) for voucher, entries, _ in postings])
+            for voucher, _, result in postings:
+                result.update(status='created', id=voucher.id, voucher_number=voucher.voucher_number)
+        except Exception as e:
+            for _, _, result in postings:
+                result.update(status='error', errors=f"Chunk could not be saved: {str(e)}")
+    
+    return results
@@ -53,6 +53,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'common.tenant.TenantMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -135,7 +136,7 @@ AUTH_USER_MODEL = 'common.User'
 # Django REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'common.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -196,6 +197,42 @@ CSRF_TRUSTED_ORIGINS = [
 REPORT_SERVER_URL = 'http://localhost:3502'
 REPORT_CACHE_ENABLED = True
 REPORT_CACHE_HOURS = 24
+REPORT_CACHE_MAX_ENTRIES = 1000
+REPORT_PDF_CACHE_MAX_BYTES = 500 * 1024 * 1024
+
+# Caches
+# 'tenant' holds the tenant version keys (common.tenant) and 'report_versions'
+# the report tag versions (common.report_cache). Every worker process must see
+# them, so both are file based. Cached reports stay in each process's
+# 'reports' cache and are checked against the shared versions, so an
+# invalidation made by one process reaches all of them. LocMemCache drops the
+# least recently used entries beyond MAX_ENTRIES.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'tenant': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'tenant',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    'reports': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'reports',
+        'OPTIONS': {
+            'MAX_ENTRIES': REPORT_CACHE_MAX_ENTRIES,
+        },
+    },
+    'report_versions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'report_versions',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
 
 # Media files (for report caching)
 MEDIA_ROOT = BASE_DIR / 'media'
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm
-from .models import User, Company, FinancialYear, UserActivity
+from .models import User, Company, FinancialYear, UserActivity, DocumentCounter
 
 
 class CustomUserCreationForm(UserCreationForm):
@@ -120,3 +120,10 @@ class UserActivityAdmin(admin.ModelAdmin):
             'classes': ('collapse',),
         }),
     )
+
+
+@admin.register(DocumentCounter)
+class DocumentCounterAdmin(admin.ModelAdmin):
+    list_display = ('document_type', 'company', 'financial_year', 'last_number', 'updated_at')
+    list_filter = ('company', 'financial_year', 'document_type')
+    readonly_fields = ('company', 'financial_year', 'document_type', 'last_number', 'updated_at')
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0004_alter_company_created_by_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('document_type', models.CharField(help_text='e.g., voucher:cash, stock_invoice:sale', max_length=50)),
+                ('last_number', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='document_counters', to='common.company')),
+                ('financial_year', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='document_counters', to='common.financialyear')),
+            ],
+            options={
+                'verbose_name': 'Document Counter',
+                'verbose_name_plural': 'Document Counters',
+                'db_table': 'document_counters',
+                'constraints': [models.UniqueConstraint(fields=('company', 'financial_year', 'document_type'), name='unique_document_counter')],
+            },
+        ),
+    ]
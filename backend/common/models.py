@@ -1,5 +1,5 @@
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.utils import timezone
 from django.core.validators import RegexValidator
 from django.core.exceptions import ValidationError
@@ -57,6 +57,23 @@ class User(AbstractBaseUser, PermissionsMixin):
         return self.first_name
 
 
+class CompanyQuerySet(models.QuerySet):
+    """QuerySet for rows that belong to a company"""
+    
+    def for_tenant(self, tenant, financial_year=False):
+        """
+        Rows of the tenant's activated company, and of its activated financial
+        year too when financial_year is True. Empty if either is not activated.
+        """
+        if tenant.company is None or (financial_year and tenant.financial_year is None):
+            return self.none()
+        
+        filters = {'company': tenant.company}
+        if financial_year:
+            filters['financial_year'] = tenant.financial_year
+        return self.filter(**filters)
+
+
 class Company(models.Model):
     name = models.CharField(max_length=255)
     legal_name = models.CharField(max_length=255, blank=True, null=True)
@@ -194,3 +211,58 @@ class UserActivity(models.Model):
     def save(self, *args, **kwargs):
         self.clean()
         super().save(*args, **kwargs)
+
+
+class DocumentCounter(models.Model):
+    """
+    Last issued number per company, financial year and document type.
+    Numbers are taken with an atomic UPDATE, so they stay unique under
+    concurrent posting and roll back together with the document.
+    """
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='document_counters')
+    financial_year = models.ForeignKey(FinancialYear, on_delete=models.CASCADE, related_name='document_counters')
+    document_type = models.CharField(max_length=50, help_text='e.g., voucher:cash, stock_invoice:sale')
+    last_number = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'document_counters'
+        verbose_name = 'Document Counter'
+        verbose_name_plural = 'Document Counters'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['company', 'financial_year', 'document_type'],
+                name='unique_document_counter'
+            )
+        ]
+    
+    def __str__(self):
+        return f"{self.document_type} - {self.last_number}"
+    
+    @classmethod
+    def next_number(cls, company_id, financial_year_id, document_type, count=1):
+        """
+        Allocate the next `count` numbers for a document type and return the first.
+        Call this inside the transaction that saves the documents: the row stays
+        locked until commit and a rollback gives the numbers back.
+        """
+        counter = cls.objects.filter(
+            company_id=company_id,
+            financial_year_id=financial_year_id,
+            document_type=document_type
+        )
+        with transaction.atomic():
+            if not counter.update(last_number=models.F('last_number') + count):
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(
+                            company_id=company_id,
+                            financial_year_id=financial_year_id,
+                            document_type=document_type,
+                            last_number=count
+                        )
+                    return 1
+                except IntegrityError:
+                    # Another transaction created the counter first
+                    counter.update(last_number=models.F('last_number') + count)
+            return counter.values_list('last_number', flat=True).get() - count + 1
@@ -0,0 +1,231 @@
+import functools
+import hashlib
+import json
+import os
+import tempfile
+import time
+import uuid
+from datetime import date
+from pathlib import Path
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+
+class ReportCache:
+    """
+    Cached report responses, keyed by tenant and normalized query parameters.
+    Each entry records the versions of its tags (company, financial year,
+    account or product scopes) when it was built. Invalidating a tag starts
+    a new version, so exactly the entries carrying that tag go stale.
+    Entries may be kept per process, but the versions are read from a cache
+    shared by every worker process, so invalidations reach all of them.
+    """
+    ALIAS = 'reports'
+    VERSIONS_ALIAS = 'report_versions'
+    
+    # Names of the reports wrapped by cached(), for stats()
+    _reports = set()
+    
+    @staticmethod
+    def tag(*parts):
+        return ':'.join(str(part) for part in parts)
+    
+    @classmethod
+    def get_cache(cls):
+        return caches[cls.ALIAS]
+    
+    @classmethod
+    def get_versions_cache(cls):
+        return caches[cls.VERSIONS_ALIAS]
+    
+    @classmethod
+    def cached(cls, report, tags):
+        """
+        Decorator for a report view. tags(request) returns the tags the
+        report depends on. Only 200 responses are stored; the X-Report-Cache
+        header tells whether the response came from the cache.
+        """
+        cls._reports.add(report)
+        
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(request, *args, **kwargs):
+                if not settings.REPORT_CACHE_ENABLED or request.tenant.company is None:
+                    return view(request, *args, **kwargs)
+                
+                cache = cls.get_cache()
+                key = cls._key(report, request.tenant, request.GET)
+                # Read before building, so a change made meanwhile leaves the entry stale
+                versions = cls._versions(tags(request))
+                
+                entry = cache.get(key)
+                if entry is not None and entry[0] == versions:
+                    cls._count(report, 'hits')
+                    response = Response(entry[1], status=status.HTTP_200_OK)
+                    response['X-Report-Cache'] = 'hit'
+                    return response
+                
+                cls._count(report, 'misses')
+                response = view(request, *args, **kwargs)
+                if response.status_code == status.HTTP_200_OK:
+                    cache.set(key, (versions, response.data), settings.REPORT_CACHE_HOURS * 60 * 60)
+                response['X-Report-Cache'] = 'miss'
+                return response
+            return wrapper
+        return decorator
+    
+    @classmethod
+    def invalidate(cls, *tags):
+        """Make every entry carrying one of the tags stale"""
+        if not tags:
+            return
+        cls._bump(tags)
+        # Again after commit, in case a reader cached the old rows in between
+        transaction.on_commit(lambda: cls._bump(tags))
+    
+    @classmethod
+    def stats(cls):
+        """Hit and miss counts per report"""
+        keys = {
+            cls._stats_key(report, outcome): (report, outcome)
+            for report in cls._reports for outcome in ('hits', 'misses')
+        }
+        counts = cls.get_cache().get_many(list(keys))
+        result = {report: {'hits': 0, 'misses': 0} for report in sorted(cls._reports)}
+        for key, count in counts.items():
+            report, outcome = keys[key]
+            result[report][outcome] = count
+        return result
+    
+    @classmethod
+    def _key(cls, report, tenant, params):
+        # Blank parameters are dropped and repeated ones sorted, so equivalent
+        # queries share an entry. Today's date is part of the key because
+        # reports default their date ranges to it.
+        normalized = sorted(
+            (name, sorted(value.strip() for value in params.getlist(name) if value.strip()))
+            for name in params
+        )
+        payload = json.dumps([
+            tenant.company.id,
+            tenant.financial_year.id if tenant.financial_year else None,
+            [item for item in normalized if item[1]],
+            date.today().isoformat()
+        ])
+        return f"report:{report}:{hashlib.sha256(payload.encode()).hexdigest()}"
+    
+    @classmethod
+    def _versions(cls, tags):
+        keys = [cls._version_key(tag) for tag in tags]
+        versions = cls.get_versions_cache().get_many(keys)
+        # A version evicted from the cache restarts, which only costs a rebuild
+        missing = {key: uuid.uuid4().hex for key in keys if key not in versions}
+        if missing:
+            cls.get_versions_cache().set_many(missing, None)
+            versions.update(missing)
+        return tuple(versions[key] for key in keys)
+    
+    @classmethod
+    def _bump(cls, tags):
+        cls.get_versions_cache().set_many({cls._version_key(tag): uuid.uuid4().hex for tag in tags}, None)
+    
+    @classmethod
+    def _count(cls, report, outcome):
+        cache = cls.get_cache()
+        key = cls._stats_key(report, outcome)
+        try:
+            cache.incr(key)
+        except ValueError:
+            if not cache.add(key, 1, None):
+                cache.incr(key)
+    
+    @staticmethod
+    def _version_key(tag):
+        return f"report_tag:{tag}"
+    
+    @staticmethod
+    def _stats_key(report, outcome):
+        return f"report_stats:{report}:{outcome}"
+
+
+class PdfCache:
+    """
+    Generated report PDFs stored under MEDIA_ROOT, addressed by a hash of the
+    data sent to the report server. Files expire REPORT_CACHE_HOURS after
+    they are written; beyond REPORT_PDF_CACHE_MAX_BYTES the least recently
+    read ones are removed.
+    """
+    DIRECTORY = 'report_pdfs'
+    
+    @staticmethod
+    def content_hash(report, payload):
+        encoded = json.dumps([report, payload], sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(encoded.encode()).hexdigest()
+    
+    @classmethod
+    def get(cls, report, digest):
+        """Path of the stored PDF, or None if there is no fresh one"""
+        if not settings.REPORT_CACHE_ENABLED:
+            return None
+        
+        path = cls._path(report, digest)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        
+        now = time.time()
+        if stat.st_mtime < now - cls._max_age():
+            path.unlink(missing_ok=True)
+            return None
+        # Access time orders eviction; the write time stays for expiry
+        os.utime(path, (now, stat.st_mtime))
+        return path
+    
+    @classmethod
+    def store(cls, report, digest, pdf_bytes):
+        if not settings.REPORT_CACHE_ENABLED:
+            return
+        
+        path = cls._path(report, digest)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Written aside and renamed, so readers never see a partial file
+        with tempfile.NamedTemporaryFile(dir=path.parent, suffix='.tmp', delete=False) as temp:
+            temp.write(pdf_bytes)
+        os.replace(temp.name, path)
+        cls.prune()
+    
+    @classmethod
+    def prune(cls):
+        """Remove expired PDFs, then the least recently read ones beyond the size budget"""
+        root = Path(settings.MEDIA_ROOT) / cls.DIRECTORY
+        expired_before = time.time() - cls._max_age()
+        
+        files = []
+        for path in root.glob('*/*.pdf'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if stat.st_mtime < expired_before:
+                path.unlink(missing_ok=True)
+            else:
+                files.append((stat.st_atime, stat.st_size, path))
+        
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files, key=lambda item: item[0]):
+            if total <= settings.REPORT_PDF_CACHE_MAX_BYTES:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+    
+    @classmethod
+    def _path(cls, report, digest):
+        return Path(settings.MEDIA_ROOT) / cls.DIRECTORY / report / f"{digest}.pdf"
+    
+    @staticmethod
+    def _max_age():
+        return settings.REPORT_CACHE_HOURS * 60 * 60
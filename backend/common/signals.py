@@ -0,0 +1,22 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import User, Company, FinancialYear, UserActivity
+from .tenant import TenantContext
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=UserActivity)
+@receiver(post_delete, sender=UserActivity)
+def invalidate_user_tenant(sender, instance, **kwargs):
+    user_id = instance.pk if sender is User else instance.user_id
+    TenantContext.invalidate_on_commit(user_id)
+
+
+@receiver(post_save, sender=Company)
+@receiver(post_delete, sender=Company)
+@receiver(post_save, sender=FinancialYear)
+@receiver(post_delete, sender=FinancialYear)
+def invalidate_all_tenants(sender, instance, **kwargs):
+    # Cached activities hold these rows, and SET_NULL clears them without signals
+    TenantContext.invalidate_on_commit()
@@ -0,0 +1,103 @@
+import copy
+import uuid
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.functional import SimpleLazyObject
+from .models import User, UserActivity
+
+
+class TenantContext:
+    """
+    The user's activated company and financial year for one request.
+    Resolved once per request from a per-process cache of users and their
+    activity. Entries are checked against version keys in the shared
+    'tenant' cache, which every worker process reads; writes to users,
+    activities, companies and financial years bump them.
+    """
+    CACHE_ALIAS = 'tenant'
+    CACHE_SIZE = 1000
+    
+    # user id -> (version, user, activity) for this process
+    _entries = {}
+    
+    def __init__(self, user, activity):
+        self.user = user
+        self.activity = activity
+        self.company = activity.current_company if activity else None
+        self.financial_year = activity.current_financial_year if activity else None
+    
+    def get_activity(self):
+        """The user's activity, raising UserActivity.DoesNotExist like a lookup would"""
+        if self.activity is None:
+            raise UserActivity.DoesNotExist('User activity not found')
+        return self.activity
+    
+    @classmethod
+    def for_user(cls, user):
+        if not user or not user.is_authenticated:
+            return cls(user, None)
+        entry = cls._entry(user.pk)
+        return cls(user, copy.copy(entry[2]) if entry[2] else None)
+    
+    @classmethod
+    def get_user(cls, user_id):
+        """Cached user by id, or None if there is no such user"""
+        user = cls._entry(user_id)[1]
+        return copy.copy(user) if user else None
+    
+    @classmethod
+    def _entry(cls, user_id):
+        # A version evicted from the cache restarts, which only costs a reload
+        versions = caches[cls.CACHE_ALIAS].get_many([cls._version_key(user_id), cls._version_key()])
+        version = (versions.get(cls._version_key(user_id)), versions.get(cls._version_key()))
+        if None in version:
+            version = (
+                version[0] or cls.invalidate(user_id),
+                version[1] or cls.invalidate()
+            )
+        
+        entry = cls._entries.get(user_id)
+        if entry is None or entry[0] != version:
+            user = User.objects.filter(pk=user_id).first()
+            activity = UserActivity.objects.select_related(
+                'current_company', 'current_financial_year'
+            ).filter(user_id=user_id).first() if user else None
+            
+            if len(cls._entries) >= cls.CACHE_SIZE:
+                cls._entries.clear()
+            entry = cls._entries[user_id] = (version, user, activity)
+        return entry
+    
+    @classmethod
+    def invalidate(cls, user_id=None):
+        """
+        Start a new version for one user, or for every user when user_id is None
+        (a company or financial year changed). Every process reloads its entry
+        on the next lookup. Returns the new version.
+        """
+        version = uuid.uuid4().hex
+        caches[cls.CACHE_ALIAS].set(cls._version_key(user_id), version, None)
+        return version
+    
+    @classmethod
+    def invalidate_on_commit(cls, user_id=None):
+        cls.invalidate(user_id)
+        # Again after commit, in case a reader cached the old rows in between
+        transaction.on_commit(lambda: cls.invalidate(user_id))
+    
+    @staticmethod
+    def _version_key(user_id=None):
+        return f"tenant_version:{user_id}" if user_id is not None else 'tenant_version'
+
+
+class TenantMiddleware:
+    """
+    Set request.tenant, resolved on first use. DRF views authenticate after
+    middleware runs, so the lookup waits until the view reads it.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        request.tenant = SimpleLazyObject(lambda: TenantContext.for_user(getattr(request, 'user', None)))
+        return self.get_response(request)
@@ -1,3 +1,307 @@
-from django.test import TestCase
+import threading
+import unittest
+from datetime import date
+from unittest import mock
+import requests
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from rest_framework.test import APIClient
+from accounting.models import Voucher
+from inventory.models import Category, StockInvoice, StockMovement
+from .models import User, Company, FinancialYear, UserActivity, DocumentCounter
+from .tenant import TenantContext
+from .utils import ReportClient
 
-# Create your tests here.
+
+class DocumentCounterConcurrencyTests(TransactionTestCase):
+    """
+    Numbers taken from several threads at once stay unique and gap-free.
+    SQLite's shared in-memory test database fails concurrent writers with
+    "table is locked" instead of waiting, so on SQLite these tests need a
+    file test database (DATABASES['default']['TEST']['NAME']).
+    """
+    THREADS = 8
+    PER_THREAD = 25
+    
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('needs a file backed test database on SQLite')
+        self.company = Company.objects.create(name='Test Company', address_line_1='Street 1', city='Lahore', province='punjab')
+        self.financial_year = FinancialYear.objects.create(
+            company=self.company, name='FY 2024-25', start_date=date(2024, 7, 1), end_date=date(2025, 6, 30)
+        )
+    
+    def allocate_concurrently(self, document_type, count=1):
+        numbers = []
+        errors = []
+        lock = threading.Lock()
+        start = threading.Barrier(self.THREADS)
+        
+        def worker():
+            try:
+                start.wait()
+                for _ in range(self.PER_THREAD):
+                    with transaction.atomic():
+                        first = DocumentCounter.next_number(
+                            self.company.id, self.financial_year.id, document_type, count=count
+                        )
+                    with lock:
+                        numbers.extend(range(first, first + count))
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+        
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(errors, [])
+        return numbers
+    
+    def test_voucher_numbers_are_unique_and_contiguous(self):
+        numbers = self.allocate_concurrently('voucher:cash')
+        self.assertEqual(sorted(numbers), list(range(1, self.THREADS * self.PER_THREAD + 1)))
+    
+    def test_invoice_number_blocks_continue_past_9999(self):
+        DocumentCounter.objects.create(
+            company=self.company, financial_year=self.financial_year,
+            document_type='stock_invoice:sale', last_number=9990
+        )
+        numbers = self.allocate_concurrently('stock_invoice:sale', count=3)
+        total = self.THREADS * self.PER_THREAD * 3
+        self.assertEqual(sorted(numbers), list(range(9991, 9991 + total)))
+        self.assertEqual(
+            DocumentCounter.objects.get(document_type='stock_invoice:sale').last_number, 9990 + total
+        )
+
+
+class TenantContextTests(TestCase):
+    
+    def setUp(self):
+        self.company = Company.objects.create(name='Test Company', address_line_1='Street 1', city='Lahore', province='punjab')
+        self.other_company = Company.objects.create(name='Other Company', address_line_1='Street 2', city='Karachi', province='sindh')
+        self.user = User.objects.create_user(email='user@example.com', password='secret', first_name='Test', last_name='User')
+        self.activity = UserActivity.objects.create(user=self.user, current_company=self.company)
+    
+    def test_version_bumped_by_another_process_reloads_the_entry(self):
+        self.assertEqual(TenantContext.for_user(self.user).company, self.company)
+        
+        # Another worker process changes the activity and bumps the version
+        # through its own handle on the shared cache directory
+        UserActivity.objects.filter(pk=self.activity.pk).update(current_company=self.other_company)
+        other_process_cache = FileBasedCache(settings.CACHES[TenantContext.CACHE_ALIAS]['LOCATION'], {})
+        other_process_cache.set(TenantContext._version_key(self.user.pk), 'other-process', None)
+        
+        self.assertEqual(TenantContext.for_user(self.user).company, self.other_company)
+    
+    def test_activity_change_bumps_the_version_for_the_next_request(self):
+        FinancialYear.objects.create(
+            company=self.company, name='FY 2024-25', start_date=date(2024, 7, 1), end_date=date(2025, 6, 30)
+        )
+        FinancialYear.objects.create(
+            company=self.other_company, name='FY 2025-26', start_date=date(2025, 7, 1), end_date=date(2026, 6, 30)
+        )
+        client = APIClient()
+        client.force_authenticate(self.user)
+        
+        def listed_years():
+            response = client.get('/api/financial-years/')
+            self.assertEqual(response.status_code, 200)
+            return [year['name'] for year in response.json()['data']['results']]
+        
+        self.assertEqual(listed_years(), ['FY 2024-25'])
+        version_key = TenantContext._version_key(self.user.pk)
+        version = caches[TenantContext.CACHE_ALIAS].get(version_key)
+        
+        self.activity.current_company = self.other_company
+        with self.captureOnCommitCallbacks(execute=True):
+            self.activity.save()
+        
+        self.assertNotEqual(caches[TenantContext.CACHE_ALIAS].get(version_key), version)
+        self.assertEqual(listed_years(), ['FY 2025-26'])
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'Reads SQLite query plans')
+class CompanyScopedIndexTests(TestCase):
+    """Tenant-scoped list queries use the company-leading indexes for filter and sort"""
+    
+    def setUp(self):
+        company = Company.objects.create(name='Test Company', address_line_1='Street 1', city='Lahore', province='punjab')
+        financial_year = FinancialYear.objects.create(
+            company=company, name='FY 2024-25', start_date=date(2024, 7, 1), end_date=date(2025, 6, 30)
+        )
+        self.tenant = TenantContext(None, UserActivity(current_company=company, current_financial_year=financial_year))
+    
+    def assertUsesIndex(self, queryset, fields):
+        index = next(index for index in queryset.model._meta.indexes if index.fields == fields)
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' / '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn(f'USING INDEX {index.name}', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+    
+    def test_voucher_list(self):
+        self.assertUsesIndex(
+            Voucher.objects.for_tenant(self.tenant, financial_year=True),
+            ['company', 'financial_year', 'voucher_date', 'voucher_number']
+        )
+    
+    def test_stock_invoice_list(self):
+        self.assertUsesIndex(
+            StockInvoice.objects.for_tenant(self.tenant, financial_year=True),
+            ['company', 'financial_year', 'invoice_date', 'invoice_number']
+        )
+    
+    def test_stock_movement_list(self):
+        self.assertUsesIndex(
+            StockMovement.objects.for_tenant(self.tenant, financial_year=True),
+            ['company', 'financial_year', 'movement_date', 'posting_sequence']
+        )
+    
+    def test_category_list(self):
+        self.assertUsesIndex(Category.objects.for_tenant(self.tenant), ['company', 'name'])
+
+
+class ReportClientTests(SimpleTestCase):
+    """Retries, circuit breaker and metrics against a mocked requests.Session"""
+    
+    def setUp(self):
+        session_patcher = mock.patch('common.utils.requests.Session')
+        self.session = session_patcher.start().return_value
+        self.session.headers = {}
+        self.addCleanup(session_patcher.stop)
+        
+        self.now = 1000.0
+        for target, patched in (
+            ('common.utils.time.monotonic', lambda: self.now),
+            ('common.utils.time.sleep', None),
+            ('common.utils.random.uniform', lambda low, high: high / 2),
+            ('common.utils.logger.error', None),
+        ):
+            patcher = mock.patch(target, side_effect=patched)
+            setattr(self, target.rsplit('.', 1)[-1], patcher.start())
+            self.addCleanup(patcher.stop)
+        
+        self.client = ReportClient()
+    
+    def response(self, status_code):
+        return mock.Mock(status_code=status_code, content=b'%PDF-voucher', text='error')
+    
+    def generate(self):
+        return self.client.generate_voucher_pdf({'voucherNumber': 'CV-0001'})
+    
+    def open_breaker(self):
+        self.session.post.side_effect = requests.exceptions.ConnectionError
+        for _ in range(ReportClient.FAILURE_THRESHOLD):
+            self.generate()
+        self.session.post.reset_mock()
+        self.sleep.reset_mock()
+    
+    def test_failed_connections_and_gateway_errors_are_retried_with_jitter(self):
+        self.session.post.side_effect = [requests.exceptions.ConnectionError(), self.response(503), self.response(200)]
+        
+        self.assertEqual(self.generate(), (True, b'%PDF-voucher', ''))
+        self.assertEqual(self.session.post.call_count, 3)
+        # Full jitter over a doubling backoff
+        self.assertEqual(self.uniform.call_args_list, [mock.call(0, 0.5), mock.call(0, 1.0)])
+        self.assertEqual(self.sleep.call_args_list, [mock.call(0.25), mock.call(0.5)])
+        self.assertEqual(self.client.metrics()['retries'], 2)
+    
+    def test_retries_stop_after_max_retries(self):
+        self.session.post.side_effect = requests.exceptions.ConnectionError
+        
+        success, _, error = self.generate()
+        self.assertFalse(success)
+        self.assertIn('Could not connect', error)
+        self.assertEqual(self.session.post.call_count, ReportClient.MAX_RETRIES + 1)
+    
+    def test_read_timeouts_and_client_errors_are_not_retried(self):
+        self.session.post.side_effect = requests.exceptions.ReadTimeout
+        self.assertFalse(self.generate()[0])
+        self.session.post.side_effect = [self.response(400)]
+        self.assertFalse(self.generate()[0])
+        
+        self.assertEqual(self.session.post.call_count, 2)
+        self.sleep.assert_not_called()
+    
+    def test_breaker_opens_after_consecutive_failures_and_fails_fast(self):
+        self.open_breaker()
+        self.assertEqual(self.client.metrics()['circuit_breaker']['state'], 'open')
+        
+        self.now += ReportClient.RESET_TIMEOUT - 1
+        success, _, error = self.generate()
+        
+        self.assertFalse(success)
+        self.assertIn('unavailable', error)
+        self.session.post.assert_not_called()
+        self.session.get.assert_not_called()
+        self.assertEqual(self.client.metrics()['rejected'], 1)
+    
+    def test_client_errors_do_not_open_the_breaker(self):
+        self.session.post.return_value = self.response(400)
+        for _ in range(ReportClient.FAILURE_THRESHOLD + 1):
+            self.generate()
+        
+        self.assertEqual(self.client.metrics()['circuit_breaker']['state'], 'closed')
+        self.assertEqual(self.session.post.call_count, ReportClient.FAILURE_THRESHOLD + 1)
+    
+    def test_one_probe_goes_through_after_the_cooldown_and_closes_the_breaker(self):
+        self.open_breaker()
+        self.now += ReportClient.RESET_TIMEOUT
+        concurrent = []
+        
+        def health_check(url, timeout):
+            # Another caller arrives while the probe is in flight
+            concurrent.append(self.generate())
+            return self.response(200)
+        
+        self.session.get.side_effect = health_check
+        self.session.post.side_effect = [self.response(200)]
+        
+        self.assertEqual(self.generate(), (True, b'%PDF-voucher', ''))
+        self.assertFalse(concurrent[0][0])
+        self.assertEqual(self.session.get.call_count, 1)
+        self.assertEqual(self.session.post.call_count, 1)
+        breaker = self.client.metrics()['circuit_breaker']
+        self.assertEqual(breaker, {'state': 'closed', 'consecutive_failures': 0, 'open_for_seconds': None})
+    
+    def test_failed_probe_keeps_the_breaker_open_for_another_cooldown(self):
+        self.open_breaker()
+        self.now += ReportClient.RESET_TIMEOUT
+        self.session.get.return_value = self.response(503)
+        
+        self.assertFalse(self.generate()[0])
+        self.now += ReportClient.RESET_TIMEOUT - 1
+        self.assertFalse(self.generate()[0])
+        
+        self.assertEqual(self.session.get.call_count, 1)
+        self.session.post.assert_not_called()
+        self.assertEqual(self.client.metrics()['circuit_breaker']['state'], 'open')
+    
+    def test_metrics_count_calls_and_latency(self):
+        def slow_response(url, json, timeout):
+            self.now += 0.2
+            return self.response(200)
+        
+        self.session.post.side_effect = slow_response
+        self.generate()
+        self.generate()
+        self.session.post.side_effect = [self.response(500)]
+        self.generate()
+        
+        metrics = self.client.metrics()
+        self.assertEqual(
+            {name: metrics[name] for name in ('calls', 'failures', 'retries', 'rejected')},
+            {'calls': 3, 'failures': 1, 'retries': 0, 'rejected': 0}
+        )
+        self.assertEqual(metrics['latency']['samples'], 3)
+        self.assertEqual(metrics['latency']['max_ms'], 200.0)
+        self.assertEqual(metrics['latency']['p50_ms'], 200.0)
+        self.assertEqual(metrics['circuit_breaker']['consecutive_failures'], 1)
@@ -8,6 +8,8 @@ from .views import (
     ProfileView,
     ChangePasswordView,
     protected_test_view,
+    report_cache_stats,
+    report_server_metrics,
     CompanyViewSet,
     FinancialYearViewSet,
     UserActivityViewSet,
@@ -33,6 +35,10 @@ urlpatterns = [
     # Test endpoint
     path('auth/test/', protected_test_view, name='test_auth'),
     
+    # Report cache statistics and report server metrics
+    path('report-cache/stats/', report_cache_stats, name='report_cache_stats'),
+    path('report-server/metrics/', report_server_metrics, name='report_server_metrics'),
+    
     # Company endpoints
     path('companies/', CompanyViewSet.as_view({'get': 'list', 'post': 'create'}), name='company_list'),
     path('companies/<int:pk>/', CompanyViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}), name='company_detail'),
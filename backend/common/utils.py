@@ -2,8 +2,13 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.pagination import PageNumberPagination
 from typing import Any, Optional, Dict
+from collections import deque
 import requests
+import requests.adapters
 import logging
+import random
+import threading
+import time
 from django.conf import settings
 
 
@@ -326,13 +331,46 @@ logger = logging.getLogger(__name__)
 
 class ReportClient:
     """
-    Simple client for communicating with the JasperReports server.
-    Makes direct HTTP requests to generate PDF reports.
+    Client for communicating with the JasperReports server.
+    Requests go through a pooled keep-alive session. Failures where the
+    request never reached the server are retried with jittered backoff, and
+    a circuit breaker fails calls fast while the server is down, until
+    check_server_health() reports it back.
     """
     
+    CONNECT_TIMEOUT = 3
+    READ_TIMEOUT = 30
+    POOL_SIZE = 10
+    
+    # Retries after the first attempt, and the backoff base in seconds
+    MAX_RETRIES = 2
+    RETRY_BACKOFF = 0.5
+    # The server answers these while it is starting or restarting
+    RETRY_STATUSES = {502, 503, 504}
+    
+    # Consecutive failures that open the breaker, and seconds before a health check
+    FAILURE_THRESHOLD = 5
+    RESET_TIMEOUT = 30
+    
+    LATENCY_SAMPLES = 200
+    
     def __init__(self):
         self.base_url = getattr(settings, 'REPORT_SERVER_URL', 'http://localhost:3502')
-        self.timeout = 30  # 30 seconds timeout
+        self.timeout = (self.CONNECT_TIMEOUT, self.READ_TIMEOUT)
+        
+        self.session = requests.Session()
+        self.session.headers['Content-Type'] = 'application/json'
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.POOL_SIZE)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._adapter = adapter
+        
+        self._lock = threading.Lock()
+        self._state = 'closed'
+        self._failures = 0
+        self._opened_at = None
+        self._latencies = deque(maxlen=self.LATENCY_SAMPLES)
+        self._counts = {'calls': 0, 'failures': 0, 'retries': 0, 'rejected': 0}
     
     def generate_voucher_pdf(self, voucher_data: Dict) -> tuple[bool, bytes, str]:
         """
@@ -346,35 +384,42 @@ class ReportClient:
         """
         url = f"{self.base_url}/api/reports/voucher/pdf"
         
+        if not self._allow_request():
+            self._count('rejected')
+            error_msg = "Report server is unavailable. Please try again shortly."
+            logger.warning(f"{error_msg} (circuit breaker open)")
+            return False, b"", error_msg
+        
+        logger.info(f"Generating voucher PDF report: {voucher_data.get('voucherNumber', 'Unknown')}")
+        started = time.monotonic()
         try:
-            logger.info(f"Generating voucher PDF report: {voucher_data.get('voucherNumber', 'Unknown')}")
-            
-            response = requests.post(
-                url,
-                json=voucher_data,
-                timeout=self.timeout,
-                headers={'Content-Type': 'application/json'}
-            )
+            response = self._post(url, voucher_data)
             
             if response.status_code == 200:
+                self._record(started, success=True)
                 logger.info("Voucher PDF generated successfully")
                 return True, response.content, ""
             else:
+                # Errors about the request itself say nothing about the server's health
+                self._record(started, success=response.status_code < 500)
                 error_msg = f"Report server returned status {response.status_code}: {response.text}"
                 logger.error(error_msg)
                 return False, b"", error_msg
                 
         except requests.exceptions.ConnectionError:
+            self._record(started, success=False)
             error_msg = "Could not connect to report server. Please ensure the report server is running."
             logger.error(error_msg)
             return False, b"", error_msg
             
         except requests.exceptions.Timeout:
-            error_msg = f"Report generation timed out after {self.timeout} seconds"
+            self._record(started, success=False)
+            error_msg = f"Report generation timed out after {self.READ_TIMEOUT} seconds"
             logger.error(error_msg)
             return False, b"", error_msg
             
         except Exception as e:
+            self._record(started, success=False)
             error_msg = f"Unexpected error generating report: {str(e)}"
             logger.error(error_msg)
             return False, b"", error_msg
@@ -389,10 +434,116 @@ class ReportClient:
         url = f"{self.base_url}/actuator/health"
         
         try:
-            response = requests.get(url, timeout=5)
+            response = self.session.get(url, timeout=(self.CONNECT_TIMEOUT, 5))
             return response.status_code == 200
         except Exception:
             return False
+    
+    def metrics(self) -> Dict:
+        """
+        Latency, connection pool and circuit breaker figures for this process.
+        
+        Returns:
+            Dict: Call counts, latency in milliseconds, pool usage and breaker state
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+            counts = dict(self._counts)
+            breaker = {
+                'state': self._state,
+                'consecutive_failures': self._failures,
+                'open_for_seconds': round(time.monotonic() - self._opened_at, 1) if self._opened_at else None
+            }
+        
+        latency = {'samples': len(latencies)}
+        if latencies:
+            latency.update({
+                'avg_ms': round(sum(latencies) / len(latencies), 1),
+                'p50_ms': round(latencies[len(latencies) // 2], 1),
+                'p95_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 1),
+                'max_ms': round(latencies[-1], 1)
+            })
+        
+        pools = []
+        # urllib3's pool container only supports keys() and lookups across threads
+        open_pools = self._adapter.poolmanager.pools
+        for pool in filter(None, (open_pools.get(key) for key in open_pools.keys())):
+            pools.append({
+                'host': pool.host,
+                'port': pool.port,
+                'max_size': self.POOL_SIZE,
+                # Free slots are held as None until a connection is opened in them
+                'idle_connections': sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0,
+                'connections_opened': pool.num_connections,
+                'requests': pool.num_requests
+            })
+        
+        return {**counts, 'latency': latency, 'pools': pools, 'circuit_breaker': breaker}
+    
+    def _post(self, url: str, payload: Dict) -> requests.Response:
+        """
+        POST with bounded retries. Rendering has no side effects, so failed
+        connections (refused, reset or timed out while connecting) and
+        502/503/504 answers are retried. Read timeouts are not: the server
+        may still be busy with the report.
+        """
+        for attempt in range(self.MAX_RETRIES + 1):
+            last_attempt = attempt == self.MAX_RETRIES
+            try:
+                response = self.session.post(url, json=payload, timeout=self.timeout)
+            except requests.exceptions.ConnectionError:
+                if last_attempt:
+                    raise
+            else:
+                if last_attempt or response.status_code not in self.RETRY_STATUSES:
+                    return response
+                response.close()
+            
+            self._count('retries')
+            # Full jitter keeps workers from retrying in step
+            time.sleep(random.uniform(0, self.RETRY_BACKOFF * 2 ** attempt))
+    
+    def _allow_request(self) -> bool:
+        """Whether the circuit breaker lets a call through"""
+        with self._lock:
+            if self._state == 'closed':
+                return True
+            if self._state == 'half_open' or time.monotonic() - self._opened_at < self.RESET_TIMEOUT:
+                return False
+            # One caller checks health while the others keep failing fast
+            self._state = 'half_open'
+        
+        healthy = self.check_server_health()
+        with self._lock:
+            if healthy:
+                self._state = 'closed'
+                self._failures = 0
+                self._opened_at = None
+                logger.info("Report server is healthy again, circuit breaker closed")
+            else:
+                self._state = 'open'
+                self._opened_at = time.monotonic()
+        return healthy
+    
+    def _record(self, started: float, success: bool) -> None:
+        """Record a call's latency and its outcome for the circuit breaker"""
+        with self._lock:
+            self._latencies.append((time.monotonic() - started) * 1000)
+            self._counts['calls'] += 1
+            if success:
+                self._failures = 0
+                return
+            
+            self._counts['failures'] += 1
+            self._failures += 1
+            if self._state == 'closed' and self._failures >= self.FAILURE_THRESHOLD:
+                self._state = 'open'
+                self._opened_at = time.monotonic()
+                logger.error(f"Report server failed {self._failures} times in a row, circuit breaker opened")
+    
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counts[name] += 1
 
 
 # Global report client instance
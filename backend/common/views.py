@@ -1,10 +1,11 @@
 from rest_framework import status, filters
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework_simplejwt.tokens import RefreshToken
+from django.conf import settings
 from django.contrib.auth import login
 from django.db.models import Q
 from django_filters.rest_framework import DjangoFilterBackend
@@ -20,7 +21,8 @@ from .serializers import (
     UserActivitySerializer,
     FinancialYearSerializer
 )
-from .utils import APIResponse, handle_serializer_errors, StandardPagination
+from .utils import APIResponse, handle_serializer_errors, StandardPagination, get_report_client
+from .report_cache import ReportCache
 
 
 class CustomTokenObtainPairView(TokenObtainPairView):
@@ -238,6 +240,33 @@ def protected_test_view(request):
     )
 
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def report_cache_stats(request):
+    """
+    Report cache hit and miss counts per report.
+    """
+    return APIResponse.success(
+        data={
+            'enabled': settings.REPORT_CACHE_ENABLED,
+            'reports': ReportCache.stats()
+        },
+        message="Report cache statistics retrieved successfully"
+    )
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def report_server_metrics(request):
+    """
+    Report server call latency, connection pool usage and circuit breaker state.
+    """
+    return APIResponse.success(
+        data=get_report_client().metrics(),
+        message="Report server metrics retrieved successfully"
+    )
+
+
 class CompanyViewSet(ModelViewSet):
     """
     ViewSet for Company CRUD operations with search and filtering.
@@ -370,7 +399,7 @@ class FinancialYearViewSet(ModelViewSet):
         Filter financial years by user's activated company
         """
         # Get user's current activity
-        activity = UserActivity.objects.filter(user=self.request.user).first()
+        activity = self.request.tenant.activity
         
         if not activity or not activity.current_company:
             # Return empty queryset if no company is activated
@@ -384,7 +413,7 @@ class FinancialYearViewSet(ModelViewSet):
     def create(self, request, *args, **kwargs):
         """Create a new financial year for the currently activated company."""
         # Get user's current activity
-        activity = UserActivity.objects.filter(user=self.request.user).first()
+        activity = self.request.tenant.activity
         
         if not activity or not activity.current_company:
             return APIResponse.error(
@@ -410,7 +439,7 @@ class FinancialYearViewSet(ModelViewSet):
     def list(self, request, *args, **kwargs):
         """List financial years with pagination and search."""
         # Check if user has activated a company
-        activity = UserActivity.objects.filter(user=self.request.user).first()
+        activity = self.request.tenant.activity
         
         if not activity or not activity.current_company:
             return APIResponse.success(
@@ -531,7 +560,7 @@ def get_filtered_financial_years(request):
     """
     try:
         # Get user's current activity
-        activity = UserActivity.objects.filter(user=request.user).first()
+        activity = request.tenant.activity
         
         if not activity or not activity.current_company:
             return APIResponse.success(
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Party, HSCode, Category, Product, StockInvoice, StockInvoiceLineItem, StockMovement
+from .models import Party, HSCode, Category, Product, StockInvoice, StockInvoiceLineItem, StockMovement, PendingStockRecalculation, StockSnapshot
 
 
 @admin.register(Party)
@@ -65,7 +65,7 @@ class StockMovementAdmin(admin.ModelAdmin):
     list_filter = ['company', 'financial_year', 'movement_type', 'movement_date', 'product__category__hs_code']
     search_fields = ['product__code', 'product__name', 'reference_number', 'party__name']
     readonly_fields = ['balance_quantity', 'balance_value', 'average_cost', 'created_at', 'updated_at']
-    ordering = ['-movement_date', '-created_at']
+    ordering = ['-movement_date', '-posting_sequence']
     
     fieldsets = (
         ('Movement Details', {
@@ -88,4 +88,21 @@ class StockMovementAdmin(admin.ModelAdmin):
             'fields': ('created_by', 'created_at', 'updated_at'),
             'classes': ('collapse',)
         })
-    )
\ No newline at end of file
+    )
+
+
+@admin.register(PendingStockRecalculation)
+class PendingStockRecalculationAdmin(admin.ModelAdmin):
+    list_display = ['product', 'dirty_from', 'created_at']
+    list_select_related = ['product']
+    search_fields = ['product__code', 'product__name']
+    readonly_fields = ['product', 'dirty_from', 'created_at']
+
+
+@admin.register(StockSnapshot)
+class StockSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['product', 'period_end', 'quantity', 'value', 'average_cost', 'company']
+    list_filter = ['company', 'period_end']
+    list_select_related = ['product', 'company']
+    search_fields = ['product__code', 'product__name']
+    readonly_fields = ['company', 'product', 'period_end', 'quantity', 'value', 'average_cost', 'last_movement_date', 'updated_at']
@@ -0,0 +1,31 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from common.models import Company
+from inventory.models import StockSnapshot
+
+
+class Command(BaseCommand):
+    help = 'Rebuild month-end stock snapshots from stock movements, used to value stock as of past dates'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, help='Only rebuild snapshots of this company id')
+        parser.add_argument(
+            '--through', type=date.fromisoformat,
+            help='Last date to snapshot, YYYY-MM-DD (default: end of last month)'
+        )
+    
+    def handle(self, *args, **options):
+        companies = Company.objects.all()
+        if options['company']:
+            companies = companies.filter(id=options['company'])
+            if not companies.exists():
+                raise CommandError(f"Company {options['company']} not found")
+        through = options['through'] or date.today().replace(day=1) - timedelta(days=1)
+        
+        total = 0
+        for company in companies:
+            count = StockSnapshot.build(company, through)
+            self.stdout.write(f"Company '{company.name}': {count} snapshots")
+            total += count
+        self.stdout.write(self.style.SUCCESS(f'Built {total} stock snapshots through {through.isoformat()}'))
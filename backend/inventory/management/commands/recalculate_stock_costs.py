@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from common.models import Company
+from inventory.models import Product, PendingStockRecalculation
+
+
+class Command(BaseCommand):
+    help = 'Recalculate stock movement balances for products queued by backdated postings and deletions'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, help='Only recalculate products of this company id')
+    
+    def handle(self, *args, **options):
+        company = None
+        products = None
+        if options['company']:
+            try:
+                company = Company.objects.get(id=options['company'])
+            except Company.DoesNotExist:
+                raise CommandError(f"Company {options['company']} not found")
+            products = Product.objects.filter(company=company)
+        
+        count = PendingStockRecalculation.flush(products)
+        scope = f"company '{company.name}'" if company else 'all companies'
+        self.stdout.write(self.style.SUCCESS(f'Recalculated {count} products for {scope}'))
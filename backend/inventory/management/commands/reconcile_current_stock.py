@@ -0,0 +1,62 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from common.models import Company
+from inventory.models import Product
+
+
+def _init_worker():
+    # Spawned workers start without Django; forked ones must not share the parent's connections
+    django.setup()
+    connections.close_all()
+
+
+def _rebuild_company(company_id):
+    return company_id, Product.rebuild_current_stock(company=company_id)
+
+
+def _rebuild_company_in_worker(company_id):
+    try:
+        return _rebuild_company(company_id)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Rebuild Product.current_stock from stock movements, one worker process per company'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, help='Only rebuild products of this company id')
+        parser.add_argument(
+            '--workers', type=int,
+            help='Number of companies rebuilt in parallel (default: CPU count, '
+                 'or 1 on SQLite, which lets only one process write at a time)'
+        )
+    
+    def handle(self, *args, **options):
+        companies = Company.objects.all()
+        if options['company']:
+            companies = companies.filter(id=options['company'])
+            if not companies.exists():
+                raise CommandError(f"Company {options['company']} not found")
+        names = dict(companies.values_list('id', 'name'))
+        
+        workers = options['workers']
+        if workers is None:
+            workers = 1 if connection.vendor == 'sqlite' else os.cpu_count() or 1
+        workers = min(max(workers, 1), len(names))
+        if workers <= 1:
+            results = [_rebuild_company(company_id) for company_id in names]
+        else:
+            # Children must open their own database connections
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+                results = list(executor.map(_rebuild_company_in_worker, names))
+        
+        for company_id, count in results:
+            self.stdout.write(f"Company '{names[company_id]}': {count} products corrected")
+        total = sum(count for _, count in results)
+        self.stdout.write(self.style.SUCCESS(f'Corrected current stock of {total} products in {len(results)} companies'))
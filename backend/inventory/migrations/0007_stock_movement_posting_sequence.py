@@ -0,0 +1,72 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_posting_sequence(apps, schema_editor):
+    """Number existing movements in their current order and seed the counters"""
+    StockMovement = apps.get_model('inventory', 'StockMovement')
+    DocumentCounter = apps.get_model('common', 'DocumentCounter')
+    
+    last_numbers = {}
+    batch = []
+    movements = StockMovement.objects.order_by(
+        'company_id', 'financial_year_id', 'movement_date', 'created_at', 'id'
+    ).only('id', 'company_id', 'financial_year_id')
+    for movement in movements.iterator(chunk_size=2000):
+        key = (movement.company_id, movement.financial_year_id)
+        last_numbers[key] = movement.posting_sequence = last_numbers.get(key, 0) + 1
+        batch.append(movement)
+        if len(batch) >= 1000:
+            StockMovement.objects.bulk_update(batch, ['posting_sequence'])
+            batch = []
+    StockMovement.objects.bulk_update(batch, ['posting_sequence'])
+    
+    DocumentCounter.objects.bulk_create([
+        DocumentCounter(
+            company_id=company_id,
+            financial_year_id=financial_year_id,
+            document_type='stock_movement',
+            last_number=last_number
+        )
+        for (company_id, financial_year_id), last_number in last_numbers.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0005_document_counter'),
+        ('inventory', '0006_seed_stock_invoice_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='stockmovement',
+            options={'ordering': ['movement_date', 'posting_sequence'], 'verbose_name': 'Stock Movement', 'verbose_name_plural': 'Stock Movements'},
+        ),
+        migrations.RemoveIndex(
+            model_name='stockmovement',
+            name='stock_movem_company_d69835_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='stockmovement',
+            name='stock_movem_product_363a5e_idx',
+        ),
+        migrations.AddField(
+            model_name='stockmovement',
+            name='posting_sequence',
+            field=models.PositiveBigIntegerField(default=0, help_text='Posting order within the company and financial year'),
+        ),
+        migrations.RunPython(backfill_posting_sequence, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['company', 'product', 'movement_date', 'posting_sequence'], name='stock_movem_company_f7b3c4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['product', 'movement_date', 'posting_sequence'], name='stock_movem_product_65a69f_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_stock_movement_posting_sequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingStockRecalculation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dirty_from', models.DateField(help_text='Earliest movement date whose balances are out of date')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='pending_recalculation', to='inventory.product')),
+            ],
+            options={
+                'verbose_name': 'Pending Stock Recalculation',
+                'verbose_name_plural': 'Pending Stock Recalculations',
+                'db_table': 'pending_stock_recalculations',
+            },
+        ),
+    ]
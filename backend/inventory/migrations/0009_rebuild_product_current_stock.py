@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-17 04:10
+
+from decimal import Decimal
+
+from django.db import migrations
+
+
+def rebuild_current_stock(apps, schema_editor):
+    """Set current_stock to the net quantity of each product's movements"""
+    Product = apps.get_model('inventory', 'Product')
+    StockMovement = apps.get_model('inventory', 'StockMovement')
+    
+    expected = dict.fromkeys(Product.objects.values_list('pk', flat=True), Decimal('0'))
+    rows = StockMovement.objects.values_list('product_id', 'quantity_in', 'quantity_out')
+    for product_id, quantity_in, quantity_out in rows.iterator(chunk_size=2000):
+        expected[product_id] += quantity_in - quantity_out
+    
+    for pk, current_stock in Product.objects.values_list('pk', 'current_stock'):
+        if expected[pk] != current_stock:
+            Product.objects.filter(pk=pk).update(current_stock=expected[pk])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_pending_stock_recalculation'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_current_stock, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0005_document_counter'),
+        ('inventory', '0009_rebuild_product_current_stock'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['company', 'name'], name='categories_company_18f426_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockinvoice',
+            index=models.Index(fields=['company', 'financial_year', 'invoice_date', 'invoice_number'], name='stock_invoi_company_e2f0ac_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['company', 'financial_year', 'movement_date', 'posting_sequence'], name='stock_movem_company_5a8f32_idx'),
+        ),
+    ]
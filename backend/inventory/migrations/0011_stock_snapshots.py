@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:40
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0005_document_counter'),
+        ('inventory', '0010_company_scoped_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_end', models.DateField()),
+                ('quantity', models.DecimalField(decimal_places=3, default=Decimal('0'), max_digits=15)),
+                ('value', models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=15)),
+                ('average_cost', models.DecimalField(decimal_places=4, default=Decimal('0'), max_digits=15)),
+                ('last_movement_date', models.DateField(help_text='Date of the movement the figures come from')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='common.company')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='inventory.product')),
+            ],
+            options={
+                'verbose_name': 'Stock Snapshot',
+                'verbose_name_plural': 'Stock Snapshots',
+                'db_table': 'stock_snapshots',
+                'ordering': ['period_end'],
+                'indexes': [models.Index(fields=['company', 'period_end'], name='stock_snaps_company_419db3_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'period_end'), name='unique_stock_snapshot')],
+            },
+        ),
+    ]
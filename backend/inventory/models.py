@@ -1,9 +1,31 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 from django.db.models import Sum
+from django.db.models.functions import Round
+import calendar
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
 from decimal import Decimal
-from common.models import Company, User, FinancialYear
+from datetime import date, timedelta
+from itertools import groupby
+from common.models import Company, CompanyQuerySet, User, FinancialYear, DocumentCounter
+from common.report_cache import ReportCache
+
+
+# Set while bulk deletes queue the recalculation of the products they touch
+_bulk_recalculation = ContextVar('bulk_recalculation', default=False)
+
+
+@contextmanager
+def _bulk_recalculation_scope():
+    token = _bulk_recalculation.set(True)
+    try:
+        yield
+    finally:
+        _bulk_recalculation.reset(token)
 
 
 class Party(models.Model):
@@ -43,6 +65,8 @@ class Party(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = CompanyQuerySet.as_manager()
+    
     class Meta:
         db_table = 'parties'
         verbose_name = 'Party'
@@ -73,6 +97,8 @@ class HSCode(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = CompanyQuerySet.as_manager()
+    
     class Meta:
         db_table = 'hs_codes'
         verbose_name = 'HS Code'
@@ -105,12 +131,17 @@ class Category(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = CompanyQuerySet.as_manager()
+    
     class Meta:
         db_table = 'categories'
         verbose_name = 'Category'
         verbose_name_plural = 'Categories'
         ordering = ['name']
         unique_together = ['company', 'hs_code', 'name']
+        indexes = [
+            models.Index(fields=['company', 'name']),
+        ]
     
     def __str__(self):
         return f"{self.hs_code.code} - {self.name}"
@@ -174,6 +205,8 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = CompanyQuerySet.as_manager()
+    
     class Meta:
         db_table = 'products'
         verbose_name = 'Product'
@@ -204,6 +237,11 @@ class Product(models.Model):
         if self.gst_rate > 100:
             raise ValidationError('GST rate cannot be more than 100%')
     
+    @staticmethod
+    def report_tags(company_id):
+        """Report cache tag for the company's parties, products, categories and HS codes"""
+        return [ReportCache.tag('catalog', company_id)]
+    
     @property
     def is_low_stock(self):
         """Check if current stock is below minimum stock level"""
@@ -213,6 +251,39 @@ class Product(models.Model):
     def stock_value(self):
         """Calculate current stock value based on cost price"""
         return self.current_stock * self.cost_price
+    
+    @classmethod
+    def add_to_stock(cls, quantities):
+        """Shift current_stock by product id -> quantity delta, in the caller's transaction"""
+        for product_id, quantity in quantities.items():
+            if quantity:
+                cls.objects.filter(pk=product_id).update(current_stock=models.F('current_stock') + quantity)
+    
+    @classmethod
+    def rebuild_current_stock(cls, company=None):
+        """
+        Set current_stock to the net quantity of each product's movements.
+        The products are locked while their movements are summed, so postings
+        wait rather than being overwritten. Returns the number of products changed.
+        """
+        products = cls.objects.all()
+        movements = StockMovement.objects.all()
+        if company:
+            products = products.filter(company=company)
+            movements = movements.filter(company=company)
+        
+        with transaction.atomic():
+            stored = dict(products.select_for_update().values_list('pk', 'current_stock'))
+            
+            # Summed here rather than in SQL, which adds decimals as floats on SQLite
+            expected = dict.fromkeys(stored, Decimal('0'))
+            rows = movements.filter(product__in=list(stored)).values_list('product_id', 'quantity_in', 'quantity_out')
+            for product_id, quantity_in, quantity_out in rows.iterator(chunk_size=2000):
+                expected[product_id] += quantity_in - quantity_out
+            
+            changed = [cls(pk=pk, current_stock=quantity) for pk, quantity in expected.items() if quantity != stored[pk]]
+            cls.objects.bulk_update(changed, ['current_stock'], batch_size=500)
+        return len(changed)
 
 
 class StockInvoice(models.Model):
@@ -256,12 +327,17 @@ class StockInvoice(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = CompanyQuerySet.as_manager()
+    
     class Meta:
         db_table = 'stock_invoices'
         verbose_name = 'Stock Invoice'
         verbose_name_plural = 'Stock Invoices'
         ordering = ['-invoice_date', '-invoice_number']
         unique_together = ['company', 'financial_year', 'invoice_type', 'invoice_number']
+        indexes = [
+            models.Index(fields=['company', 'financial_year', 'invoice_date', 'invoice_number']),
+        ]
     
     def __str__(self):
         return f"{self.get_invoice_type_display()} - {self.invoice_number}"
@@ -269,7 +345,7 @@ class StockInvoice(models.Model):
     def clean(self):
         """Validate stock invoice data"""
         if self.financial_year and self.company:
-            if self.financial_year.company != self.company:
+            if self.financial_year.company_id != self.company_id:
                 raise ValidationError('Financial year must belong to the same company')
         
         if self.invoice_date and self.financial_year:
@@ -277,36 +353,20 @@ class StockInvoice(models.Model):
                 raise ValidationError('Invoice date must be within the financial year period')
     
     def save(self, *args, **kwargs):
-        # Auto-generate invoice number if not provided
-        if not self.invoice_number:
-            self.invoice_number = self._generate_invoice_number()
-        
-        self.clean()
-        super().save(*args, **kwargs)
+        # Number allocation and insert commit or roll back together
+        with transaction.atomic():
+            # Auto-generate invoice number if not provided
+            if not self.invoice_number:
+                self.invoice_number = self._generate_invoice_number()
+            
+            self.clean()
+            super().save(*args, **kwargs)
     
     def _generate_invoice_number(self):
         """Generate unique invoice number per company, year, and type"""
-        # Get the latest invoice number for this combination
-        latest_invoice = StockInvoice.objects.filter(
-            company=self.company,
-            financial_year=self.financial_year,
-            invoice_type=self.invoice_type
-        ).order_by('-invoice_number').first()
-        
-        if latest_invoice:
-            try:
-                # Extract the numeric part from the invoice number
-                # Expected format: PUR-2024-0001, SAL-2024-0001, etc.
-                parts = latest_invoice.invoice_number.split('-')
-                if len(parts) >= 3:
-                    last_number = int(parts[-1])
-                    next_number = last_number + 1
-                else:
-                    next_number = 1
-            except (ValueError, IndexError):
-                next_number = 1
-        else:
-            next_number = 1
+        next_number = DocumentCounter.next_number(
+            self.company_id, self.financial_year_id, f"stock_invoice:{self.invoice_type}"
+        )
         
         # Generate prefix based on invoice type
         prefix_map = {
@@ -326,39 +386,75 @@ class StockInvoice(models.Model):
         # Format: PUR-2024-0001
         return f"{prefix}-{year}-{next_number:04d}"
     
-    def calculate_totals(self):
+    def calculate_totals(self, line_items=None):
         """Calculate and update invoice totals from line items"""
-        line_items = self.line_items.all()
+        if line_items is None:
+            line_items = self.line_items.all()
         
         subtotal = Decimal('0')
         total_gst = Decimal('0')
         
         for item in line_items:
-            subtotal += item.total_value
-            total_gst += item.gst_amount
+            # Totals add up the line amounts as stored, rounded to cents
+            subtotal += item.total_value.quantize(Decimal('0.01'))
+            total_gst += item.gst_amount.quantize(Decimal('0.01'))
         
         self.subtotal = subtotal
         self.total_gst = total_gst
         self.total_amount = subtotal + total_gst
     
-    def update_stock(self):
-        """Update product stock based on invoice type (all invoices are posted immediately)"""
-        for line_item in self.line_items.all():
-            product = line_item.product
-            quantity = line_item.quantity
+    def post_line_items(self, line_items_data, recalculate_from=None):
+        """
+        Insert line items for an invoice that has none, with their stock movements.
+        Amounts are computed in memory, rows are bulk inserted, totals are set once
+        and each product is queued for recalculation once. recalculate_from maps
+        product ids to earlier dates whose movements were removed.
+        """
+        line_items = []
+        for line_number, line_item_data in enumerate(line_items_data, start=1):
+            line_item = StockInvoiceLineItem(stock_invoice=self, **{'line_number': line_number, **line_item_data})
+            line_item.calculate_amounts()
+            line_item.clean()
+            line_items.append(line_item)
+        
+        with transaction.atomic():
+            StockInvoiceLineItem.objects.bulk_create(line_items, batch_size=500)
             
-            # Determine stock movement direction
-            if self.invoice_type in ['purchase', 'import', 'sale_return']:
-                # Increase stock
-                product.current_stock += quantity
-            elif self.invoice_type in ['sale', 'export', 'purchase_return']:
-                # Decrease stock
-                product.current_stock -= quantity
-            elif self.invoice_type == 'adjustment':
-                # Direct adjustment to quantity specified
-                product.current_stock = quantity
+            self.calculate_totals(line_items)
+            self.save(update_fields=['subtotal', 'total_gst', 'total_amount'])
             
-            product.save(update_fields=['current_stock'])
+            StockMovement.bulk_create_from_line_items(self, line_items, recalculate_from)
+        return line_items
+    
+    def replace_line_items(self, line_items_data):
+        """Delete the invoice's line items and movements and post line_items_data instead"""
+        with transaction.atomic():
+            removed, quantities = self._movement_totals()
+            with _bulk_recalculation_scope():
+                self.line_items.all().delete()
+            Product.add_to_stock({product_id: -quantity for product_id, quantity in quantities.items()})
+            return self.post_line_items(line_items_data, recalculate_from=removed)
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            removed, quantities = self._movement_totals()
+            with _bulk_recalculation_scope():
+                result = super().delete(*args, **kwargs)
+            # Later movements of these products no longer include the removed ones
+            PendingStockRecalculation.mark(removed)
+            Product.add_to_stock({product_id: -quantity for product_id, quantity in quantities.items()})
+            StockMovement.invalidate_reports((self.company_id, product_id) for product_id in removed)
+        return result
+    
+    def _movement_totals(self):
+        """Earliest movement date and net quantity per product for this invoice's movements"""
+        dates = {}
+        quantities = defaultdict(Decimal)
+        rows = self.movements.values_list('product_id', 'movement_date', 'quantity_in', 'quantity_out')
+        for product_id, movement_date, quantity_in, quantity_out in rows:
+            dates[product_id] = min(movement_date, dates.get(product_id, movement_date))
+            quantities[product_id] += quantity_in - quantity_out
+        return dates, dict(quantities)
 
 
 class StockInvoiceLineItem(models.Model):
@@ -399,7 +495,7 @@ class StockInvoiceLineItem(models.Model):
         """Validate line item data"""
         # Check that product belongs to same company as invoice
         if self.product and self.stock_invoice:
-            if self.product.company != self.stock_invoice.company:
+            if self.product.company_id != self.stock_invoice.company_id:
                 raise ValidationError('Product must belong to the same company as stock invoice')
         
         # Validate GST rate is reasonable (0-100%)
@@ -414,6 +510,19 @@ class StockInvoiceLineItem(models.Model):
             )['max_line']
             self.line_number = (max_line or 0) + 1
         
+        self.calculate_amounts()
+        self.clean()
+        super().save(*args, **kwargs)
+        
+        # Update parent invoice totals
+        self.stock_invoice.calculate_totals()
+        self.stock_invoice.save(update_fields=['subtotal', 'total_gst', 'total_amount'])
+        
+        # Create stock movement record
+        StockMovement.create_from_line_item(self)
+    
+    def calculate_amounts(self):
+        """Fill in the line amounts from quantity, unit price and GST rate or value"""
         # Calculate values based on what's provided
         if self.gst_rate and not self.gst_value:
             # Calculate GST value from rate
@@ -435,16 +544,6 @@ class StockInvoiceLineItem(models.Model):
         # Legacy compatibility
         self.total_value = self.amount_ex_gst
         self.gst_amount = self.gst_value
-        
-        self.clean()
-        super().save(*args, **kwargs)
-        
-        # Update parent invoice totals
-        self.stock_invoice.calculate_totals()
-        self.stock_invoice.save(update_fields=['subtotal', 'total_gst', 'total_amount'])
-        
-        # Create stock movement record
-        StockMovement.create_from_line_item(self)
     
     @property
     def total_with_gst(self):
@@ -473,6 +572,7 @@ class StockMovement(models.Model):
     movement_type = models.CharField(max_length=20, choices=MOVEMENT_TYPES)
     movement_date = models.DateField()
     reference_number = models.CharField(max_length=100, help_text='Invoice/Document number')
+    posting_sequence = models.PositiveBigIntegerField(default=0, help_text='Posting order within the company and financial year')
     
     # Quantity details
     quantity_in = models.DecimalField(max_digits=15, decimal_places=3, default=Decimal('0'), help_text='Quantity received')
@@ -505,17 +605,24 @@ class StockMovement(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = CompanyQuerySet.as_manager()
+    
     class Meta:
         db_table = 'stock_movements'
         verbose_name = 'Stock Movement'
         verbose_name_plural = 'Stock Movements'
-        ordering = ['movement_date', 'created_at']
+        ordering = ['movement_date', 'posting_sequence']
         indexes = [
-            models.Index(fields=['company', 'product', 'movement_date']),
+            models.Index(fields=['company', 'product', 'movement_date', 'posting_sequence']),
+            models.Index(fields=['company', 'financial_year', 'movement_date', 'posting_sequence']),
             models.Index(fields=['financial_year', 'movement_type']),
-            models.Index(fields=['product', 'movement_date']),
+            models.Index(fields=['product', 'movement_date', 'posting_sequence']),
         ]
     
+    # Fields rewritten when balances are recalculated
+    RECALCULATED_FIELDS = ['balance_quantity', 'balance_value', 'average_cost', 'unit_cost', 'value_out']
+    RECALCULATE_BATCH_SIZE = 500
+    
     def __str__(self):
         return f"{self.product.code} - {self.movement_type} - {self.movement_date}"
     
@@ -525,137 +632,493 @@ class StockMovement(models.Model):
         invoice = line_item.stock_invoice
         product = line_item.product
         
-        # Determine movement direction
-        is_inward = invoice.invoice_type in ['purchase', 'import', 'sale_return']
-        
         # Get previous balance
         last_movement = cls.objects.filter(
             company=invoice.company,
             product=product,
             movement_date__lte=invoice.invoice_date
-        ).order_by('-movement_date', '-created_at').first()
-        
-        prev_balance_qty = last_movement.balance_quantity if last_movement else Decimal('0')
-        prev_balance_value = last_movement.balance_value if last_movement else Decimal('0')
-        prev_avg_cost = last_movement.average_cost if last_movement else Decimal('0')
-        
-        # Calculate new values
-        if is_inward:
-            quantity_in = line_item.quantity
-            quantity_out = Decimal('0')
-            value_in = line_item.amount_ex_gst
-            value_out = Decimal('0')
-            gst_amount_in = line_item.gst_value
-            gst_amount_out = Decimal('0')
-            unit_cost = line_item.unit_price
-            
-            # Calculate average cost (weighted average)
-            new_balance_qty = prev_balance_qty + quantity_in
-            new_balance_value = prev_balance_value + value_in
+        ).order_by('-movement_date', '-posting_sequence').values(
+            'balance_quantity', 'balance_value', 'average_cost'
+        ).first()
+        
+        movement = cls._from_line_item(line_item)
+        movement.roll_forward(cls._running_totals(last_movement))
+        
+        # Sorts after every movement already posted on the same date
+        movement.posting_sequence = DocumentCounter.next_number(
+            invoice.company_id, invoice.financial_year_id, 'stock_movement'
+        )
+        movement.save()
+        Product.add_to_stock({product.id: movement.net_quantity})
+        
+        # Subsequent movements are recalculated when the product is next flushed
+        PendingStockRecalculation.mark({product.id: invoice.invoice_date + timedelta(days=1)})
+        
+        return movement
+    
+    @classmethod
+    def bulk_create_from_line_items(cls, invoice, line_items, recalculate_from=None):
+        """
+        Create the movements for an invoice's saved line items with one bulk_create
+        and queue the later movements of each product for recalculation.
+        recalculate_from maps product ids to an earlier date to recalculate from.
+        """
+        next_day = invoice.invoice_date + timedelta(days=1)
+        product_ids = {line_item.product_id for line_item in line_items}
+        running = cls._running_totals_before(product_ids, next_day)
+        
+        movements = []
+        for line_item in line_items:
+            movement = cls._from_line_item(line_item)
+            running[line_item.product_id] = movement.roll_forward(running[line_item.product_id])
+            movements.append(movement)
+        
+        with transaction.atomic():
+            first_sequence = DocumentCounter.next_number(
+                invoice.company_id, invoice.financial_year_id, 'stock_movement', count=len(movements)
+            )
+            for offset, movement in enumerate(movements):
+                movement.posting_sequence = first_sequence + offset
+            cls.objects.bulk_create(movements, batch_size=500)
             
-            if new_balance_qty > 0:
-                average_cost = new_balance_value / new_balance_qty
-            else:
-                average_cost = unit_cost
-        else:
-            quantity_in = Decimal('0')
-            quantity_out = line_item.quantity
-            value_in = Decimal('0')
-            # Use average cost for outward movements
-            value_out = line_item.quantity * prev_avg_cost if prev_avg_cost > 0 else line_item.amount_ex_gst
-            gst_amount_in = Decimal('0')
-            gst_amount_out = line_item.gst_value
-            unit_cost = prev_avg_cost if prev_avg_cost > 0 else line_item.unit_price
+            quantities = defaultdict(Decimal)
+            for movement in movements:
+                quantities[movement.product_id] += movement.net_quantity
+            Product.add_to_stock(quantities)
             
-            new_balance_qty = prev_balance_qty - quantity_out
-            new_balance_value = prev_balance_value - value_out
-            average_cost = prev_avg_cost
+            stale_from = dict.fromkeys(product_ids, next_day)
+            for product_id, from_date in (recalculate_from or {}).items():
+                stale_from[product_id] = min(from_date, stale_from.get(product_id, from_date))
+            PendingStockRecalculation.mark(stale_from)
+            cls.invalidate_reports((invoice.company_id, product_id) for product_id in stale_from)
+        return movements
+    
+    @classmethod
+    def _from_line_item(cls, line_item):
+        """Unsaved movement for a line item, balances still to be rolled forward"""
+        invoice = line_item.stock_invoice
         
-        # Create movement record
-        movement = cls.objects.create(
-            company=invoice.company,
-            financial_year=invoice.financial_year,
-            product=product,
+        movement = cls(
+            company_id=invoice.company_id,
+            financial_year_id=invoice.financial_year_id,
+            product_id=line_item.product_id,
             movement_type=invoice.invoice_type,
             movement_date=invoice.invoice_date,
             reference_number=invoice.invoice_number,
-            quantity_in=quantity_in,
-            quantity_out=quantity_out,
-            balance_quantity=new_balance_qty,
-            unit_cost=unit_cost,
-            average_cost=average_cost,
-            value_in=value_in,
-            value_out=value_out,
-            balance_value=new_balance_value,
+            # Used as is when there is no average cost to issue at yet
+            unit_cost=line_item.unit_price,
             gst_rate=line_item.gst_rate,
-            gst_amount_in=gst_amount_in,
-            gst_amount_out=gst_amount_out,
-            party=invoice.party,
+            party_id=invoice.party_id,
             stock_invoice=invoice,
             line_item=line_item,
-            created_by=invoice.created_by
+            created_by_id=invoice.created_by_id
         )
         
-        # Update subsequent movements if any
-        cls._recalculate_subsequent_movements(product, invoice.invoice_date, movement.id)
-        
+        # Determine movement direction. Values are rounded as stored, so that
+        # balances rolled forward now match a later recalculation
+        amount = cls._rounded('value_in', line_item.amount_ex_gst)
+        if invoice.invoice_type in ['purchase', 'import', 'sale_return']:
+            movement.quantity_in = line_item.quantity
+            movement.value_in = amount
+            movement.gst_amount_in = cls._rounded('gst_amount_in', line_item.gst_value)
+        else:
+            movement.quantity_out = line_item.quantity
+            movement.value_out = amount
+            movement.gst_amount_out = cls._rounded('gst_amount_out', line_item.gst_value)
         return movement
     
     @classmethod
-    def _recalculate_subsequent_movements(cls, product, from_date, exclude_id=None):
-        """Recalculate all subsequent movements after a change"""
-        movements = cls.objects.filter(
-            product=product,
-            movement_date__gte=from_date
-        ).order_by('movement_date', 'created_at')
+    def _running_totals_before(cls, product_ids, before_date):
+        """Running totals per product left by its last movement dated before before_date"""
+        last_movements = Product.objects.filter(pk__in=product_ids).annotate(
+            last_movement_id=models.Subquery(
+                cls.objects.filter(
+                    product_id=models.OuterRef('pk'),
+                    movement_date__lt=before_date
+                ).order_by('-movement_date', '-posting_sequence').values('pk')[:1]
+            )
+        ).values_list('last_movement_id', flat=True)
         
-        if exclude_id:
-            movements = movements.exclude(id=exclude_id)
+        running = {product_id: cls._running_totals(None) for product_id in product_ids}
+        rows = cls.objects.filter(pk__in=[pk for pk in last_movements if pk]).values(
+            'product_id', 'balance_quantity', 'balance_value', 'average_cost'
+        )
+        for row in rows:
+            running[row['product_id']] = cls._running_totals(row)
+        return running
+    
+    @staticmethod
+    def _running_totals(movement):
+        """Running (quantity, value, average cost) left by a movement values() row"""
+        if not movement:
+            return Decimal('0'), Decimal('0'), Decimal('0')
+        return movement['balance_quantity'], movement['balance_value'], movement['average_cost']
+    
+    def roll_forward(self, running):
+        """
+        Apply this movement to the running (quantity, value, average cost) and
+        store the resulting balances on it. Returns the new running totals,
+        rounded as stored so a recalculation gives the same figures as posting.
+        """
+        running_qty, running_value, running_avg_cost = running
         
-        running_qty = Decimal('0')
-        running_value = Decimal('0')
-        running_avg_cost = Decimal('0')
+        if self.quantity_in > 0:  # Inward movement
+            running_qty += self.quantity_in
+            running_value += self.value_in
+            # Weighted average cost
+            if running_qty > 0:
+                running_avg_cost = running_value / running_qty
+            else:
+                running_avg_cost = self.unit_cost
+        else:  # Outward movement, issued at average cost
+            if running_avg_cost > 0:
+                self.unit_cost = self._rounded('unit_cost', running_avg_cost)
+                self.value_out = self._rounded('value_out', self.quantity_out * running_avg_cost)
+            running_qty -= self.quantity_out
+            running_value -= self.value_out
         
-        # Get the last movement before the from_date
-        prev_movement = cls.objects.filter(
-            product=product,
+        self.balance_quantity = self._rounded('balance_quantity', running_qty)
+        self.balance_value = self._rounded('balance_value', running_value)
+        self.average_cost = self._rounded('average_cost', running_avg_cost)
+        return self.balance_quantity, self.balance_value, self.average_cost
+    
+    @classmethod
+    def _rounded(cls, field_name, value):
+        places = cls._meta.get_field(field_name).decimal_places
+        return value.quantize(Decimal(1).scaleb(-places))
+    
+    @classmethod
+    def recalculate_product(cls, product_id, from_date):
+        """
+        Recompute running balances of a product's movements dated from_date onwards.
+        The range is read in one query, rolled forward in memory and only the rows
+        whose stored values change are written back, in chunks. The product's
+        stock snapshots in the range are refreshed from the same pass.
+        Returns the number of movements updated.
+        """
+        previous = cls.objects.filter(
+            product_id=product_id,
             movement_date__lt=from_date
-        ).order_by('-movement_date', '-created_at').first()
+        ).order_by('-movement_date', '-posting_sequence').values(
+            'movement_date', 'balance_quantity', 'balance_value', 'average_cost'
+        ).first()
+        running = cls._running_totals(previous)
+        
+        # A posting queues the movements after its own date, but the snapshot
+        # at that date includes it, so snapshots are refreshed from the day before
+        snapshots_from = from_date - timedelta(days=1) if from_date > date.min else from_date
+        period_ends = StockSnapshot.period_ends_of(product_id, snapshots_from)
+        balances = []
         
-        if prev_movement:
-            running_qty = prev_movement.balance_quantity
-            running_value = prev_movement.balance_value
-            running_avg_cost = prev_movement.average_cost
+        movements = cls.objects.filter(
+            product_id=product_id,
+            movement_date__gte=from_date
+        ).order_by('movement_date', 'posting_sequence').only(
+            'movement_date', 'quantity_in', 'quantity_out', 'value_in', *cls.RECALCULATED_FIELDS
+        )
         
+        changed = []
+        for movement in movements.iterator(chunk_size=cls.RECALCULATE_BATCH_SIZE):
+            stored = movement._recalculated_values()
+            running = movement.roll_forward(running)
+            if movement._recalculated_values() != stored:
+                changed.append(movement)
+            if period_ends:
+                balances.append((movement.movement_date, *running))
+        
+        cls._write_recalculated(changed)
+        if period_ends:
+            last = (previous['movement_date'], *cls._running_totals(previous)) if previous else None
+            StockSnapshot.refresh_product(product_id, period_ends, balances, last)
+        return len(changed)
+    
+    @classmethod
+    def _write_recalculated(cls, movements):
+        """Write the recalculated fields of changed movements back in batches"""
+        now = timezone.now()
         for movement in movements:
-            if movement.quantity_in > 0:  # Inward movement
-                new_qty = running_qty + movement.quantity_in
-                new_value = running_value + movement.value_in
-                if new_qty > 0:
-                    running_avg_cost = new_value / new_qty
-                running_qty = new_qty
-                running_value = new_value
-            else:  # Outward movement
-                movement.value_out = movement.quantity_out * running_avg_cost
-                running_qty -= movement.quantity_out
-                running_value -= movement.value_out
+            movement.updated_at = now
+        cls.objects.bulk_update(
+            movements, cls.RECALCULATED_FIELDS + ['updated_at'], batch_size=cls.RECALCULATE_BATCH_SIZE
+        )
+    
+    @property
+    def net_quantity(self):
+        """Quantity this movement adds to the product's stock"""
+        return self.quantity_in - self.quantity_out
+    
+    def _recalculated_values(self):
+        return [getattr(self, name) for name in self.RECALCULATED_FIELDS]
+    
+    @staticmethod
+    def report_tags(company_id, product_ids=None):
+        """
+        Report cache tags for all movements of the company, or for single
+        products' movements. Not split by financial year, because balances
+        run on across years.
+        """
+        if product_ids is None:
+            return [ReportCache.tag('stock', company_id)]
+        return [ReportCache.tag('stock', company_id, product_id) for product_id in product_ids]
+    
+    @classmethod
+    def invalidate_reports(cls, movements):
+        """Make cached reports over (company_id, product_id) movements stale"""
+        products = {}
+        for company_id, product_id in movements:
+            products.setdefault(company_id, set()).add(product_id)
+        
+        tags = []
+        for company_id, product_ids in products.items():
+            tags += cls.report_tags(company_id)
+            tags += cls.report_tags(company_id, sorted(product_ids))
+        ReportCache.invalidate(*tags)
+    
+    @staticmethod
+    def recalculation_signals_enabled():
+        """False while a bulk delete queues its own recalculation"""
+        return not _bulk_recalculation.get()
+
+
+class PendingStockRecalculation(models.Model):
+    """
+    Products whose movement balances are out of date from a given date on.
+    Postings and deletions record the earliest stale date; flush() brings each
+    product up to date with one recalculation before its balances are read.
+    """
+    # No database constraint: deleting a product deletes its movements first,
+    # and those deletes queue the product again. flush() clears such rows.
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, db_constraint=False, related_name='pending_recalculation'
+    )
+    dirty_from = models.DateField(help_text='Earliest movement date whose balances are out of date')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'pending_stock_recalculations'
+        verbose_name = 'Pending Stock Recalculation'
+        verbose_name_plural = 'Pending Stock Recalculations'
+    
+    def __str__(self):
+        return f"{self.product_id} from {self.dirty_from}"
+    
+    @classmethod
+    def mark(cls, dirty_from):
+        """Queue products by id -> date, keeping the earliest pending date per product"""
+        if not dirty_from:
+            return
+        
+        by_date = defaultdict(list)
+        for product_id, from_date in dirty_from.items():
+            by_date[from_date].append(product_id)
+        
+        with transaction.atomic():
+            # Lower existing marks first, then add the missing ones, so a mark
+            # removed by a concurrent flush is recreated rather than lost
+            for from_date, product_ids in by_date.items():
+                cls.objects.filter(product_id__in=product_ids, dirty_from__gt=from_date).update(dirty_from=from_date)
+            cls.objects.bulk_create([
+                cls(product_id=product_id, dirty_from=from_date)
+                for product_id, from_date in dirty_from.items()
+            ], ignore_conflicts=True)
+    
+    @classmethod
+    def flush(cls, products=None):
+        """
+        Recalculate each queued product once from its earliest stale date.
+        products limits the flush to a product queryset or list of ids.
+        Returns the number of products recalculated.
+        """
+        pending = cls.objects.all()
+        if products is not None:
+            pending = pending.filter(product__in=products)
+        
+        with transaction.atomic():
+            marks = list(pending.select_for_update().order_by('product_id'))
+            for mark in marks:
+                StockMovement.recalculate_product(mark.product_id, mark.dirty_from)
+            cls.objects.filter(pk__in=[mark.pk for mark in marks]).delete()
+        return len(marks)
+
+
+class StockSnapshot(models.Model):
+    """
+    A product's quantity, value and average cost at a period (month) end, as
+    left by its last movement on or before that date. Stock as of a past date
+    is the nearest snapshot plus the movements after it. The
+    build_stock_snapshots command creates them; recalculate_product keeps
+    the existing period ends current as postings change a product's history.
+    """
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='stock_snapshots')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_snapshots')
+    period_end = models.DateField()
+    
+    quantity = models.DecimalField(max_digits=15, decimal_places=3, default=Decimal('0'))
+    value = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0'))
+    average_cost = models.DecimalField(max_digits=15, decimal_places=4, default=Decimal('0'))
+    last_movement_date = models.DateField(help_text='Date of the movement the figures come from')
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = CompanyQuerySet.as_manager()
+    
+    class Meta:
+        db_table = 'stock_snapshots'
+        verbose_name = 'Stock Snapshot'
+        verbose_name_plural = 'Stock Snapshots'
+        ordering = ['period_end']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'period_end'], name='unique_stock_snapshot')
+        ]
+        indexes = [
+            models.Index(fields=['company', 'period_end']),
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id} at {self.period_end}: {self.quantity}"
+    
+    @staticmethod
+    def period_ends(start, end):
+        """Month ends from the month of start through end"""
+        period_ends = []
+        year, month = start.year, start.month
+        while True:
+            period_end = date(year, month, calendar.monthrange(year, month)[1])
+            if period_end > end:
+                return period_ends
+            period_ends.append(period_end)
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    
+    @classmethod
+    def period_ends_of(cls, product_id, since):
+        """Period ends on or after since that the product's company has snapshots for"""
+        return list(cls.objects.filter(
+            company__products=product_id, period_end__gte=since
+        ).order_by('period_end').values_list('period_end', flat=True).distinct())
+    
+    @classmethod
+    def build(cls, company, through):
+        """
+        Recreate a company's snapshots for every month end through the given
+        date in one pass over its movements. Returns the number of snapshots.
+        """
+        with transaction.atomic():
+            # Balances read here must include queued recalculations
+            PendingStockRecalculation.flush(Product.objects.filter(company=company))
+            
+            movements = StockMovement.objects.filter(company=company, movement_date__lte=through)
+            first_date = movements.aggregate(first_date=models.Min('movement_date'))['first_date']
+            period_ends = cls.period_ends(first_date, through) if first_date else []
             
-            movement.balance_quantity = running_qty
-            movement.balance_value = running_value
-            movement.average_cost = running_avg_cost
-            movement.save(update_fields=['balance_quantity', 'balance_value', 'average_cost', 'value_out'])
+            rows = movements.order_by('product_id', 'movement_date', 'posting_sequence').values_list(
+                'product_id', 'movement_date', 'balance_quantity', 'balance_value', 'average_cost'
+            )
+            snapshots = []
+            for product_id, product_rows in groupby(rows.iterator(chunk_size=2000), key=lambda row: row[0]):
+                balances = [row[1:] for row in product_rows]
+                snapshots += cls._from_balances(company.id, product_id, period_ends, balances)
+            
+            cls.objects.filter(company=company, period_end__lte=through).delete()
+            cls.objects.bulk_create(snapshots, batch_size=1000)
+        return len(snapshots)
+    
+    @classmethod
+    def refresh_product(cls, product_id, period_ends, balances, last=None):
+        """
+        Rewrite a product's snapshots at period_ends from its recalculated
+        balances: (date, quantity, value, average cost) per movement in order,
+        last being the movement before them. A snapshot is added where the
+        product now has movements by the period end and removed where it has none.
+        """
+        company_id = Product.objects.values_list('company_id', flat=True).get(pk=product_id)
+        snapshots = cls._from_balances(company_id, product_id, period_ends, balances, last)
+        
+        with transaction.atomic():
+            cls.objects.filter(product_id=product_id, period_end__in=period_ends).exclude(
+                period_end__in=[snapshot.period_end for snapshot in snapshots]
+            ).delete()
+            cls.objects.bulk_create(
+                snapshots,
+                update_conflicts=True,
+                unique_fields=['product', 'period_end'],
+                update_fields=['quantity', 'value', 'average_cost', 'last_movement_date', 'updated_at']
+            )
+    
+    @classmethod
+    def _from_balances(cls, company_id, product_id, period_ends, balances, last=None):
+        """Unsaved snapshots at the sorted period_ends, taken from the last balance on or before each"""
+        snapshots = []
+        index = 0
+        for balance in balances:
+            while index < len(period_ends) and period_ends[index] < balance[0]:
+                if last:
+                    snapshots.append(cls._from_balance(company_id, product_id, period_ends[index], last))
+                index += 1
+            last = balance
+        if last:
+            snapshots += [
+                cls._from_balance(company_id, product_id, period_end, last)
+                for period_end in period_ends[index:]
+            ]
+        return snapshots
+    
+    @classmethod
+    def _from_balance(cls, company_id, product_id, period_end, balance):
+        movement_date, quantity, value, average_cost = balance
+        return cls(
+            company_id=company_id,
+            product_id=product_id,
+            period_end=period_end,
+            quantity=quantity,
+            value=value,
+            average_cost=average_cost,
+            last_movement_date=movement_date
+        )
 
 
 class StockMovementReport:
     """Helper class for generating stock movement reports with grouping"""
     
+    # Movement field each grouping goes by
+    GROUP_FIELDS = {
+        'product': 'product',
+        'category': 'product__category',
+        'hs_code': 'product__category__hs_code',
+    }
+    
+    # Flat columns read for the detailed report
+    MOVEMENT_ROW_FIELDS = [
+        'id', 'movement_date', 'movement_type', 'reference_number',
+        'product_id', 'product__code', 'product__name',
+        'product__category_id', 'product__category__name',
+        'product__category__hs_code_id', 'product__category__hs_code__code',
+        'product__category__hs_code__description',
+        'quantity_in', 'quantity_out', 'balance_quantity', 'unit_cost', 'average_cost',
+        'value_in', 'value_out', 'balance_value', 'gst_rate', 'gst_amount_in', 'gst_amount_out',
+        'party_id', 'party__name',
+    ]
+    
     def __init__(self, company, financial_year=None):
         self.company = company
         self.financial_year = financial_year
     
-    def get_movements(self, product=None, hs_code=None, category=None, 
-                     date_from=None, date_to=None, movement_type=None):
-        """Get stock movements with optional filters"""
+    def get_movement_rows(self, chunk_size=2000, **filters):
+        """Filtered movements as flat dicts of MOVEMENT_ROW_FIELDS, read in chunks"""
+        return self._filter_movements(**filters).order_by(
+            'movement_date', 'posting_sequence'
+        ).values(*self.MOVEMENT_ROW_FIELDS).iterator(chunk_size=chunk_size)
+    
+    def _filter_movements(self, product=None, hs_code=None, category=None,
+                          date_from=None, date_to=None, movement_type=None):
+        # Balances of the products read here must include queued recalculations
+        products = Product.objects.filter(company=self.company)
+        if product:
+            products = products.filter(pk=product.pk)
+        if hs_code:
+            products = products.filter(category__hs_code=hs_code)
+        if category:
+            products = products.filter(category=category)
+        PendingStockRecalculation.flush(products)
+        
         queryset = StockMovement.objects.filter(company=self.company)
         
         if self.financial_year:
@@ -679,93 +1142,82 @@ class StockMovementReport:
         if movement_type:
             queryset = queryset.filter(movement_type=movement_type)
         
-        return queryset.select_related(
-            'product', 'product__category', 'product__category__hs_code', 
-            'party', 'stock_invoice'
-        ).order_by('movement_date', 'created_at')
-    
-    def get_grouped_report(self, group_by='product', **filters):
-        """Generate grouped stock movement report"""
-        movements = self.get_movements(**filters)
-        
-        if group_by == 'hs_code':
-            return self._group_by_hs_code(movements)
-        elif group_by == 'category':
-            return self._group_by_category(movements)
-        elif group_by == 'product':
-            return self._group_by_product(movements)
-        else:
-            return list(movements)
-    
-    def _group_by_hs_code(self, movements):
-        """Group movements by HS Code"""
-        from collections import defaultdict
-        grouped = defaultdict(list)
-        
-        for movement in movements:
-            hs_code = movement.product.category.hs_code
-            grouped[hs_code].append(movement)
-        
-        return dict(grouped)
+        return queryset
     
-    def _group_by_category(self, movements):
-        """Group movements by Category"""
-        from collections import defaultdict
-        grouped = defaultdict(list)
+    def get_summary_report(self, group_by='product', **filters):
+        """
+        Generate summary report with totals, grouped and summed in the database.
+        Groups come in the order of their first movement and take their final
+        balances from their last one, as when walking the movements in order.
+        """
+        if group_by not in self.GROUP_FIELDS:
+            raise ValueError(f"Summary report cannot be grouped by '{group_by}'")
+        group_field = self.GROUP_FIELDS[group_by]
         
-        for movement in movements:
-            category = movement.product.category
-            grouped[category].append(movement)
+        movements = self._filter_movements(**filters)
+        group_movements = movements.filter(**{group_field: models.OuterRef(group_field)})
+        first_movement = group_movements.order_by('movement_date', 'posting_sequence')
+        last_movement = group_movements.order_by('-movement_date', '-posting_sequence')
         
-        return dict(grouped)
-    
-    def _group_by_product(self, movements):
-        """Group movements by Product"""
-        from collections import defaultdict
-        grouped = defaultdict(list)
+        # Each amount is rounded as read from its column before it is summed
+        summed = {
+            'total_quantity_in': 'quantity_in',
+            'total_quantity_out': 'quantity_out',
+            'total_value_in': 'value_in',
+            'total_value_out': 'value_out',
+            'total_gst_in': 'gst_amount_in',
+            'total_gst_out': 'gst_amount_out',
+        }
+        final = {
+            'final_balance_quantity': 'balance_quantity',
+            'final_balance_value': 'balance_value',
+            'final_average_cost': 'average_cost',
+        }
+        rows = movements.values(group_field).annotate(
+            movement_count=models.Count('id'),
+            first_date=models.Subquery(first_movement.values('movement_date')[:1]),
+            first_sequence=models.Subquery(first_movement.values('posting_sequence')[:1]),
+            **{
+                total: Sum(Round(field, StockMovement._meta.get_field(field).decimal_places))
+                for total, field in summed.items()
+            },
+            **{
+                name: models.Subquery(last_movement.values(field)[:1])
+                for name, field in final.items()
+            }
+        ).order_by('first_date', 'first_sequence')
+        rows = list(rows)
+        for row in rows:
+            for name, field in list(summed.items()) + list(final.items()):
+                row[name] = StockMovement._rounded(field, row[name])
         
-        for movement in movements:
-            product = movement.product
-            grouped[product].append(movement)
+        # Category names include their HS code
+        group_querysets = {
+            'product': Product.objects.all(),
+            'category': Category.objects.select_related('hs_code'),
+            'hs_code': HSCode.objects.all(),
+        }
+        groups = group_querysets[group_by].in_bulk([row[group_field] for row in rows])
         
-        return dict(grouped)
-    
-    def get_summary_report(self, group_by='product', **filters):
-        """Generate summary report with totals"""
-        grouped_movements = self.get_grouped_report(group_by, **filters)
         summary = []
-        
-        for group_key, movements in grouped_movements.items():
-            total_qty_in = sum(m.quantity_in for m in movements)
-            total_qty_out = sum(m.quantity_out for m in movements)
-            total_value_in = sum(m.value_in for m in movements)
-            total_value_out = sum(m.value_out for m in movements)
-            total_gst_in = sum(m.gst_amount_in for m in movements)
-            total_gst_out = sum(m.gst_amount_out for m in movements)
-            
-            # Get final balance from last movement
-            last_movement = movements[-1] if movements else None
-            final_balance_qty = last_movement.balance_quantity if last_movement else 0
-            final_balance_value = last_movement.balance_value if last_movement else 0
-            final_avg_cost = last_movement.average_cost if last_movement else 0
-            
+        for row in rows:
+            group = groups[row[group_field]]
             summary.append({
-                'group': group_key,
-                'group_name': str(group_key),
-                'total_quantity_in': total_qty_in,
-                'total_quantity_out': total_qty_out,
-                'net_quantity': total_qty_in - total_qty_out,
-                'total_value_in': total_value_in,
-                'total_value_out': total_value_out,
-                'net_value': total_value_in - total_value_out,
-                'total_gst_in': total_gst_in,
-                'total_gst_out': total_gst_out,
-                'net_gst': total_gst_in - total_gst_out,
-                'final_balance_quantity': final_balance_qty,
-                'final_balance_value': final_balance_value,
-                'final_average_cost': final_avg_cost,
-                'movement_count': len(movements),
-                'movements': movements
+                'group': group,
+                'group_name': str(group),
+                'total_quantity_in': row['total_quantity_in'],
+                'total_quantity_out': row['total_quantity_out'],
+                'net_quantity': row['total_quantity_in'] - row['total_quantity_out'],
+                'total_value_in': row['total_value_in'],
+                'total_value_out': row['total_value_out'],
+                'net_value': row['total_value_in'] - row['total_value_out'],
+                'total_gst_in': row['total_gst_in'],
+                'total_gst_out': row['total_gst_out'],
+                'net_gst': row['total_gst_in'] - row['total_gst_out'],
+                'final_balance_quantity': row['final_balance_quantity'],
+                'final_balance_value': row['final_balance_value'],
+                'final_average_cost': row['final_average_cost'],
+                'movement_count': row['movement_count']
             })
         
-        return summary
\ No newline at end of file
+        return summary
@@ -1,3 +1,4 @@
+from django.db import models, transaction
 from rest_framework import serializers
 from decimal import Decimal
 from .models import Party, HSCode, Category, Product, StockInvoice, StockInvoiceLineItem
@@ -84,9 +85,8 @@ class CategorySerializer(serializers.ModelSerializer):
     
     def validate(self, attrs):
         # Validate HS Code belongs to current company
-        user = self.context['request'].user
         try:
-            user_activity = UserActivity.objects.get(user=user)
+            user_activity = self.context['request'].tenant.get_activity()
             if not user_activity.current_company:
                 raise serializers.ValidationError(
                     'No company activated. Please activate a company first.'
@@ -130,9 +130,8 @@ class ProductSerializer(serializers.ModelSerializer):
     
     def validate(self, attrs):
         # Validate category belongs to current company
-        user = self.context['request'].user
         try:
-            user_activity = UserActivity.objects.get(user=user)
+            user_activity = self.context['request'].tenant.get_activity()
             if not user_activity.current_company:
                 raise serializers.ValidationError(
                     'No company activated. Please activate a company first.'
@@ -152,10 +151,55 @@ class ProductSerializer(serializers.ModelSerializer):
         return attrs
 
 
+class PreloadedProductField(serializers.PrimaryKeyRelatedField):
+    """
+    Product reference that resolves from products preloaded by the list
+    serializer and falls back to a per-value lookup otherwise.
+    """
+    def preload(self, product_ids):
+        self._preloaded = self.get_queryset().in_bulk(product_ids)
+    
+    def to_internal_value(self, data):
+        preloaded = getattr(self, '_preloaded', None)
+        if preloaded is not None and not isinstance(data, bool):
+            try:
+                return preloaded[int(data)]
+            except (KeyError, TypeError, ValueError):
+                pass
+        return super().to_internal_value(data)
+
+
+class StockInvoiceLineItemListSerializer(serializers.ListSerializer):
+    """
+    Line item list that loads all referenced products with one query on input
+    and reads line items together with their products on output.
+    """
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            product_ids = set()
+            for item in data:
+                if isinstance(item, dict):
+                    try:
+                        product_ids.add(int(item.get('product')))
+                    except (TypeError, ValueError):
+                        continue
+            self.child.fields['product'].preload(product_ids)
+        return super().to_internal_value(data)
+    
+    def to_representation(self, data):
+        if isinstance(data, models.Manager):
+            data = data.all()
+            # Prefetched line items already carry their products
+            if data._result_cache is None:
+                data = data.select_related('product')
+        return super().to_representation(data)
+
+
 class StockInvoiceLineItemSerializer(serializers.ModelSerializer):
     """
     Serializer for StockInvoiceLineItem model.
     """
+    product = PreloadedProductField(queryset=Product.objects.all())
     product_code = serializers.CharField(source='product.code', read_only=True)
     product_name = serializers.CharField(source='product.name', read_only=True)
     product_unit = serializers.CharField(source='product.unit_of_measure', read_only=True)
@@ -173,6 +217,7 @@ class StockInvoiceLineItemSerializer(serializers.ModelSerializer):
             'id', 'line_number', 'amount_ex_gst', 'amount_inc_gst', 'total_value', 
             'gst_amount', 'created_at', 'updated_at'
         ]
+        list_serializer_class = StockInvoiceLineItemListSerializer
     
     def validate(self, attrs):
         quantity = attrs.get('quantity', Decimal('0'))
@@ -224,11 +269,9 @@ class StockInvoiceSerializer(serializers.ModelSerializer):
         ]
     
     def validate(self, attrs):
-        user = self.context['request'].user
-        
         # Get user's current activity for validation
         try:
-            user_activity = UserActivity.objects.get(user=user)
+            user_activity = self.context['request'].tenant.get_activity()
             if not user_activity.current_company:
                 raise serializers.ValidationError(
                     'No company activated. Please activate a company first.'
@@ -253,25 +296,26 @@ class StockInvoiceSerializer(serializers.ModelSerializer):
         # Validate all products belong to current company
         for item_data in line_items_data:
             product = item_data.get('product')
-            if product and product.company != user_activity.current_company:
+            if product and product.company_id != user_activity.current_company_id:
                 raise serializers.ValidationError({
                     'line_items': f'Product {product.code} - {product.name} does not belong to the current company.'
                 })
         
         return attrs
     
+    @transaction.atomic
     def create(self, validated_data):
         line_items_data = validated_data.pop('line_items')
         validated_data['created_by'] = self.context['request'].user
         
         stock_invoice = StockInvoice.objects.create(**validated_data)
         
-        # Create line items
-        for line_item_data in line_items_data:
-            StockInvoiceLineItem.objects.create(stock_invoice=stock_invoice, **line_item_data)
+        # Create line items and their stock movements
+        stock_invoice.post_line_items(line_items_data)
         
         return stock_invoice
     
+    @transaction.atomic
     def update(self, instance, validated_data):
         line_items_data = validated_data.pop('line_items', None)
         
@@ -282,12 +326,8 @@ class StockInvoiceSerializer(serializers.ModelSerializer):
         
         # Update line items if provided
         if line_items_data is not None:
-            # Delete existing line items
-            instance.line_items.all().delete()
-            
-            # Create new line items
-            for line_item_data in line_items_data:
-                StockInvoiceLineItem.objects.create(stock_invoice=instance, **line_item_data)
+            # Replace existing line items and their stock movements
+            instance.replace_line_items(line_items_data)
         
         return instance
 
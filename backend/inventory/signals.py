@@ -0,0 +1,43 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from common.report_cache import ReportCache
+from .models import Party, HSCode, Category, Product, StockMovement, PendingStockRecalculation
+
+
+@receiver(post_delete, sender=StockMovement)
+def queue_recalculation_on_movement_delete(sender, instance, **kwargs):
+    """Neither later movements nor the product's stock include the deleted one any more"""
+    if not StockMovement.recalculation_signals_enabled():
+        return
+    
+    PendingStockRecalculation.mark({instance.product_id: instance.movement_date})
+    Product.add_to_stock({instance.product_id: -instance.net_quantity})
+
+
+@receiver(post_save, sender=StockMovement)
+def invalidate_reports_on_movement_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    
+    StockMovement.invalidate_reports([(instance.company_id, instance.product_id)])
+
+
+@receiver(post_delete, sender=StockMovement)
+def invalidate_reports_on_movement_delete(sender, instance, **kwargs):
+    if not StockMovement.recalculation_signals_enabled():
+        return
+    
+    StockMovement.invalidate_reports([(instance.company_id, instance.product_id)])
+
+
+@receiver(post_save, sender=Party)
+@receiver(post_delete, sender=Party)
+@receiver(post_save, sender=HSCode)
+@receiver(post_delete, sender=HSCode)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_reports_on_catalog_change(sender, instance, **kwargs):
+    """Stock reports show names and codes from these rows"""
+    ReportCache.invalidate(*Product.report_tags(instance.company_id))
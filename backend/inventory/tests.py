@@ -1,3 +1,364 @@
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+from django.core.management import call_command
 from django.test import TestCase
+from rest_framework.test import APIClient
+from common.models import User, Company, FinancialYear, UserActivity
+from .models import (
+    HSCode, Category, Product, Party, StockInvoice, StockMovement, StockMovementReport,
+    PendingStockRecalculation, StockSnapshot
+)
 
-# Create your tests here.
+
+class InventoryTestMixin:
+    """Company, financial year, two products and a party shared by the tests below"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Test Company', address_line_1='Street 1', city='Lahore', province='punjab')
+        cls.financial_year = FinancialYear.objects.create(
+            company=cls.company, name='FY 2024-25', start_date=date(2024, 7, 1), end_date=date(2025, 6, 30)
+        )
+        hs_code = HSCode.objects.create(company=cls.company, code='8471.30.00', description='Computers')
+        category = Category.objects.create(company=cls.company, hs_code=hs_code, name='Hardware')
+        cls.laptop = Product.objects.create(company=cls.company, category=category, code='LAP', name='Laptop')
+        cls.monitor = Product.objects.create(company=cls.company, category=category, code='MON', name='Monitor')
+        cls.party = Party.objects.create(company=cls.company, name='Supplier')
+    
+    def api_client(self):
+        """Client for a user with the company and financial year activated"""
+        user = User.objects.create_user(email='user@example.com', password='secret', first_name='Test', last_name='User')
+        UserActivity.objects.create(user=user, current_company=self.company, current_financial_year=self.financial_year)
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+    
+    def post_invoice(self, invoice_type, invoice_date, lines):
+        """Post an invoice with (product, quantity, unit price) lines"""
+        invoice = StockInvoice.objects.create(
+            company=self.company, financial_year=self.financial_year,
+            invoice_type=invoice_type, invoice_date=invoice_date, party=self.party
+        )
+        invoice.post_line_items([
+            {'product': product, 'quantity': Decimal(quantity), 'unit_price': Decimal(unit_price), 'gst_rate': Decimal('17')}
+            for product, quantity, unit_price in lines
+        ])
+        return invoice
+
+
+class StockRecalculationTests(InventoryTestMixin, TestCase):
+    
+    def balances(self):
+        return list(StockMovement.objects.order_by('product_id', 'movement_date', 'posting_sequence').values_list(
+            'id', *StockMovement.RECALCULATED_FIELDS
+        ))
+    
+    def test_incremental_recalculation_matches_a_full_rebuild(self):
+        # Posted out of date order, so most postings leave later movements stale
+        self.post_invoice('purchase', date(2024, 9, 1), [(self.laptop, '10', '1000.00'), (self.monitor, '4', '250.00')])
+        self.post_invoice('sale', date(2024, 9, 20), [(self.laptop, '3', '1500.00')])
+        self.post_invoice('purchase', date(2024, 8, 15), [(self.laptop, '5', '900.00')])
+        sale = self.post_invoice('sale', date(2024, 9, 5), [(self.laptop, '4', '1400.00'), (self.monitor, '1', '400.00')])
+        self.post_invoice('sale_return', date(2024, 9, 25), [(self.laptop, '1', '1500.00')])
+        self.post_invoice('purchase', date(2024, 8, 20), [(self.monitor, '6', '230.00')])
+        removed = self.post_invoice('purchase', date(2024, 9, 10), [(self.laptop, '2', '1100.00')])
+        
+        sale.replace_line_items([{'product': self.laptop, 'quantity': Decimal('6'), 'unit_price': Decimal('1450.00'), 'gst_rate': Decimal('17')}])
+        removed.delete()
+        PendingStockRecalculation.flush()
+        incremental = self.balances()
+        
+        # Wipe the running balances and rebuild each product from its first movement
+        StockMovement.objects.update(balance_quantity=0, balance_value=0, average_cost=0)
+        for product in (self.laptop, self.monitor):
+            StockMovement.recalculate_product(product.id, date.min)
+        
+        self.assertEqual(incremental, self.balances())
+        last_laptop_movement = StockMovement.objects.filter(product=self.laptop).order_by('movement_date', 'posting_sequence').last()
+        self.assertEqual(last_laptop_movement.balance_quantity, Decimal('7'))
+        self.assertEqual(Product.objects.get(pk=self.laptop.pk).current_stock, Decimal('7'))
+    
+    def test_recalculation_writes_only_changed_rows(self):
+        self.post_invoice('purchase', date(2024, 8, 1), [(self.laptop, '10', '1000.00')])
+        self.post_invoice('sale', date(2024, 8, 10), [(self.laptop, '2', '1500.00')])
+        PendingStockRecalculation.flush()
+        
+        self.assertEqual(StockMovement.recalculate_product(self.laptop.id, date.min), 0)
+        
+        StockMovement.objects.filter(movement_type='sale').update(balance_quantity=0)
+        written_before = dict(StockMovement.objects.values_list('movement_type', 'updated_at'))
+        self.assertEqual(StockMovement.recalculate_product(self.laptop.id, date.min), 1)
+        
+        written_after = dict(StockMovement.objects.values_list('movement_type', 'updated_at'))
+        self.assertEqual(written_after['purchase'], written_before['purchase'])
+        self.assertGreater(written_after['sale'], written_before['sale'])
+        self.assertEqual(StockMovement.objects.get(movement_type='sale').balance_quantity, Decimal('8'))
+
+
+class InvoicePostingQueryTests(InventoryTestMixin, TestCase):
+    
+    def post(self, lines):
+        invoice = StockInvoice.objects.create(
+            company=self.company, financial_year=self.financial_year,
+            invoice_type='purchase', invoice_date=date(2024, 9, 1), party=self.party
+        )
+        invoice.post_line_items([
+            {'product': product, 'quantity': Decimal('1'), 'unit_price': Decimal('100.00'), 'gst_rate': Decimal('17')}
+            for product in lines
+        ])
+        return invoice
+    
+    def test_posting_query_count_grows_only_with_insert_batches(self):
+        self.post([self.laptop, self.monitor])
+        
+        # Lines and movements are bulk inserted and each product is queued for
+        # recalculation once; 200 lines only add insert batches (SQLite limits
+        # the variables per statement), 2 for the lines and 4 for the movements
+        with self.assertNumQueries(28):
+            self.post([self.laptop, self.monitor])
+        with self.assertNumQueries(34):
+            invoice = self.post([self.laptop, self.monitor] * 100)
+        
+        self.assertEqual(invoice.line_items.count(), 200)
+        self.assertEqual(invoice.total_amount, Decimal('23400.00'))
+        self.assertEqual(Product.objects.get(pk=self.laptop.pk).current_stock, Decimal('102'))
+        last = StockMovement.objects.filter(product=self.monitor).order_by('movement_date', 'posting_sequence').last()
+        self.assertEqual((last.balance_quantity, last.balance_value), (Decimal('102'), Decimal('10200.00')))
+
+
+class CurrentStockReconciliationTests(InventoryTestMixin, TestCase):
+    
+    def test_command_corrects_drifted_stock(self):
+        self.post_invoice('purchase', date(2024, 8, 1), [(self.laptop, '10', '1000.00'), (self.monitor, '5', '250.00')])
+        self.post_invoice('sale', date(2024, 8, 10), [(self.laptop, '4', '1500.00')])
+        Product.objects.filter(pk=self.laptop.pk).update(current_stock=Decimal('99'))
+        
+        output = StringIO()
+        call_command('reconcile_current_stock', stdout=output)
+        
+        self.assertIn('Corrected current stock of 1 products in 1 companies', output.getvalue())
+        self.assertEqual(
+            dict(Product.objects.values_list('code', 'current_stock')),
+            {'LAP': Decimal('6'), 'MON': Decimal('5')}
+        )
+        self.assertEqual(Product.rebuild_current_stock(self.company), 0)
+
+
+class StockValuationReportTests(InventoryTestMixin, TestCase):
+    
+    def setUp(self):
+        self.client = self.api_client()
+        hs_code = HSCode.objects.create(company=self.company, code='8528.52.00', description='Monitors')
+        displays = Category.objects.create(company=self.company, hs_code=hs_code, name='Displays')
+        self.projector = Product.objects.create(
+            company=self.company, category=displays, code='PRJ', name='Projector', cost_price=Decimal('333.33')
+        )
+        Product.objects.filter(pk=self.projector.pk).update(current_stock=Decimal('3'))
+        
+        # Average costs with more decimals than cents
+        self.post_invoice('purchase', date(2024, 8, 1), [(self.laptop, '3', '1000.01'), (self.monitor, '7', '249.99')])
+        self.post_invoice('purchase', date(2024, 8, 5), [(self.laptop, '4', '1099.99'), (self.monitor, '2.5', '251.37')])
+        self.post_invoice('sale', date(2024, 8, 9), [(self.laptop, '1.75', '1500.00'), (self.monitor, '0.333', '400.00')])
+    
+    def valuation(self, **params):
+        response = self.client.get('/api/inventory/reports/stock-valuation/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['data']
+    
+    def per_product_totals(self, group_field):
+        """Group totals added up product by product, as the report used to"""
+        totals = {}
+        for product in Product.objects.filter(company=self.company, is_active=True, current_stock__gt=0).select_related('category'):
+            last = product.stock_movements_detailed.order_by('-movement_date', '-posting_sequence').first()
+            average_cost = last.average_cost if last else product.cost_price
+            key = getattr(product.category, group_field)
+            totals[key] = totals.get(key, Decimal('0')) + product.current_stock * average_cost
+        return totals
+    
+    def test_category_totals_match_per_product_totals(self):
+        data = self.valuation(group_by='category')
+        expected = self.per_product_totals('id')
+        
+        self.assertEqual({item['category_id']: item['product_count'] for item in data['items']}, {
+            self.laptop.category_id: 2, self.projector.category_id: 1
+        })
+        self.assertEqual(set(expected), {item['category_id'] for item in data['items']})
+        for item in data['items']:
+            # Only the per-product rounding to cents may differ
+            self.assertAlmostEqual(item['total_stock_value'], float(expected[item['category_id']]), delta=0.01)
+        self.assertAlmostEqual(data['total_stock_value'], float(sum(expected.values())), delta=0.02)
+    
+    def test_hs_code_totals_match_the_product_report(self):
+        by_hs_code = self.valuation(group_by='hs_code')
+        by_product = self.valuation(group_by='product')
+        expected = self.per_product_totals('hs_code_id')
+        
+        for item in by_hs_code['items']:
+            self.assertAlmostEqual(item['total_stock_value'], float(expected[item['hs_code_id']]), delta=0.01)
+            self.assertAlmostEqual(item['total_stock_value'], sum(
+                round(product['stock_value'], 2) for product in by_product['items'] if product['hs_code'] == item['hs_code']
+            ), places=6)
+        self.assertEqual(sum(item['product_count'] for item in by_hs_code['items']), 3)
+
+
+class StockMovementSummaryTests(InventoryTestMixin, TestCase):
+    
+    def setUp(self):
+        hs_code = HSCode.objects.create(company=self.company, code='8528.52.00', description='Monitors')
+        displays = Category.objects.create(company=self.company, hs_code=hs_code, name='Displays')
+        accessories = Category.objects.create(company=self.company, hs_code=hs_code, name='Accessories')
+        self.projector = Product.objects.create(company=self.company, category=displays, code='PRJ', name='Projector')
+        self.cable = Product.objects.create(company=self.company, category=accessories, code='CBL', name='Cable')
+        
+        # Posted out of date order, with amounts that do not round evenly
+        self.post_invoice('purchase', date(2024, 8, 5), [(self.projector, '2', '333.33'), (self.laptop, '4', '1099.99')])
+        self.post_invoice('purchase', date(2024, 8, 1), [(self.laptop, '3', '1000.01'), (self.monitor, '7', '249.99')])
+        self.post_invoice('sale', date(2024, 8, 9), [(self.laptop, '1.75', '1500.00'), (self.monitor, '0.333', '400.00')])
+        self.post_invoice('purchase', date(2024, 8, 9), [(self.cable, '12.5', '3.33'), (self.monitor, '2.5', '251.37')])
+        self.post_invoice('sale_return', date(2024, 8, 20), [(self.laptop, '0.25', '1500.00')])
+        self.post_invoice('sale', date(2024, 9, 2), [(self.projector, '1', '500.00'), (self.cable, '3', '10.00')])
+        self.report = StockMovementReport(self.company, self.financial_year)
+    
+    def python_summary(self, group_by, date_from=None, date_to=None):
+        """Group totals from walking the movements in order, as the report used to"""
+        movements = StockMovement.objects.filter(company=self.company, financial_year=self.financial_year)
+        if date_from:
+            movements = movements.filter(movement_date__gte=date_from)
+        if date_to:
+            movements = movements.filter(movement_date__lte=date_to)
+        
+        grouped = {}
+        for movement in movements.select_related('product__category__hs_code').order_by('movement_date', 'posting_sequence'):
+            group = {
+                'product': movement.product,
+                'category': movement.product.category,
+                'hs_code': movement.product.category.hs_code,
+            }[group_by]
+            grouped.setdefault(group, []).append(movement)
+        
+        summary = []
+        for group, group_movements in grouped.items():
+            totals = {
+                name: sum(getattr(movement, field) for movement in group_movements)
+                for name, field in (
+                    ('total_quantity_in', 'quantity_in'), ('total_quantity_out', 'quantity_out'),
+                    ('total_value_in', 'value_in'), ('total_value_out', 'value_out'),
+                    ('total_gst_in', 'gst_amount_in'), ('total_gst_out', 'gst_amount_out'),
+                )
+            }
+            last = group_movements[-1]
+            summary.append({
+                'group': group,
+                'group_name': str(group),
+                **totals,
+                'net_quantity': totals['total_quantity_in'] - totals['total_quantity_out'],
+                'net_value': totals['total_value_in'] - totals['total_value_out'],
+                'net_gst': totals['total_gst_in'] - totals['total_gst_out'],
+                'final_balance_quantity': last.balance_quantity,
+                'final_balance_value': last.balance_value,
+                'final_average_cost': last.average_cost,
+                'movement_count': len(group_movements),
+            })
+        return summary
+    
+    def assertMatchesPythonSummary(self, group_by, **filters):
+        summary = self.report.get_summary_report(group_by, **filters)
+        expected = self.python_summary(group_by, **filters)
+        self.assertEqual(summary, expected)
+        # Same places as the columns, not only equal values
+        for row in summary:
+            self.assertEqual(str(row['total_value_in']), str(row['total_value_in'].quantize(Decimal('0.01'))))
+        return summary
+    
+    def test_grouped_by_product(self):
+        summary = self.assertMatchesPythonSummary('product')
+        self.assertEqual([row['group'] for row in summary], [self.laptop, self.monitor, self.projector, self.cable])
+    
+    def test_grouped_by_category(self):
+        summary = self.assertMatchesPythonSummary('category')
+        self.assertEqual([row['group_name'] for row in summary], [
+            str(self.laptop.category), str(self.projector.category), str(self.cable.category)
+        ])
+    
+    def test_grouped_by_hs_code(self):
+        summary = self.assertMatchesPythonSummary('hs_code')
+        self.assertEqual([row['movement_count'] for row in summary], [7, 4])
+    
+    def test_date_range_takes_final_balances_from_the_last_movement_in_range(self):
+        for group_by in ('product', 'category', 'hs_code'):
+            self.assertMatchesPythonSummary(group_by, date_from=date(2024, 8, 5), date_to=date(2024, 8, 20))
+    
+    def test_unknown_grouping_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.report.get_summary_report('party')
+
+
+class StockSnapshotTests(InventoryTestMixin, TestCase):
+    
+    def setUp(self):
+        self.client = self.api_client()
+        self.post_invoice('purchase', date(2024, 8, 5), [(self.laptop, '10', '1000.00'), (self.monitor, '8', '250.00')])
+        self.post_invoice('sale', date(2024, 8, 31), [(self.laptop, '2', '1500.00')])
+        self.post_invoice('purchase', date(2024, 9, 12), [(self.laptop, '6', '1100.00')])
+        self.removed = self.post_invoice('sale', date(2024, 9, 30), [(self.monitor, '3', '400.00')])
+        self.post_invoice('sale', date(2024, 10, 15), [(self.laptop, '5', '1500.00'), (self.monitor, '1', '400.00')])
+        self.post_invoice('purchase', date(2024, 11, 3), [(self.monitor, '4', '260.00')])
+        call_command('build_stock_snapshots', '--through', '2024-10-31', stdout=StringIO())
+    
+    def rebuilt_from_history(self, as_of):
+        """(quantity, average cost) per product code, replaying every movement from the first"""
+        PendingStockRecalculation.flush()
+        for product in (self.laptop, self.monitor):
+            StockMovement.recalculate_product(product.id, date.min)
+        result = {}
+        for movement in StockMovement.objects.filter(movement_date__lte=as_of).select_related('product'):
+            quantity, _ = result.get(movement.product.code, (Decimal('0'), None))
+            result[movement.product.code] = (quantity + movement.quantity_in - movement.quantity_out, movement.average_cost)
+        return result
+    
+    def valuation(self, as_of):
+        response = self.client.get('/api/inventory/reports/stock-valuation/', {'as_of': as_of, 'include_zero_stock': 'true'})
+        self.assertEqual(response.status_code, 200)
+        return {
+            item['product_code']: (Decimal(str(item['current_stock'])), Decimal(str(item['average_cost'])))
+            for item in response.json()['data']['items'] if item['last_movement_date']
+        }
+    
+    def snapshot_table(self):
+        return list(StockSnapshot.objects.order_by('product_id', 'period_end').values_list(
+            'product_id', 'period_end', 'quantity', 'value', 'average_cost', 'last_movement_date'
+        ))
+    
+    def test_command_builds_month_end_snapshots(self):
+        self.assertEqual(
+            list(StockSnapshot.objects.filter(product=self.laptop).values_list('period_end', 'quantity')),
+            [(date(2024, 8, 31), Decimal('8')), (date(2024, 9, 30), Decimal('14')), (date(2024, 10, 31), Decimal('9'))]
+        )
+        self.assertFalse(StockSnapshot.objects.filter(period_end__gt=date(2024, 10, 31)).exists())
+    
+    def test_as_of_matches_a_rebuild_from_movement_history(self):
+        for as_of in ['2024-08-04', '2024-08-20', '2024-08-31', '2024-09-30', '2024-10-20', '2024-11-30']:
+            expected = self.rebuilt_from_history(date.fromisoformat(as_of))
+            self.assertEqual(self.valuation(as_of), {
+                code: (quantity, average_cost.quantize(Decimal('0.0001'))) for code, (quantity, average_cost) in expected.items()
+            }, as_of)
+    
+    def test_snapshots_follow_backdated_postings_and_deletions(self):
+        self.post_invoice('purchase', date(2024, 8, 31), [(self.monitor, '5', '240.00')])
+        self.removed.delete()
+        self.post_invoice('sale', date(2024, 10, 1), [(self.laptop, '1', '1500.00')])
+        
+        # Reading a valuation flushes the queued recalculations, which refresh the snapshots
+        self.valuation('2024-10-31')
+        kept_current = self.snapshot_table()
+        call_command('build_stock_snapshots', '--through', '2024-10-31', stdout=StringIO())
+        self.assertEqual(kept_current, self.snapshot_table())
+        self.assertEqual(
+            StockSnapshot.objects.get(product=self.monitor, period_end=date(2024, 9, 30)).quantity, Decimal('13')
+        )
+    
+    def test_as_of_reads_the_nearest_snapshot(self):
+        # Nothing moves between the September snapshot and as_of, so its figures are used as stored
+        StockSnapshot.objects.filter(product=self.monitor, period_end=date(2024, 9, 30)).update(quantity=Decimal('42'))
+        self.assertEqual(self.valuation('2024-10-10')['MON'][0], Decimal('42'))
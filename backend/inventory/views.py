@@ -5,8 +5,12 @@ from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models import Q, F
 from django.db import models
 from common.utils import APIResponse
+from common.report_cache import ReportCache
 from common.models import UserActivity
-from .models import Party, HSCode, Category, Product, StockInvoice, StockInvoiceLineItem, StockMovement, StockMovementReport
+from .models import (
+    Party, HSCode, Category, Product, StockInvoice, StockInvoiceLineItem, StockMovement, StockMovementReport,
+    PendingStockRecalculation, StockSnapshot
+)
 from .serializers import (
     PartySerializer, PartyListSerializer, HSCodeSerializer, CategorySerializer, 
     ProductSerializer, ProductListSerializer, StockInvoiceSerializer, 
@@ -27,17 +31,7 @@ class PartyListCreateView(generics.ListCreateAPIView):
     ordering = ['name']
     
     def get_queryset(self):
-        user = self.request.user
-        try:
-            user_activity = UserActivity.objects.get(user=user)
-            if not user_activity.current_company:
-                return Party.objects.none()
-            
-            return Party.objects.filter(
-                company=user_activity.current_company
-            ).select_related('company', 'created_by')
-        except UserActivity.DoesNotExist:
-            return Party.objects.none()
+        return Party.objects.for_tenant(self.request.tenant).select_related('company', 'created_by')
     
     def list(self, request, *args, **kwargs):
         try:
@@ -55,7 +49,7 @@ class PartyListCreateView(generics.ListCreateAPIView):
     def perform_create(self, serializer):
         user = self.request.user
         try:
-            user_activity = UserActivity.objects.get(user=user)
+            user_activity = self.request.tenant.get_activity()
             if not user_activity.current_company:
                 raise ValueError('No company activated. Please activate a company first.')
             
@@ -88,17 +82,7 @@ class PartyDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = PartySerializer
     
     def get_queryset(self):
-        user = self.request.user
-        try:
-            user_activity = UserActivity.objects.get(user=user)
-            if not user_activity.current_company:
-                return Party.objects.none()
-            
-            return Party.objects.filter(
-                company=user_activity.current_company
-            ).select_related('company', 'created_by')
-        except UserActivity.DoesNotExist:
-            return Party.objects.none()
+        return Party.objects.for_tenant(self.request.tenant).select_related('company', 'created_by')
     
     def retrieve(self, request, *args, **kwargs):
         try:
@@ -160,17 +144,7 @@ class HSCodeListCreateView(generics.ListCreateAPIView):
     ordering = ['code']
     
     def get_queryset(self):
-        user = self.request.user
-        try:
-            user_activity = UserActivity.objects.get(user=user)
-            if not user_activity.current_company:
-                return HSCode.objects.none()
-            
-            return HSCode.objects.filter(
-                company=user_activity.current_company
-            ).select_related('company', 'created_by')
-        except UserActivity.DoesNotExist:
-            return HSCode.objects.none()
+        return HSCode.objects.for_tenant(self.request.tenant).select_related('company', 'created_by')
     
     def list(self, request, *args, **kwargs):
         try:
@@ -188,7 +162,7 @@ class HSCodeListCreateView(generics.ListCreateAPIView):
     def perform_create(self, serializer):
         user = self.request.user
         try:
-            user_activity = UserActivity.objects.get(user=user)
+            user_activity = self.request.tenant.get_activity()
             if not user_activity.current_company:
                 raise ValueError('No company activated. Please activate a company first.')
             
@@ -221,17 +195,7 @@ class HSCodeDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = HSCodeSerializer
     
     def get_queryset(self):
-        user = self.request.user
-        try:
-            user_activity = UserActivity.objects.get(user=user)
-            if not user_activity.current_company:
-                return HSCode.objects.none()
-            
-            return HSCode.objects.filter(
-                company=user_activity.current_company
-            ).select_related('company', 'created_by')
-        except UserActivity.DoesNotExist:
-            return HSCode.objects.none()
+        return HSCode.objects.for_tenant(self.request.tenant).select_related('company', 'created_by')
     
     def retrieve(self, request, *args, **kwargs):
         try:
@@ -293,17 +257,7 @@ class CategoryListCreateView(generics.ListCreateAPIView):
     ordering = ['name']
     
     def get_queryset(self):
-        user = self.request.user
-        try:
-            user_activity = UserActivity.objects.get(user=user)
-            if not user_activity.current_company:
-                return Category.objects.none()
-            
-            return Category.objects.filter(
-                company=user_activity.current_company
-            ).select_related('company', 'hs_code', 'created_by')
-        except UserActivity.DoesNotExist:
-            return Category.objects.none()
+        return Category.objects.for_tenant(self.request.tenant).select_related('company', 'hs_code', 'created_by')
     
     def list(self, request, *args, **kwargs):
         try:
@@ -321,7 +275,7 @@ class CategoryListCreateView(generics.ListCreateAPIView):
     def perform_create(self, serializer):
         user = self.request.user
         try:
-            user_activity = UserActivity.objects.get(user=user)
+            user_activity = self.request.tenant.get_activity()
             if not user_activity.current_company:
                 raise ValueError('No company activated. Please activate a company first.')
             
@@ -354,17 +308,7 @@ class CategoryDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = CategorySerializer
     
     def get_queryset(self):
-        user = self.request.user
-        try:
-            user_activity = UserActivity.objects.get(user=user)
-            if not user_activity.current_company:
-                return Category.objects.none()
-            
-            return Category.objects.filter(
-                company=user_activity.current_company
-            ).select_related('company', 'hs_code', 'created_by')
-        except UserActivity.DoesNotExist:
-            return Category.objects.none()
+        return Category.objects.for_tenant(self.request.tenant).select_related('company', 'hs_code', 'created_by')
     
     def retrieve(self, request, *args, **kwargs):
         try:
@@ -426,17 +370,7 @@ class ProductListCreateView(generics.ListCreateAPIView):
     ordering = ['code']
     
     def get_queryset(self):
-        user = self.request.user
-        try:
-            user_activity = UserActivity.objects.get(user=user)
-            if not user_activity.current_company:
-                return Product.objects.none()
-            
-            return Product.objects.filter(
-                company=user_activity.current_company
-            ).select_related('company', 'category', 'created_by')
-        except UserActivity.DoesNotExist:
-            return Product.objects.none()
+        return Product.objects.for_tenant(self.request.tenant).select_related('company', 'category', 'created_by')
     
     def list(self, request, *args, **kwargs):
         try:
@@ -454,7 +388,7 @@ class ProductListCreateView(generics.ListCreateAPIView):
     def perform_create(self, serializer):
         user = self.request.user
         try:
-            user_activity = UserActivity.objects.get(user=user)
+            user_activity = self.request.tenant.get_activity()
             if not user_activity.current_company:
                 raise ValueError('No company activated. Please activate a company first.')
             
@@ -487,17 +421,7 @@ class ProductDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = ProductSerializer
     
     def get_queryset(self):
-        user = self.request.user
-        try:
-            user_activity = UserActivity.objects.get(user=user)
-            if not user_activity.current_company:
-                return Product.objects.none()
-            
-            return Product.objects.filter(
-                company=user_activity.current_company
-            ).select_related('company', 'category', 'created_by')
-        except UserActivity.DoesNotExist:
-            return Product.objects.none()
+        return Product.objects.for_tenant(self.request.tenant).select_related('company', 'category', 'created_by')
     
     def retrieve(self, request, *args, **kwargs):
         try:
@@ -563,20 +487,9 @@ class StockInvoiceListCreateView(generics.ListCreateAPIView):
         return StockInvoiceSerializer
     
     def get_queryset(self):
-        user = self.request.user
-        try:
-            user_activity = UserActivity.objects.get(user=user)
-            if not user_activity.current_company or not user_activity.current_financial_year:
-                return StockInvoice.objects.none()
-            
-            return StockInvoice.objects.filter(
-                company=user_activity.current_company,
-                financial_year=user_activity.current_financial_year
-            ).select_related(
-                'company', 'financial_year', 'party', 'created_by'
-            ).prefetch_related('line_items__product')
-        except UserActivity.DoesNotExist:
-            return StockInvoice.objects.none()
+        return StockInvoice.objects.for_tenant(self.request.tenant, financial_year=True).select_related(
+            'company', 'financial_year', 'party', 'created_by'
+        ).prefetch_related('line_items__product')
     
     def list(self, request, *args, **kwargs):
         try:
@@ -594,7 +507,7 @@ class StockInvoiceListCreateView(generics.ListCreateAPIView):
     def perform_create(self, serializer):
         user = self.request.user
         try:
-            user_activity = UserActivity.objects.get(user=user)
+            user_activity = self.request.tenant.get_activity()
             if not user_activity.current_company:
                 raise ValueError('No company activated. Please activate a company first.')
             if not user_activity.current_financial_year:
@@ -630,20 +543,9 @@ class StockInvoiceDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = StockInvoiceSerializer
     
     def get_queryset(self):
-        user = self.request.user
-        try:
-            user_activity = UserActivity.objects.get(user=user)
-            if not user_activity.current_company or not user_activity.current_financial_year:
-                return StockInvoice.objects.none()
-            
-            return StockInvoice.objects.filter(
-                company=user_activity.current_company,
-                financial_year=user_activity.current_financial_year
-            ).select_related(
-                'company', 'financial_year', 'party', 'created_by'
-            ).prefetch_related('line_items__product')
-        except UserActivity.DoesNotExist:
-            return StockInvoice.objects.none()
+        return StockInvoice.objects.for_tenant(self.request.tenant, financial_year=True).select_related(
+            'company', 'financial_year', 'party', 'created_by'
+        ).prefetch_related('line_items__product')
     
     def retrieve(self, request, *args, **kwargs):
         try:
@@ -695,8 +597,7 @@ def confirm_stock_invoice(request, pk):
     This endpoint is kept for backward compatibility but returns the invoice as-is.
     """
     try:
-        user = request.user
-        user_activity = UserActivity.objects.get(user=user)
+        user_activity = request.tenant.get_activity()
         
         if not user_activity.current_company or not user_activity.current_financial_year:
             return APIResponse.error(
@@ -705,11 +606,7 @@ def confirm_stock_invoice(request, pk):
             )
         
         try:
-            stock_invoice = StockInvoice.objects.get(
-                id=pk,
-                company=user_activity.current_company,
-                financial_year=user_activity.current_financial_year
-            )
+            stock_invoice = StockInvoice.objects.for_tenant(request.tenant, financial_year=True).get(id=pk)
         except StockInvoice.DoesNotExist:
             return APIResponse.error(
                 message="Stock invoice not found",
@@ -741,8 +638,7 @@ def parties_list(request):
     Get simplified parties list for dropdowns and selection.
     """
     try:
-        user = request.user
-        user_activity = UserActivity.objects.get(user=user)
+        user_activity = request.tenant.get_activity()
         
         if not user_activity.current_company:
             return APIResponse.error(
@@ -750,8 +646,7 @@ def parties_list(request):
                 status_code=status.HTTP_400_BAD_REQUEST
             )
         
-        parties = Party.objects.filter(
-            company=user_activity.current_company,
+        parties = Party.objects.for_tenant(request.tenant).filter(
             is_active=True
         ).order_by('name')
         
@@ -789,8 +684,7 @@ def products_list(request):
     Get simplified products list for dropdowns and selection.
     """
     try:
-        user = request.user
-        user_activity = UserActivity.objects.get(user=user)
+        user_activity = request.tenant.get_activity()
         
         if not user_activity.current_company:
             return APIResponse.error(
@@ -798,8 +692,7 @@ def products_list(request):
                 status_code=status.HTTP_400_BAD_REQUEST
             )
         
-        products = Product.objects.filter(
-            company=user_activity.current_company,
+        products = Product.objects.for_tenant(request.tenant).filter(
             is_active=True
         ).select_related('category').order_by('code')
         
@@ -869,8 +762,7 @@ def low_stock_products(request):
     Get products with low stock levels.
     """
     try:
-        user = request.user
-        user_activity = UserActivity.objects.get(user=user)
+        user_activity = request.tenant.get_activity()
         
         if not user_activity.current_company:
             return APIResponse.error(
@@ -879,8 +771,7 @@ def low_stock_products(request):
             )
         
         # Get products where current_stock <= minimum_stock
-        low_stock_products = Product.objects.filter(
-            company=user_activity.current_company,
+        low_stock_products = Product.objects.for_tenant(request.tenant).filter(
             is_active=True,
             current_stock__lte=F('minimum_stock')
         ).select_related('category').order_by('code')
@@ -903,7 +794,18 @@ def low_stock_products(request):
         )
 
 
+def _stock_movement_report_tags(request):
+    company_id = request.tenant.company.id
+    try:
+        product_ids = [int(request.GET['product_id'])] if request.GET.get('product_id') else None
+    except ValueError:
+        # The report answers with an error, which is not cached
+        product_ids = []
+    return Product.report_tags(company_id) + StockMovement.report_tags(company_id, product_ids)
+
+
 @api_view(['GET'])
+@ReportCache.cached('stock_movement_report', _stock_movement_report_tags)
 def stock_movement_report(request):
     """
     Generate stock movement report with optional grouping and filtering.
@@ -918,8 +820,7 @@ def stock_movement_report(request):
     - summary: true|false (return summary or detailed movements)
     """
     try:
-        user = request.user
-        user_activity = UserActivity.objects.get(user=user)
+        user_activity = request.tenant.get_activity()
         
         if not user_activity.current_company:
             return APIResponse.error(
@@ -948,7 +849,7 @@ def stock_movement_report(request):
         
         if product_id:
             try:
-                product = Product.objects.get(id=product_id, company=user_activity.current_company)
+                product = Product.objects.for_tenant(request.tenant).get(id=product_id)
                 filters['product'] = product
             except Product.DoesNotExist:
                 return APIResponse.error(
@@ -958,7 +859,7 @@ def stock_movement_report(request):
         
         if category_id:
             try:
-                category = Category.objects.get(id=category_id, company=user_activity.current_company)
+                category = Category.objects.for_tenant(request.tenant).get(id=category_id)
                 filters['category'] = category
             except Category.DoesNotExist:
                 return APIResponse.error(
@@ -968,7 +869,7 @@ def stock_movement_report(request):
         
         if hs_code_id:
             try:
-                hs_code = HSCode.objects.get(id=hs_code_id, company=user_activity.current_company)
+                hs_code = HSCode.objects.for_tenant(request.tenant).get(id=hs_code_id)
                 filters['hs_code'] = hs_code
             except HSCode.DoesNotExist:
                 return APIResponse.error(
@@ -1025,44 +926,44 @@ def stock_movement_report(request):
                     'movement_count': item['movement_count']
                 })
         else:
-            # Get detailed movements
-            movements = report_generator.get_movements(**filters)
+            # Get detailed movements, read in chunks as plain rows
+            movements = report_generator.get_movement_rows(**filters)
             result = []
             for movement in movements:
                 result.append({
-                    'id': movement.id,
-                    'movement_date': movement.movement_date.isoformat(),
-                    'movement_type': movement.movement_type,
-                    'reference_number': movement.reference_number,
+                    'id': movement['id'],
+                    'movement_date': movement['movement_date'].isoformat(),
+                    'movement_type': movement['movement_type'],
+                    'reference_number': movement['reference_number'],
                     'product': {
-                        'id': movement.product.id,
-                        'code': movement.product.code,
-                        'name': movement.product.name,
+                        'id': movement['product_id'],
+                        'code': movement['product__code'],
+                        'name': movement['product__name'],
                         'category': {
-                            'id': movement.product.category.id,
-                            'name': movement.product.category.name,
+                            'id': movement['product__category_id'],
+                            'name': movement['product__category__name'],
                             'hs_code': {
-                                'id': movement.product.category.hs_code.id,
-                                'code': movement.product.category.hs_code.code,
-                                'description': movement.product.category.hs_code.description
+                                'id': movement['product__category__hs_code_id'],
+                                'code': movement['product__category__hs_code__code'],
+                                'description': movement['product__category__hs_code__description']
                             }
                         }
                     },
-                    'quantity_in': float(movement.quantity_in),
-                    'quantity_out': float(movement.quantity_out),
-                    'balance_quantity': float(movement.balance_quantity),
-                    'unit_cost': float(movement.unit_cost),
-                    'average_cost': float(movement.average_cost),
-                    'value_in': float(movement.value_in),
-                    'value_out': float(movement.value_out),
-                    'balance_value': float(movement.balance_value),
-                    'gst_rate': float(movement.gst_rate),
-                    'gst_amount_in': float(movement.gst_amount_in),
-                    'gst_amount_out': float(movement.gst_amount_out),
+                    'quantity_in': float(movement['quantity_in']),
+                    'quantity_out': float(movement['quantity_out']),
+                    'balance_quantity': float(movement['balance_quantity']),
+                    'unit_cost': float(movement['unit_cost']),
+                    'average_cost': float(movement['average_cost']),
+                    'value_in': float(movement['value_in']),
+                    'value_out': float(movement['value_out']),
+                    'balance_value': float(movement['balance_value']),
+                    'gst_rate': float(movement['gst_rate']),
+                    'gst_amount_in': float(movement['gst_amount_in']),
+                    'gst_amount_out': float(movement['gst_amount_out']),
                     'party': {
-                        'id': movement.party.id,
-                        'name': movement.party.name
-                    } if movement.party else None
+                        'id': movement['party_id'],
+                        'name': movement['party__name']
+                    } if movement['party_id'] else None
                 })
         
         return APIResponse.success(
@@ -1088,17 +989,23 @@ def stock_movement_report(request):
         )
 
 
+def _stock_valuation_report_tags(request):
+    company_id = request.tenant.company.id
+    return Product.report_tags(company_id) + StockMovement.report_tags(company_id)
+
+
 @api_view(['GET'])
+@ReportCache.cached('stock_valuation_report', _stock_valuation_report_tags)
 def stock_valuation_report(request):
     """
     Generate current stock valuation report using average cost method.
     Query parameters:
     - group_by: product|category|hs_code (default: product)
     - include_zero_stock: true|false (include products with zero stock)
+    - as_of: value stock as at the end of this date (YYYY-MM-DD, default: current stock)
     """
     try:
-        user = request.user
-        user_activity = UserActivity.objects.get(user=user)
+        user_activity = request.tenant.get_activity()
         
         if not user_activity.current_company:
             return APIResponse.error(
@@ -1108,110 +1015,146 @@ def stock_valuation_report(request):
         
         group_by = request.GET.get('group_by', 'product')
         include_zero_stock = request.GET.get('include_zero_stock', 'false').lower() == 'true'
+        as_of = request.GET.get('as_of')
         
-        # Get latest stock movements per product
-        from django.db.models import Max, OuterRef, Subquery
+        if as_of:
+            from datetime import datetime
+            try:
+                as_of = datetime.strptime(as_of, '%Y-%m-%d').date()
+            except ValueError:
+                return APIResponse.error(
+                    message="Invalid as_of format. Use YYYY-MM-DD",
+                    status_code=status.HTTP_400_BAD_REQUEST
+                )
         
-        latest_movements = StockMovement.objects.filter(
-            company=user_activity.current_company,
-            product=OuterRef('product')
-        ).order_by('-movement_date', '-created_at')
+        from decimal import Decimal
+        from datetime import date
+        from django.db.models import Count, Min, OuterRef, Subquery, Sum, Value, DateField, DecimalField
+        from django.db.models.functions import Coalesce, Round
+        
+        # Get latest stock movement per product
+        latest_movements = StockMovement.objects.for_tenant(request.tenant).filter(
+            product=OuterRef('pk')
+        ).order_by('-movement_date', '-posting_sequence')
         
         # Get products with their latest stock information
-        products_query = Product.objects.filter(
-            company=user_activity.current_company,
+        products_query = Product.objects.for_tenant(request.tenant).filter(
             is_active=True
-        ).select_related('category', 'category__hs_code')
+        )
+        
+        # Figures a product without movements in range falls back to
+        snapshot_fallbacks = {'balance_quantity': [], 'average_cost': [], 'movement_date': []}
+        
+        if as_of:
+            # Every movement carries the running balance after it. The nearest
+            # month-end snapshot holds the balance at its date, so only the
+            # movements between it and as_of are searched for a later one
+            snapshots = StockSnapshot.objects.filter(product=OuterRef('pk'), period_end__lte=as_of).order_by('-period_end')
+            products_query = products_query.annotate(
+                snapshot_end=Coalesce(
+                    Subquery(snapshots.values('period_end')[:1]), Value(date.min), output_field=DateField()
+                )
+            )
+            latest_movements = latest_movements.filter(
+                movement_date__gt=OuterRef('snapshot_end'), movement_date__lte=as_of
+            )
+            snapshot_fallbacks = {
+                'balance_quantity': [Subquery(snapshots.values('quantity')[:1])],
+                'average_cost': [Subquery(snapshots.values('average_cost')[:1])],
+                'movement_date': [Subquery(snapshots.values('last_movement_date')[:1])],
+            }
+            stock_field = 'as_of_stock'
+            products_query = products_query.annotate(
+                as_of_stock=Coalesce(
+                    Subquery(latest_movements.values('balance_quantity')[:1]),
+                    *snapshot_fallbacks['balance_quantity'], Value(Decimal('0')),
+                    output_field=DecimalField(max_digits=15, decimal_places=3)
+                )
+            )
+            # Balances and snapshots read below must include queued recalculations
+            PendingStockRecalculation.flush(products_query)
+        else:
+            stock_field = 'current_stock'
         
         if not include_zero_stock:
-            products_query = products_query.filter(current_stock__gt=0)
+            products_query = products_query.filter(**{f'{stock_field}__gt': 0})
+        
+        if not as_of:
+            # Average costs below must include queued recalculations
+            PendingStockRecalculation.flush(products_query)
+        
+        # Products without movements are valued at cost price
+        products_query = products_query.annotate(
+            average_cost=Coalesce(
+                Subquery(latest_movements.values('average_cost')[:1]),
+                *snapshot_fallbacks['average_cost'], 'cost_price',
+                output_field=DecimalField(max_digits=15, decimal_places=4)
+            )
+        )
         
         result = []
         
         if group_by == 'product':
-            for product in products_query:
-                # Get latest movement for this product
-                latest_movement = StockMovement.objects.filter(
-                    company=user_activity.current_company,
-                    product=product
-                ).order_by('-movement_date', '-created_at').first()
-                
-                average_cost = latest_movement.average_cost if latest_movement else product.cost_price
-                stock_value = product.current_stock * average_cost
-                
-                result.append({
-                    'product_id': product.id,
-                    'product_code': product.code,
-                    'product_name': product.name,
-                    'category_name': product.category.name,
-                    'hs_code': product.category.hs_code.code,
-                    'unit_of_measure': product.unit_of_measure,
-                    'current_stock': float(product.current_stock),
-                    'average_cost': float(average_cost),
-                    'stock_value': float(stock_value),
-                    'last_movement_date': latest_movement.movement_date.isoformat() if latest_movement else None
-                })
-        
-        elif group_by == 'category':
-            from collections import defaultdict
-            category_data = defaultdict(lambda: {
-                'total_stock_value': 0,
-                'product_count': 0,
-                'category_info': None
-            })
+            products = products_query.annotate(
+                last_movement_date=Coalesce(
+                    Subquery(latest_movements.values('movement_date')[:1]),
+                    *snapshot_fallbacks['movement_date'], Value(None),
+                    output_field=DateField()
+                )
+            ).values(
+                'id', 'code', 'name', 'category__name', 'category__hs_code__code', 'unit_of_measure',
+                stock_field, 'average_cost', 'last_movement_date'
+            )
             
-            for product in products_query:
-                latest_movement = StockMovement.objects.filter(
-                    company=user_activity.current_company,
-                    product=product
-                ).order_by('-movement_date', '-created_at').first()
+            for product in products:
+                stock_value = product[stock_field] * product['average_cost']
                 
-                average_cost = latest_movement.average_cost if latest_movement else product.cost_price
-                stock_value = product.current_stock * average_cost
-                
-                category_data[product.category]['total_stock_value'] += stock_value
-                category_data[product.category]['product_count'] += 1
-                category_data[product.category]['category_info'] = product.category
-            
-            for category, data in category_data.items():
                 result.append({
-                    'category_id': category.id,
-                    'category_name': category.name,
-                    'hs_code': category.hs_code.code,
-                    'product_count': data['product_count'],
-                    'total_stock_value': float(data['total_stock_value'])
+                    'product_id': product['id'],
+                    'product_code': product['code'],
+                    'product_name': product['name'],
+                    'category_name': product['category__name'],
+                    'hs_code': product['category__hs_code__code'],
+                    'unit_of_measure': product['unit_of_measure'],
+                    'current_stock': float(product[stock_field]),
+                    'average_cost': float(product['average_cost']),
+                    'stock_value': float(stock_value),
+                    'last_movement_date': product['last_movement_date'].isoformat() if product['last_movement_date'] else None
                 })
         
-        elif group_by == 'hs_code':
-            from collections import defaultdict
-            hs_code_data = defaultdict(lambda: {
-                'total_stock_value': 0,
-                'product_count': 0,
-                'hs_code_info': None
-            })
-            
-            for product in products_query:
-                latest_movement = StockMovement.objects.filter(
-                    company=user_activity.current_company,
-                    product=product
-                ).order_by('-movement_date', '-created_at').first()
-                
-                average_cost = latest_movement.average_cost if latest_movement else product.cost_price
-                stock_value = product.current_stock * average_cost
-                
-                hs_code = product.category.hs_code
-                hs_code_data[hs_code]['total_stock_value'] += stock_value
-                hs_code_data[hs_code]['product_count'] += 1
-                hs_code_data[hs_code]['hs_code_info'] = hs_code
+        elif group_by in ('category', 'hs_code'):
+            # Each product's value is rounded to cents before it is summed, so
+            # the database adds exact amounts rather than float products
+            group_fields = {
+                'category': ['category_id', 'category__name', 'category__hs_code__code'],
+                'hs_code': ['category__hs_code_id', 'category__hs_code__code', 'category__hs_code__description'],
+            }[group_by]
+            # Groups are listed in the order of their first product by code
+            groups = products_query.order_by().values(*group_fields).annotate(
+                first_code=Min('code'),
+                product_count=Count('id'),
+                total_stock_value=Sum(
+                    Round(F(stock_field) * F('average_cost'), 2),
+                    output_field=DecimalField(max_digits=17, decimal_places=2)
+                )
+            ).order_by('first_code')
             
-            for hs_code, data in hs_code_data.items():
-                result.append({
-                    'hs_code_id': hs_code.id,
-                    'hs_code': hs_code.code,
-                    'hs_description': hs_code.description,
-                    'product_count': data['product_count'],
-                    'total_stock_value': float(data['total_stock_value'])
-                })
+            for group in groups:
+                if group_by == 'category':
+                    item = {
+                        'category_id': group['category_id'],
+                        'category_name': group['category__name'],
+                        'hs_code': group['category__hs_code__code'],
+                    }
+                else:
+                    item = {
+                        'hs_code_id': group['category__hs_code_id'],
+                        'hs_code': group['category__hs_code__code'],
+                        'hs_description': group['category__hs_code__description'],
+                    }
+                item['product_count'] = group['product_count']
+                item['total_stock_value'] = float(group['total_stock_value'])
+                result.append(item)
         
         # Calculate totals
         total_value = sum(item.get('stock_value', item.get('total_stock_value', 0)) for item in result)
@@ -1221,6 +1164,7 @@ def stock_valuation_report(request):
                 'report_type': 'stock_valuation',
                 'group_by': group_by,
                 'include_zero_stock': include_zero_stock,
+                'as_of': as_of.isoformat() if as_of else None,
                 'total_records': len(result),
                 'total_stock_value': float(total_value),
                 'items': result